@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -80,10 +81,40 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # SQLite has no row locks (select_for_update is a no-op), so atomic
+        # blocks take the write lock up front and concurrent checkouts queue
+        # on it instead of failing with "database is locked"
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # A file-backed test database honours the busy timeout across threads;
+        # kept out of the source tree in case a run is interrupted
+        'TEST': {
+            'NAME': Path(tempfile.gettempdir()) / 'crm_test_db.sqlite3',
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Per-process locmem by default; point at a shared backend (e.g.
+# django.core.cache.backends.redis.RedisCache) when running several workers
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# Seconds resolver results stay cached (crm/result_cache.py); 0 disables
+CRM_RESULT_CACHE_TIMEOUT = 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -127,7 +158,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # GraphQL Schema
 GRAPHENE = {
-    'SCHEMA': 'alx_backend_graphql_crm.schema.schema'
+    'SCHEMA': 'alx_backend_graphql_crm.schema.schema',
+    'MIDDLEWARE': ['crm.tracing.TracingMiddleware'],
 }
 
 # Cron Jobs Configuration
@@ -135,3 +167,9 @@ CRONJOBS = [
     ('*/5 * * * *', 'crm.cron.log_crm_heartbeat'),
     ('0 */12 * * *', 'crm.cron.update_low_stock'),
 ]
+
+# 'remote' posts the jobs' GraphQL operations to CRM_GRAPHQL_URL; 'local'
+# runs them in the job's process, which for mutations needs a shared
+# CRM_EVENT_BROKER and cache (see crm.checks)
+CRM_JOB_EXECUTION = 'remote'
+CRM_GRAPHQL_URL = 'http://localhost:8000/graphql'
@@ -16,10 +16,14 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
 
+from crm import views as crm_views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql", csrf_exempt(crm_views.GraphQLView.as_view(graphiql=True))),
+    path("graphql/async", crm_views.graphql_async, name="graphql-async"),
+    path("export/<str:name>", crm_views.export, name="export"),
+    path("metrics", crm_views.metrics, name="metrics"),
 ]
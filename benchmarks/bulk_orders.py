@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+bulkCreateOrders against the same orders sent as one createOrder each.
+
+Seeds a scratch SQLite database with customers and products, then creates
+--orders random orders (1-4 lines each) both ways and reports wall time,
+SQL statements and orders per second. Each run is rolled back, so both
+see the same data and stock.
+
+    python benchmarks/bulk_orders.py --orders 10000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
+
+import django
+from django.conf import settings
+
+CREATE_ORDER = """
+    mutation Create($input: OrderInput!) {
+        createOrder(input: $input) { success errors order { id } }
+    }
+"""
+
+BULK_CREATE_ORDERS = """
+    mutation Bulk($input: [OrderInput]!) {
+        bulkCreateOrders(input: $input) { success errors orders { id } }
+    }
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--customers', type=int, default=10_000)
+    parser.add_argument('--products', type=int, default=1_000)
+    parser.add_argument('--orders', type=int, default=5_000, help="Orders created by each approach")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database', default='/tmp/crm_bulk_orders_bench.sqlite3')
+    parser.add_argument('--reuse', action='store_true', help="Reuse an already seeded database")
+    return parser.parse_args()
+
+
+def setup(database):
+    settings.DATABASES['default']['NAME'] = database
+    # Query logging would grow with every statement
+    settings.DEBUG = False
+    django.setup()
+
+
+def execute(query, variables):
+    from django.test import RequestFactory
+    from alx_backend_graphql_crm.schema import schema
+
+    request = RequestFactory().post('/graphql')
+    result = schema.execute(query, variables=variables, context_value=request)
+    if result.errors:
+        raise RuntimeError(result.errors)
+    return result.data
+
+
+def order_inputs(count, seed):
+    from crm.models import Customer, Product
+
+    rng = random.Random(seed)
+    customer_ids = list(Customer.objects.values_list('pk', flat=True))
+    product_ids = list(Product.objects.values_list('pk', flat=True))
+    return [
+        {
+            'customerId': rng.choice(customer_ids),
+            'items': [
+                {'productId': product_id, 'quantity': rng.randint(1, 3)}
+                for product_id in rng.sample(product_ids, rng.randint(1, 4))
+            ],
+        }
+        for _ in range(count)
+    ]
+
+
+def one_by_one(inputs):
+    created = 0
+    for order in inputs:
+        created += bool(execute(CREATE_ORDER, {'input': order})['createOrder']['success'])
+    return created
+
+
+def bulk(inputs):
+    return len(execute(BULK_CREATE_ORDERS, {'input': inputs})['bulkCreateOrders']['orders'])
+
+
+def measure(func, inputs):
+    from django.db import connection, transaction
+
+    statements = 0
+
+    def count(execute, sql, params, many, context):
+        nonlocal statements
+        statements += not sql.startswith(('SAVEPOINT', 'RELEASE'))
+        return execute(sql, params, many, context)
+
+    # Counted with a wrapper: the query log keeps only the last 9000 statements
+    with transaction.atomic(), connection.execute_wrapper(count):
+        started = time.perf_counter()
+        created = func(inputs)
+        elapsed = time.perf_counter() - started
+        transaction.set_rollback(True)
+    return created, statements, elapsed
+
+
+def main():
+    args = parse_args()
+    if not args.reuse and os.path.exists(args.database):
+        os.remove(args.database)
+    setup(args.database)
+
+    from django.core.management import call_command
+    from crm.models import Product
+
+    if not args.reuse:
+        print(f"Seeding {args.customers} customers and {args.products} products...")
+        call_command('migrate', verbosity=0)
+        call_command('generate_data', customers=args.customers, products=args.products, orders=0,
+                     seed=args.seed, verbosity=0)
+        # Enough stock that no order is refused
+        Product.objects.update(stock=1_000_000)
+
+    inputs = order_inputs(args.orders, args.seed)
+
+    print(f"\n{'approach':<24}{'orders':>8}{'statements':>12}{'time (s)':>10}{'orders/s':>10}")
+    for label, func in (("createOrder x N", one_by_one), ("bulkCreateOrders", bulk)):
+        created, statements, elapsed = measure(func, inputs)
+        print(f"{label:<24}{created:>8}{statements:>12}{elapsed:>10.2f}{created / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
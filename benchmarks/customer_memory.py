@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+Peak memory of reading customers through allCustomers and the export.
+
+Builds a scratch SQLite database with a large customer table, then measures
+the Python heap high-water mark (tracemalloc) of: the old unbounded list,
+one allCustomers page, walking every allCustomers page, and streaming the
+full NDJSON export. Bounded reads should stay flat as --customers grows.
+
+    python benchmarks/customer_memory.py --customers 1000000
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
+
+import django
+from django.conf import settings
+
+PAGE_QUERY = """
+    query Page($after: String) {
+        allCustomers(first: 100, after: $after) {
+            edges { node { id name email phone } }
+            pageInfo { hasNextPage endCursor }
+        }
+    }
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--customers', type=int, default=1_000_000)
+    parser.add_argument('--database', default='/tmp/crm_customer_bench.sqlite3')
+    parser.add_argument('--reuse', action='store_true', help="Reuse an already seeded database")
+    parser.add_argument('--skip-list', action='store_true',
+                        help="Skip the unbounded list, which needs memory proportional to the table")
+    parser.add_argument('--max-pages', type=int, default=None,
+                        help="Stop walking allCustomers after this many pages")
+    return parser.parse_args()
+
+
+def setup(database):
+    settings.DATABASES['default']['NAME'] = database
+    # Query logging would grow with every statement
+    settings.DEBUG = False
+    django.setup()
+
+
+def execute(query, variables=None):
+    from django.test import RequestFactory
+    from alx_backend_graphql_crm.schema import schema
+
+    request = RequestFactory().post('/graphql')
+    result = schema.execute(query, variables=variables, context_value=request)
+    if result.errors:
+        raise RuntimeError(result.errors)
+    return result.data
+
+
+def unbounded_list():
+    """What the old graphene.List resolver did: materialize every customer"""
+    from crm.models import Customer
+    return len(list(Customer.objects.all()))
+
+
+def first_page():
+    return len(execute(PAGE_QUERY)['allCustomers']['edges'])
+
+
+def walk_pages(max_pages):
+    rows, after, pages = 0, None, 0
+    while max_pages is None or pages < max_pages:
+        connection = execute(PAGE_QUERY, {'after': after})['allCustomers']
+        rows += len(connection['edges'])
+        pages += 1
+        if not connection['pageInfo']['hasNextPage']:
+            break
+        after = connection['pageInfo']['endCursor']
+    return rows
+
+
+def stream_export():
+    from crm.export import export_lines
+    written = 0
+    with open(os.devnull, 'w') as devnull:
+        for line in export_lines('customers'):
+            devnull.write(line)
+            written += 1
+    return written
+
+
+def measure(func, *args):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    rows = func(*args)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rows, peak, elapsed
+
+
+def main():
+    args = parse_args()
+    if not args.reuse and os.path.exists(args.database):
+        os.remove(args.database)
+    setup(args.database)
+
+    from django.core.management import call_command
+
+    if not args.reuse:
+        print(f"Seeding {args.customers} customers...")
+        started = time.perf_counter()
+        call_command('migrate', verbosity=0)
+        call_command('generate_data', customers=args.customers, products=0, orders=0)
+        print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+    cases = [
+        ("allCustomers first page", first_page),
+        ("allCustomers every page", lambda: walk_pages(args.max_pages)),
+        ("NDJSON export", stream_export),
+    ]
+    if not args.skip_list:
+        cases.insert(0, ("unbounded list (old)", unbounded_list))
+
+    print(f"\n{'read':<28}{'rows':>10}{'peak (MB)':>12}{'time (s)':>10}")
+    for label, func in cases:
+        rows, peak, elapsed = measure(func)
+        print(f"{label:<28}{rows:>10}{peak / 2**20:>12.1f}{elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
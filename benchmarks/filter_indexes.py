@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Filter latency benchmark for the indexes added in crm/migrations/0003.
+
+Builds a scratch SQLite database with a large order volume, times every
+filter exposed in crm/filters.py with the indexes in place, then drops the
+indexes and times the same queries again.
+
+    python benchmarks/filter_indexes.py --orders 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
+
+import django
+from django.conf import settings
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=1_000_000)
+    parser.add_argument('--customers', type=int, default=100_000)
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--database', default='/tmp/crm_filter_bench.sqlite3')
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per query; the best is reported")
+    parser.add_argument('--reuse', action='store_true', help="Reuse an already seeded database")
+    return parser.parse_args()
+
+
+def setup(database):
+    settings.DATABASES['default']['NAME'] = database
+    django.setup()
+
+
+def benchmark_queries():
+    """(label, FilterSet class, filter data) for each filter in crm/filters.py"""
+    from django.utils import timezone
+    from crm.filters import CustomerFilter, ProductFilter, OrderFilter
+
+    month_ago = (timezone.now() - timedelta(days=30)).isoformat()
+    return [
+        ("customers ordered by name", CustomerFilter, {}),
+        ("customers created_at__gte", CustomerFilter, {'created_at__gte': month_ago}),
+        ("customers phone_pattern", CustomerFilter, {'phone_pattern': '+1555'}),
+        ("products ordered by name", ProductFilter, {}),
+        ("products price range", ProductFilter, {'price__gte': 100, 'price__lte': 120}),
+        ("products stock exact", ProductFilter, {'stock': 5}),
+        ("products low_stock", ProductFilter, {'low_stock': True}),
+        ("orders ordered by -order_date", OrderFilter, {}),
+        ("orders order_date__gte", OrderFilter, {'order_date__gte': month_ago}),
+        ("orders total_amount range", OrderFilter, {'total_amount__gte': 500, 'total_amount__lte': 510}),
+        ("orders product_id", OrderFilter, {'product_id': 1}),
+    ]
+
+
+def time_query(filterset_class, data, repeat):
+    """Best wall time of COUNT + first page, the work a connection page does"""
+    model = filterset_class._meta.model
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        qs = filterset_class(data=data, queryset=model.objects.all()).qs
+        qs.count()
+        list(qs[:50])
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(repeat):
+    return {
+        label: time_query(filterset_class, data, repeat)
+        for label, filterset_class, data in benchmark_queries()
+    }
+
+
+def filter_indexes():
+    from crm.models import Customer, Product, Order
+    return [(model, index) for model in (Customer, Product, Order) for index in model._meta.indexes]
+
+
+def main():
+    args = parse_args()
+    if not args.reuse and os.path.exists(args.database):
+        os.remove(args.database)
+    setup(args.database)
+
+    from django.core.management import call_command
+    from django.db import connection
+
+    if not args.reuse:
+        print(f"Seeding {args.customers} customers, {args.products} products, {args.orders} orders...")
+        started = time.perf_counter()
+        call_command('migrate', verbosity=0)
+        call_command('generate_data', customers=args.customers, products=args.products, orders=args.orders)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+    with_indexes = run(args.repeat)
+
+    with connection.schema_editor() as editor:
+        for model, index in filter_indexes():
+            editor.remove_index(model, index)
+    without_indexes = run(args.repeat)
+
+    with connection.schema_editor() as editor:
+        for model, index in filter_indexes():
+            editor.add_index(model, index)
+
+    print(f"\n{'query':<36}{'no index (ms)':>16}{'indexed (ms)':>16}{'speedup':>10}")
+    for label, indexed in with_indexes.items():
+        before = without_indexes[label]
+        print(f"{label:<36}{before * 1000:>16.2f}{indexed * 1000:>16.2f}{before / indexed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
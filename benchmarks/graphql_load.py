@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Latency of the GraphQL API under concurrent load.
+
+Keeps --concurrency requests in flight against --url until --requests have
+completed and reports throughput and p50/p90/p99 latency. Compare the
+synchronous view under a WSGI server with the async view under an ASGI
+server, with the same number of worker processes:
+
+    gunicorn -w 2 --threads 4 alx_backend_graphql_crm.wsgi
+    python benchmarks/graphql_load.py --url http://127.0.0.1:8000/graphql
+
+    uvicorn --workers 2 alx_backend_graphql_crm.asgi:application
+    python benchmarks/graphql_load.py --url http://127.0.0.1:8000/graphql/async
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+QUERY = """
+    query Load($first: Int) {
+        hello
+        allProducts(first: $first) { edges { node { id name price stock } } }
+        allOrders(first: $first) {
+            edges { node { id totalAmount customer { name } items { quantity product { name } } } }
+        }
+    }
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000/graphql')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--first', type=int, default=10, help="Page size of the connections queried")
+    parser.add_argument('--timeout', type=float, default=60)
+    return parser.parse_args()
+
+
+async def post(url, body, timeout):
+    """One HTTP/1.1 request on a fresh connection; returns the status code"""
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    try:
+        writer.write(
+            f"POST {parts.path or '/'} HTTP/1.1\r\n"
+            f"Host: {parts.netloc}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    status_line = response.split(b'\r\n', 1)[0]
+    return int(status_line.split()[1]) if status_line else 0
+
+
+async def worker(queue, url, body, timeout, latencies, failures):
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        started = time.perf_counter()
+        try:
+            status = await post(url, body, timeout)
+        except (OSError, asyncio.TimeoutError):
+            status = 0
+        if status == 200:
+            latencies.append(time.perf_counter() - started)
+        else:
+            failures.append(status)
+
+
+async def run(args):
+    body = json.dumps({'query': QUERY, 'variables': {'first': args.first}}).encode()
+    queue = asyncio.Queue()
+    for _ in range(args.requests):
+        queue.put_nowait(None)
+    latencies, failures = [], []
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        worker(queue, args.url, body, args.timeout, latencies, failures)
+        for _ in range(args.concurrency)
+    ))
+    return latencies, failures, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    args = parse_args()
+    latencies, failures, elapsed = asyncio.run(run(args))
+    print(f"{args.url}: {args.requests} requests, concurrency {args.concurrency}")
+    print(f"  throughput {len(latencies) / elapsed:8.1f} req/s, {len(failures)} failed")
+    if latencies:
+        latencies.sort()
+        print(f"  mean {statistics.mean(latencies) * 1000:8.1f} ms")
+        for label, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+            print(f"  {label}  {percentile(latencies, fraction) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
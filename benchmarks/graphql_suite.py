@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+"""
+Benchmark suite for the GraphQL API at production-like volumes.
+
+Seeds a scratch SQLite database (100k customers, 10k products, 1M orders by
+default), then sends representative operations through GraphQLView and
+records, per operation, the wall time of --repeat runs, the number of SQL
+statements and the peak Python heap (tracemalloc, in a separate run so it
+doesn't skew the timings). Mutations run inside a transaction that is
+rolled back, so every run sees the same data, and the result cache is
+cleared before each run so reads measure the database path.
+
+    python benchmarks/graphql_suite.py --output results.json
+    python benchmarks/graphql_suite.py --reuse --compare benchmarks/baseline.json
+
+--compare exits non-zero when an operation issues more statements than the
+baseline, or its median time or peak memory grew beyond the tolerances.
+Statement counts are deterministic; times are only comparable between
+baselines recorded on the same machine.
+"""
+
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
+
+import django
+from django.conf import settings
+
+ALL_ORDERS = """
+    query Orders {
+        allOrders(first: 50) {
+            edges { node {
+                id totalAmount orderDate
+                customer { name email }
+                products(first: 10) { edges { node { name price } } }
+            } }
+        }
+    }
+"""
+
+LOW_STOCK_PRODUCTS = """
+    query LowStock {
+        allProducts(first: 50, lowStock: true) {
+            totalCount
+            edges { node { name stock } }
+        }
+    }
+"""
+
+CREATE_ORDER = """
+    mutation Create($input: OrderInput!) {
+        createOrder(input: $input) { success errors order { id totalAmount } }
+    }
+"""
+
+BULK_CREATE_CUSTOMERS = """
+    mutation Bulk($input: [CustomerInput]!) {
+        bulkCreateCustomers(input: $input) { success errors customers { id } }
+    }
+"""
+
+UPDATE_LOW_STOCK = """
+    mutation Restock {
+        updateLowStockProducts { success updatedProducts { name stock } }
+    }
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--customers', type=int, default=100_000)
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--orders', type=int, default=1_000_000)
+    parser.add_argument('--bulk-customers', type=int, default=10_000,
+                        help="Customers per bulkCreateCustomers call")
+    parser.add_argument('--database', default='/tmp/crm_suite_bench.sqlite3')
+    parser.add_argument('--reuse', action='store_true', help="Reuse an already seeded database")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per operation")
+    parser.add_argument('--only', nargs='*', help="Run only these operations")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--compare', help="Baseline JSON to compare the results with")
+    parser.add_argument('--time-tolerance', type=float, default=0.5,
+                        help="Allowed relative growth of the median time")
+    parser.add_argument('--memory-tolerance', type=float, default=0.25,
+                        help="Allowed relative growth of the peak memory")
+    return parser.parse_args()
+
+
+def setup(database):
+    settings.DATABASES['default']['NAME'] = database
+    # Query logging would grow with every statement
+    settings.DEBUG = False
+    django.setup()
+
+
+class Operation:
+    """One GraphQL request, built afresh for every run"""
+
+    def __init__(self, name, query, variables=None, mutation=False):
+        self.name = name
+        self.query = query
+        self.variables = variables or (lambda: {})
+        self.mutation = mutation
+
+    def run(self):
+        from django.core.cache import cache
+        from django.db import transaction
+        from django.test import RequestFactory
+        from crm.views import GraphQLView
+
+        cache.clear()
+        request = RequestFactory().post(
+            '/graphql', data=json.dumps({'query': self.query, 'variables': self.variables()}),
+            content_type='application/json',
+        )
+        with transaction.atomic():
+            response = GraphQLView.as_view()(request)
+            transaction.set_rollback(True)
+        result = json.loads(response.content)
+        if response.status_code != 200 or result.get('errors'):
+            raise RuntimeError(f"{self.name} failed: {result}")
+        return result
+
+
+def operations(bulk_customers):
+    from crm.models import Customer, Product
+
+    rng = random.Random(7)
+    customer_ids = list(Customer.objects.values_list('pk', flat=True)[:10_000])
+    product_ids = list(Product.objects.filter(stock__gte=50).values_list('pk', flat=True)[:1_000])
+    batches = itertools.count()
+
+    def order_input():
+        return {'input': {
+            'customerId': rng.choice(customer_ids),
+            'items': [{'productId': pk, 'quantity': 1} for pk in rng.sample(product_ids, 3)],
+        }}
+
+    def customers_input():
+        batch = next(batches)
+        return {'input': [
+            {'name': f"Bench {batch}-{i}", 'email': f"bench{batch}-{i}@example.com"}
+            for i in range(bulk_customers)
+        ]}
+
+    return [
+        Operation('allOrders nested', ALL_ORDERS),
+        Operation('allProducts lowStock', LOW_STOCK_PRODUCTS),
+        Operation('createOrder', CREATE_ORDER, order_input, mutation=True),
+        Operation(f'bulkCreateCustomers {bulk_customers}', BULK_CREATE_CUSTOMERS, customers_input,
+                  mutation=True),
+        Operation('updateLowStockProducts', UPDATE_LOW_STOCK, mutation=True),
+    ]
+
+
+def measure(operation, repeat):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    # Warm the document cache and the database's page cache
+    operation.run()
+
+    times = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            operation.run()
+            times.append(time.perf_counter() - started)
+
+    gc.collect()
+    tracemalloc.start()
+    operation.run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'wall_ms': {
+            'min': round(min(times) * 1000, 2),
+            'median': round(statistics.median(times) * 1000, 2),
+            'max': round(max(times) * 1000, 2),
+        },
+        # SAVEPOINT/ROLLBACK of the benchmark's own transaction excluded
+        'queries': sum(
+            1 for query in ctx.captured_queries
+            if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK'))
+        ),
+        'peak_memory_kib': peak // 1024,
+    }
+
+
+def environment():
+    from django.db import connection
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': f"{connection.vendor} {connection.Database.sqlite_version}"
+        if connection.vendor == 'sqlite' else connection.vendor,
+        'machine': platform.machine(),
+    }
+
+
+def compare(baseline, results, time_tolerance, memory_tolerance):
+    """Print each operation against the baseline; return the regressions"""
+    regressions = []
+    print(f"\n{'operation':<32}{'median ms':>20}{'queries':>14}{'peak KiB':>20}")
+    for name, current in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f"{name:<32}{'(not in baseline)':>20}")
+            continue
+        median, base_median = current['wall_ms']['median'], base['wall_ms']['median']
+        queries, base_queries = current['queries'], base['queries']
+        peak, base_peak = current['peak_memory_kib'], base['peak_memory_kib']
+        print(f"{name:<32}{f'{base_median} -> {median}':>20}"
+              f"{f'{base_queries} -> {queries}':>14}{f'{base_peak} -> {peak}':>20}")
+        if queries > base_queries:
+            regressions.append(f"{name}: {queries} statements, baseline {base_queries}")
+        if median > base_median * (1 + time_tolerance):
+            regressions.append(f"{name}: median {median} ms, baseline {base_median} ms")
+        if peak > base_peak * (1 + memory_tolerance):
+            regressions.append(f"{name}: peak {peak} KiB, baseline {base_peak} KiB")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    if not args.reuse and os.path.exists(args.database):
+        os.remove(args.database)
+    setup(args.database)
+
+    from django.core.management import call_command
+    from django.db import connection
+
+    if not args.reuse:
+        print(f"Seeding {args.customers} customers, {args.products} products, {args.orders} orders...")
+        started = time.perf_counter()
+        call_command('migrate', verbosity=0)
+        call_command('generate_data', customers=args.customers, products=args.products, orders=args.orders)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+    results = {}
+    print(f"\n{'operation':<32}{'median ms':>12}{'min ms':>10}{'queries':>10}{'peak KiB':>12}")
+    for operation in operations(args.bulk_customers):
+        if args.only and operation.name not in args.only:
+            continue
+        result = results[operation.name] = measure(operation, args.repeat)
+        print(f"{operation.name:<32}{result['wall_ms']['median']:>12}{result['wall_ms']['min']:>10}"
+              f"{result['queries']:>10}{result['peak_memory_kib']:>12}")
+
+    report = {
+        'environment': environment(),
+        'dataset': {'customers': args.customers, 'products': args.products, 'orders': args.orders},
+        'repeat': args.repeat,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['dataset'] != report['dataset']:
+            print(f"\nWarning: baseline dataset {baseline['dataset']} differs from {report['dataset']}")
+        regressions = compare(baseline, results, args.time_tolerance, args.memory_tolerance)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class CrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'crm'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import checks, signals  # noqa: F401
+        from .tracing import install_sql_wrapper
+
+        connection_created.connect(install_sql_wrapper, dispatch_uid='crm.tracing')
@@ -0,0 +1,48 @@
+"""
+Executing the schema on the event loop.
+
+The async GraphQL view executes with ``crm_async`` set on the request and
+the middleware below. Resolvers marked with ``async_resolver`` are called
+on the event loop and, when ``is_async(info)``, return awaitables (Django's
+async ORM and cache API, ``BatchLoader.aload``) so independent fields
+resolve concurrently. Plain attribute resolvers run inline too. Every other
+resolver may touch the ORM synchronously and runs through ``sync_to_async``
+on the request's thread, which also keeps the per-request loaders
+single-threaded.
+"""
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from graphene.relay.node import GlobalID
+from graphene.types.resolver import dict_or_attr_resolver
+from graphene.types.schema import identity_resolve
+
+# Resolvers that only read attributes of objects already loaded, or pass
+# through a subscription's event
+INLINE_RESOLVERS = {dict_or_attr_resolver, GlobalID.id_resolver, identity_resolve}
+
+
+def async_resolver(resolver):
+    """Mark a resolver as safe to call on the event loop"""
+    resolver.crm_async = True
+    return resolver
+
+
+def is_async(info):
+    """Whether the field is being resolved by the async view"""
+    return getattr(info.context, 'crm_async', False)
+
+
+def runs_inline(resolver):
+    if isinstance(resolver, partial):
+        resolver = resolver.func
+    return resolver in INLINE_RESOLVERS or getattr(resolver, 'crm_async', False)
+
+
+class SyncResolverMiddleware:
+    """Run resolvers that may block off the event loop"""
+
+    def resolve(self, next, root, info, **args):
+        if runs_inline(info.parent_type.fields[info.field_name].resolve):
+            return next(root, info, **args)
+        return sync_to_async(next)(root, info, **args)
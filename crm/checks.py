@@ -0,0 +1,45 @@
+"""
+System checks (``manage.py check --deploy``).
+
+Background jobs (``manage.py run_jobs``) and cron jobs run in local mode
+write from outside the web processes. Their stock events and result cache
+invalidations only reach the web processes
+through a shared event broker (``CRM_EVENT_BROKER``) and a shared cache
+(``CACHES``). With the in-process defaults, subscribers miss those events
+and cached reads stay stale until their TTL expires.
+"""
+from django.core import checks
+
+from . import events, result_cache
+
+
+def cross_process_problems():
+    """
+    Why writes made in another process wouldn't reach the web processes, by
+    check id; empty when they would.
+    """
+    problems = {}
+    if events.is_process_local():
+        problems['crm.W001'] = (
+            "CRM_EVENT_BROKER is the in-process broker, so subscribers elsewhere miss the events"
+        )
+    if result_cache.is_process_local():
+        problems['crm.W002'] = (
+            "the result cache is process-local (locmem), so other processes keep stale results"
+        )
+    return problems
+
+
+@checks.register(deploy=True)
+def check_shared_infrastructure(app_configs, **kwargs):
+    from . import cron
+
+    writers = "Background jobs and local cron jobs" if cron.JOB_EXECUTION == 'local' else "Background jobs"
+    return [
+        checks.Warning(
+            f"{writers} write outside the web processes, but {problem}.",
+            hint="Configure a shared CRM_EVENT_BROKER and cache backend (e.g. Redis).",
+            id=check_id,
+        )
+        for check_id, problem in cross_process_problems().items()
+    ]
@@ -0,0 +1,101 @@
+"""
+Chunked deletion of inactive customers (``manage.py clean_inactive_customers``).
+
+A customer is inactive when no order of theirs is dated on or after the
+cutoff. That is a NOT EXISTS subquery served by the (customer, -order_date)
+index, so candidates are found a chunk at a time in primary key order
+without an anti-join over every order.
+
+Each chunk is deleted in its own short transaction, bottom-up (reminders,
+order lines, orders, customers), with one DELETE per table. Model.delete()
+would instead load every related row to send post_delete signals; those
+receivers only maintain order totals and the result cache. Totals are moot
+for deleted orders, and the cache is invalidated once per chunk here.
+Customers are re-checked, and locked where the database supports it, inside
+the transaction, so one who orders mid-run is kept.
+"""
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import result_cache
+from .models import Customer, Order, OrderItem, OrderReminder
+
+# Customers without an order this recent are inactive
+INACTIVE_AFTER = timedelta(days=365)
+# Customers deleted per transaction
+CLEANUP_CHUNK_SIZE = 500
+
+
+def inactive_customers(cutoff):
+    recent_orders = Order.objects.filter(customer=OuterRef('pk'), order_date__gte=cutoff)
+    return Customer.objects.filter(~Exists(recent_orders))
+
+
+def delete_customers(customer_ids):
+    """Delete the given customers and everything hanging off them; rows deleted per table"""
+    deleted = Counter()
+    if not customer_ids:
+        return deleted
+
+    qn = connection.ops.quote_name
+    customers = ", ".join(["%s"] * len(customer_ids))
+    orders = (
+        f"SELECT {qn(Order._meta.pk.column)} FROM {qn(Order._meta.db_table)} "
+        f"WHERE {qn(Order.customer.field.column)} IN ({customers})"
+    )
+    # Deletion order follows the foreign keys. Plain DELETEs: Model.delete()
+    # would collect every row and send signals.
+    tables = (
+        ('order_reminders', OrderReminder, OrderReminder.order.field.column, orders),
+        ('order_items', OrderItem, OrderItem.order.field.column, orders),
+        ('orders', Order, Order.customer.field.column, customers),
+        ('customers', Customer, Customer._meta.pk.column, customers),
+    )
+    with connection.cursor() as cursor:
+        for label, model, column, values in tables:
+            cursor.execute(
+                f"DELETE FROM {qn(model._meta.db_table)} WHERE {qn(column)} IN ({values})",
+                list(customer_ids),
+            )
+            deleted[label] = cursor.rowcount
+    result_cache.invalidate(Customer, Order, OrderItem)
+    return deleted
+
+
+def clean_inactive_customers(cutoff=None, chunk_size=CLEANUP_CHUNK_SIZE, pause=0.0, dry_run=False,
+                             progress=None):
+    """
+    Delete customers inactive since ``cutoff``, sleeping ``pause`` seconds
+    between chunks. Returns rows deleted per table; with ``dry_run``, the
+    customers and orders that would be.
+    """
+    cutoff = cutoff or timezone.now() - INACTIVE_AFTER
+    inactive = inactive_customers(cutoff)
+    if dry_run:
+        return Counter(
+            customers=inactive.count(),
+            orders=Order.objects.filter(customer__in=inactive.values('pk')).count(),
+        )
+
+    deleted = Counter()
+    last_pk = 0
+    while True:
+        ids = list(inactive.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            break
+        last_pk = ids[-1]
+        with transaction.atomic():
+            still_inactive = list(
+                inactive.filter(pk__in=ids).select_for_update().values_list('pk', flat=True)
+            )
+            deleted.update(delete_customers(still_inactive))
+        if progress:
+            progress(deleted)
+        if pause:
+            time.sleep(pause)
+    return deleted
@@ -0,0 +1,144 @@
+"""
+Static query cost analysis.
+
+Every object a query can return costs 1 plus the cost of what is selected on
+it. Connections return as many objects as their page size (``first``/
+``last``, or the field's maximum page size when omitted or passed as a
+variable); plain lists of objects are assumed to hold ``LIST_SIZE``. ``edges``, ``node`` and ``pageInfo``
+are structure, not data, and count towards neither cost nor depth.
+
+QueryCostRule rejects operations over ``CRM_MAX_QUERY_DEPTH`` or
+``CRM_MAX_QUERY_COST`` during validation, before anything executes.
+"""
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode, FragmentDefinitionNode, FragmentSpreadNode, GraphQLError, GraphQLList,
+    InlineFragmentNode, IntValueNode, OperationDefinitionNode, ValidationRule,
+    get_named_type, get_nullable_type, is_composite_type,
+)
+
+MAX_QUERY_DEPTH = getattr(settings, 'CRM_MAX_QUERY_DEPTH', 10)
+# A full page of orders with two nested connections costs ~20k; one more
+# level of nesting is ~1M
+MAX_QUERY_COST = getattr(settings, 'CRM_MAX_QUERY_COST', 50000)
+
+# Assumed length of non-paginated object lists such as Order.items
+LIST_SIZE = 10
+
+STRUCTURAL_FIELDS = {'edges', 'node', 'pageInfo'}
+
+
+def is_connection(graphql_type):
+    named = get_named_type(graphql_type)
+    return hasattr(named, 'fields') and 'edges' in named.fields and 'pageInfo' in named.fields
+
+
+def page_size(field_node):
+    """Literal ``first``/``last``, otherwise the largest page the field can return"""
+    for argument in field_node.arguments:
+        if argument.name.value in ('first', 'last') and isinstance(argument.value, IntValueNode):
+            return int(argument.value.value)
+    return graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+
+
+class CostAnalysis:
+    def __init__(self, schema, fragments):
+        self.schema = schema
+        self.fragments = fragments
+
+    def selection_set(self, parent_type, selection_set, visiting=frozenset()):
+        """``(cost, depth)`` of a selection set on ``parent_type``"""
+        cost = depth = 0
+        if selection_set is None:
+            return cost, depth
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                field_cost, field_depth = self.field(parent_type, selection, visiting)
+            elif isinstance(selection, InlineFragmentNode):
+                type_condition = selection.type_condition
+                fragment_type = (
+                    self.schema.get_type(type_condition.name.value) if type_condition else parent_type
+                )
+                field_cost, field_depth = self.selection_set(
+                    fragment_type or parent_type, selection.selection_set, visiting
+                )
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = self.fragments.get(name)
+                if fragment is None or name in visiting:
+                    continue
+                fragment_type = self.schema.get_type(fragment.type_condition.name.value)
+                field_cost, field_depth = self.selection_set(
+                    fragment_type or parent_type, fragment.selection_set, visiting | {name}
+                )
+            else:
+                continue
+            cost += field_cost
+            depth = max(depth, field_depth)
+        return cost, depth
+
+    def field(self, parent_type, field_node, visiting):
+        name = field_node.name.value
+        fields = getattr(parent_type, 'fields', {})
+        if name.startswith('__') or name not in fields:
+            # Introspection, or unknown fields which FieldsOnCorrectTypeRule reports
+            return 0, 0
+
+        field_type = fields[name].type
+        named_type = get_named_type(field_type)
+        if not is_composite_type(named_type):
+            return 0, 0
+
+        child_cost, child_depth = self.selection_set(named_type, field_node.selection_set, visiting)
+        if name in STRUCTURAL_FIELDS:
+            return child_cost, child_depth
+        if is_connection(field_type):
+            multiplier = page_size(field_node)
+        elif isinstance(get_nullable_type(field_type), GraphQLList):
+            multiplier = LIST_SIZE
+        else:
+            multiplier = 1
+        return multiplier * (1 + child_cost), 1 + child_depth
+
+    def operation(self, operation):
+        root_type = self.schema.get_root_type(operation.operation)
+        return self.selection_set(root_type, operation.selection_set)
+
+
+def document_fragments(document):
+    return {
+        definition.name.value: definition
+        for definition in document.definitions if isinstance(definition, FragmentDefinitionNode)
+    }
+
+
+def operation_costs(schema, document):
+    """``{operation name: (cost, depth)}`` for every operation in ``document``"""
+    analysis = CostAnalysis(schema, document_fragments(document))
+    return {
+        definition.name.value if definition.name else None: analysis.operation(definition)
+        for definition in document.definitions if isinstance(definition, OperationDefinitionNode)
+    }
+
+
+class QueryCostRule(ValidationRule):
+    """Reject operations whose estimated cost or depth is over budget"""
+
+    max_depth = MAX_QUERY_DEPTH
+    max_cost = MAX_QUERY_COST
+
+    def enter_operation_definition(self, node, *_args):
+        context = self.context
+        cost, depth = CostAnalysis(context.schema, document_fragments(context.document)).operation(node)
+        name = f"'{node.name.value}'" if node.name else "Query"
+        if depth > self.max_depth:
+            self.report_error(GraphQLError(
+                f"{name} has depth {depth}, over the limit of {self.max_depth}", node,
+                extensions={'code': 'QUERY_TOO_DEEP', 'depth': depth, 'maxDepth': self.max_depth},
+            ))
+        if cost > self.max_cost:
+            self.report_error(GraphQLError(
+                f"{name} has estimated cost {cost}, over the limit of {self.max_cost}", node,
+                extensions={'code': 'QUERY_TOO_COSTLY', 'cost': cost, 'maxCost': self.max_cost},
+            ))
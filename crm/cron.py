@@ -1,53 +1,137 @@
+"""
+Scheduled jobs (``CRONJOBS`` in settings, run by django-crontab).
+
+Jobs run their GraphQL operations through ``execute()``. By default
+(``CRM_JOB_EXECUTION = 'remote'``) they are posted to ``CRM_GRAPHQL_URL``,
+over one gql session per process whose HTTP connections are reused from run
+to run. ``'local'`` runs them against the schema in the job's own process,
+skipping the web server and the HTTP round trip. Mutations only run locally
+when the event broker and result cache are shared between processes (see
+crm.checks): otherwise the web processes would never hear of their writes.
+Each run logs how it executed and how long it took.
+"""
+import time
 from datetime import datetime
-import requests
-import json
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from graphene_django.settings import graphene_settings
+from graphql import OperationDefinitionNode, OperationType, parse
+
+from . import checks
+
+JOB_EXECUTION = getattr(settings, 'CRM_JOB_EXECUTION', 'remote')
+GRAPHQL_URL = getattr(settings, 'CRM_GRAPHQL_URL', 'http://localhost:8000/graphql')
+
+HEARTBEAT_LOG = '/tmp/crm_heartbeat_log.txt'
+LOW_STOCK_LOG = '/tmp/low_stock_updates_log.txt'
+
+LOW_STOCK_MUTATION = """
+    mutation {
+        updateLowStockProducts {
+            success
+            message
+            updatedProducts {
+                id
+                name
+                stock
+            }
+        }
+    }
+"""
+
+
+class JobError(Exception):
+    """Raised when an in-process operation returns errors"""
+
+
+class JobContext:
+    """``info.context`` of operations run in-process"""
+
+    def __init__(self):
+        self.crm_loaders = None
+
+
+@lru_cache(maxsize=None)
+def get_session(url):
+    """A connected gql session for ``url``, shared by every run in this process"""
+    # Only remote execution needs gql's HTTP transport
+    from gql import Client
+    from gql.transport.requests import RequestsHTTPTransport
+
+    client = Client(transport=RequestsHTTPTransport(url=url), fetch_schema_from_transport=False)
+    return client.connect_sync()
+
+
+def is_mutation(query):
+    return any(
+        isinstance(definition, OperationDefinitionNode) and definition.operation == OperationType.MUTATION
+        for definition in parse(query).definitions
+    )
+
+
+def execute(query, variables=None, mode=None):
+    """Run a GraphQL operation the way jobs are configured to; returns its data"""
+    mode = mode or JOB_EXECUTION
+    if mode == 'local':
+        problems = checks.cross_process_problems()
+        if problems and is_mutation(query):
+            raise ImproperlyConfigured(
+                "Mutations can't run with CRM_JOB_EXECUTION = 'local' because "
+                + "; ".join(problems.values())
+            )
+        result = graphene_settings.SCHEMA.execute(
+            query, variable_values=variables, context_value=JobContext(),
+        )
+        if result.errors:
+            raise JobError("; ".join(error.message for error in result.errors))
+        return result.data
+    if mode == 'remote':
+        from gql import GraphQLRequest
+        return get_session(GRAPHQL_URL).execute(GraphQLRequest(query, variable_values=variables))
+    raise ImproperlyConfigured(f"CRM_JOB_EXECUTION must be 'local' or 'remote', not {mode!r}")
+
+
+def elapsed_ms(started):
+    return f"{JOB_EXECUTION}, {(time.perf_counter() - started) * 1000:.1f} ms"
+
 
 def log_crm_heartbeat():
     """
     Log heartbeat message every 5 minutes to confirm CRM application health.
-    Optionally queries GraphQL hello field to verify endpoint responsiveness.
+    Also queries the GraphQL hello field to verify the schema responds.
     """
     try:
         # Get current timestamp in DD/MM/YYYY-HH:MM:SS format
         timestamp = datetime.now().strftime('%d/%m/%Y-%H:%M:%S')
-        
+
         # Basic heartbeat message
         heartbeat_message = f"{timestamp} CRM is alive"
-        
-        # Optional: Test GraphQL endpoint responsiveness
+
+        started = time.perf_counter()
         try:
-            # Setup GraphQL client
-            transport = RequestsHTTPTransport(
-                url="http://localhost:8000/graphql",
-                use_json=True,
-            )
-            client = Client(transport=transport, fetch_schema_from_transport=False)
-            
-            # Query the GraphQL hello field to verify endpoint is responsive
-            query = gql("{ hello }")
-            result = client.execute(query)
-            
+            result = execute("{ hello }")
+
             if result.get('hello'):
-                heartbeat_message += " - GraphQL endpoint responsive"
+                heartbeat_message += f" - GraphQL endpoint responsive ({elapsed_ms(started)})"
             else:
-                heartbeat_message += " - GraphQL endpoint error"
-                
+                heartbeat_message += f" - GraphQL endpoint error ({elapsed_ms(started)})"
+
         except Exception as e:
-            heartbeat_message += f" - GraphQL endpoint unreachable: {str(e)}"
-        
+            heartbeat_message += f" - GraphQL endpoint unreachable: {str(e)} ({elapsed_ms(started)})"
+
         # Append to log file (does not overwrite)
-        with open('/tmp/crm_heartbeat_log.txt', 'a') as f:
+        with open(HEARTBEAT_LOG, 'a') as f:
             f.write(heartbeat_message + '\n')
-            
+
     except Exception as e:
         # Fallback logging in case of any errors
         timestamp = datetime.now().strftime('%d/%m/%Y-%H:%M:%S')
         error_message = f"{timestamp} CRM heartbeat error: {str(e)}"
-        
+
         try:
-            with open('/tmp/crm_heartbeat_log.txt', 'a') as f:
+            with open(HEARTBEAT_LOG, 'a') as f:
                 f.write(error_message + '\n')
         except:
             # If file writing fails, at least print to console
@@ -55,43 +139,22 @@ def log_crm_heartbeat():
 
 def update_low_stock():
     """
-    Execute UpdateLowStockProducts mutation via GraphQL endpoint.
+    Execute the UpdateLowStockProducts mutation.
     Logs updated product names and new stock levels.
     """
+    started = time.perf_counter()
     try:
         timestamp = datetime.now().strftime('%d/%m/%Y-%H:%M:%S')
-        
-        # Setup GraphQL client
-        transport = RequestsHTTPTransport(
-            url="http://localhost:8000/graphql",
-            use_json=True,
-        )
-        client = Client(transport=transport, fetch_schema_from_transport=False)
-        
-        # GraphQL mutation to update low stock products
-        mutation = gql("""
-            mutation {
-                updateLowStockProducts {
-                    success
-                    message
-                    updatedProducts {
-                        id
-                        name
-                        stock
-                    }
-                }
-            }
-        """)
-        
-        result = client.execute(mutation)
+
+        result = execute(LOW_STOCK_MUTATION)
         mutation_result = result.get('updateLowStockProducts', {})
-        
+
         if mutation_result.get('success'):
             updated_products = mutation_result.get('updatedProducts', [])
-            
-            with open('/tmp/low_stock_updates_log.txt', 'a') as f:
-                f.write(f"[{timestamp}] Low stock update successful\n")
-                
+
+            with open(LOW_STOCK_LOG, 'a') as f:
+                f.write(f"[{timestamp}] Low stock update successful ({elapsed_ms(started)})\n")
+
                 if updated_products:
                     for product in updated_products:
                         f.write(f"[{timestamp}] Updated: {product['name']} - New stock: {product['stock']}\n")
@@ -99,10 +162,10 @@ def update_low_stock():
                     f.write(f"[{timestamp}] No products required stock updates\n")
         else:
             error_msg = mutation_result.get('message', 'Unknown error')
-            with open('/tmp/low_stock_updates_log.txt', 'a') as f:
-                f.write(f"[{timestamp}] Low stock update failed: {error_msg}\n")
-                
+            with open(LOW_STOCK_LOG, 'a') as f:
+                f.write(f"[{timestamp}] Low stock update failed: {error_msg} ({elapsed_ms(started)})\n")
+
     except Exception as e:
         timestamp = datetime.now().strftime('%d/%m/%Y-%H:%M:%S')
-        with open('/tmp/low_stock_updates_log.txt', 'a') as f:
-            f.write(f"[{timestamp}] Exception in update_low_stock: {str(e)}\n")
+        with open(LOW_STOCK_LOG, 'a') as f:
+            f.write(f"[{timestamp}] Exception in update_low_stock: {str(e)} ({elapsed_ms(started)})\n")
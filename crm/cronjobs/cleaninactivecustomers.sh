@@ -16,32 +16,13 @@ LOG_FILE="/tmp/customer_cleanup_log.txt"
 # Get current timestamp
 TIMESTAMP=$(date '+%Y-%m-%d %H:%M:%S')
 
-# Execute Django command to delete inactive customers
-# Customers are considered inactive if they have no orders in the last year
-DELETED_COUNT=$(python manage.py shell -c "
-from crm.models import Customer, Order
-from django.utils import timezone
-from datetime import timedelta
-import sys
-
-# Calculate date one year ago
-one_year_ago = timezone.now() - timedelta(days=365)
-
-# Find customers with no orders since one year ago
-inactive_customers = Customer.objects.exclude(
-    orders__order_date__gte=one_year_ago
-).distinct()
-
-# Count and delete
-count = inactive_customers.count()
-inactive_customers.delete()
-
-print(count)
-" 2>/dev/null)
+# Delete customers with no orders in the last year, a chunk at a time
+# (see crm/cleanup.py); the command prints a one-line summary
+OUTPUT=$(python manage.py clean_inactive_customers --days 365 --pause 0.05 2>&1)
 
 # Check if command was successful
 if [ $? -eq 0 ]; then
-    echo "[$TIMESTAMP] Successfully deleted $DELETED_COUNT inactive customers" >> "$LOG_FILE"
+    echo "[$TIMESTAMP] $OUTPUT" >> "$LOG_FILE"
 else
-    echo "[$TIMESTAMP] Error: Failed to delete inactive customers" >> "$LOG_FILE"
+    echo "[$TIMESTAMP] Error: Failed to delete inactive customers: $OUTPUT" >> "$LOG_FILE"
 fi
@@ -0,0 +1,141 @@
+"""
+Publish/subscribe for domain events, feeding the GraphQL subscriptions.
+
+Writes publish small JSON-serializable messages (ids and new values, never
+model instances) once their transaction commits, so subscribers only hear
+about committed data. Subscribers are async iterators on an event loop.
+
+The broker is pluggable through ``CRM_EVENT_BROKER``, the dotted path of a
+``Broker`` subclass. The default InProcessBroker only reaches subscribers in
+the publishing process; deployments with several workers need one backed
+by a shared channel (e.g. Redis pub/sub) so every worker sees every event.
+"""
+import asyncio
+import threading
+from collections import defaultdict, deque
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+EVENT_BROKER = getattr(settings, 'CRM_EVENT_BROKER', 'crm.events.InProcessBroker')
+# Messages buffered per subscriber before the oldest are dropped
+EVENT_QUEUE_SIZE = getattr(settings, 'CRM_EVENT_QUEUE_SIZE', 1000)
+
+# {'order_id': int}
+ORDER_CREATED = 'order_created'
+# {'product_id': int, 'stock': int, 'previous_stock': int, or None when unknown (new products)}
+STOCK_CHANGED = 'stock_changed'
+
+
+class Broker:
+    """Interface of event brokers"""
+
+    def publish(self, channel, message):
+        """Deliver ``message`` to the current subscribers of ``channel``; callable from any thread"""
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        """Async iterator of the messages published on ``channel`` from now on"""
+        raise NotImplementedError
+
+
+class _Subscriber:
+    def __init__(self, maxsize):
+        self.loop = asyncio.get_running_loop()
+        self.messages = deque(maxlen=maxsize)
+        self.ready = asyncio.Event()
+        self.dropped = 0
+
+    def put(self, message):
+        # Runs on the subscriber's loop
+        if len(self.messages) == self.messages.maxlen:
+            self.dropped += 1
+        self.messages.append(message)
+        self.ready.set()
+
+    async def get(self):
+        while not self.messages:
+            self.ready.clear()
+            await self.ready.wait()
+        return self.messages.popleft()
+
+
+class InProcessBroker(Broker):
+    """
+    Delivers to subscribers in this process. Slow subscribers lose their
+    oldest messages rather than growing without bound.
+    """
+
+    def __init__(self, queue_size=EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.put, message)
+            except RuntimeError:
+                # The subscriber's loop has closed; its generator is gone too
+                pass
+
+    async def subscribe(self, channel):
+        subscriber = _Subscriber(self.queue_size)
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        try:
+            while True:
+                yield await subscriber.get()
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscriber)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscribers.get(channel, ()))
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(EVENT_BROKER)()
+
+
+def is_process_local():
+    """Whether events published here only reach subscribers in this process"""
+    return isinstance(get_broker(), InProcessBroker)
+
+
+def publish(channel, message):
+    """Publish ``message`` when the current transaction commits (at once outside one)"""
+    transaction.on_commit(lambda: get_broker().publish(channel, message), robust=True)
+
+
+def publish_stock(products, previous):
+    """Publish the new stock of ``products``; ``previous`` maps pk -> stock before the change"""
+    for product in products:
+        before = previous.get(product.pk)
+        if before == product.stock:
+            continue
+        publish(STOCK_CHANGED, {'product_id': product.pk, 'stock': product.stock, 'previous_stock': before})
+
+
+def crossed_below(message, threshold):
+    """Whether a STOCK_CHANGED message took the stock from at least ``threshold`` to below it"""
+    previous = message['previous_stock']
+    return message['stock'] < threshold and (previous is None or previous >= threshold)
+
+
+async def listen(info, channel):
+    """
+    Messages on ``channel`` for a subscription resolver. Each event is
+    resolved with fresh per-request loaders, as a new request would be.
+    """
+    async for message in get_broker().subscribe(channel):
+        info.context.crm_loaders = None
+        yield message
@@ -0,0 +1,196 @@
+from django.db.models import QuerySet
+from graphene.utils.str_converters import to_snake_case
+from graphene_django.filter import DjangoFilterConnectionField
+
+from . import result_cache
+from .loaders import get_loaders
+from .models import Customer, Order, OrderItem, Product
+from .optimizer import (
+    COUNTED_PAGE_ARGS, QueryOptimizer, optimize_connection_queryset, page_attname,
+)
+from .pagination import (
+    build_connection, decode_cursor, encode_cursor, keyset_ordering, keyset_page, order_by,
+)
+
+# A cached page may hold nested data from any of these
+CACHED_CONNECTION_MODELS = (Customer, Product, Order, OrderItem)
+
+
+def needs_full_count(info, args):
+    """Whether a page can't be cut from the start of the rows without counting them all"""
+    if any(args.get(name) is not None for name in COUNTED_PAGE_ARGS):
+        return True
+    return 'totalCount' in QueryOptimizer(info).collect_fields(info.field_nodes)
+
+
+class BatchedConnectionField(DjangoFilterConnectionField):
+    """
+    Filter connection field that feeds the per-request loaders.
+
+    Every node on a resolved page is queued with the request's loaders so
+    nested relations are fetched in one query per level instead of one per
+    node. When ``loader`` is given, the field resolves a relation of its
+    parent through that loader, keeping one more row per parent than the
+    page needs; filtered requests, and pages that need the parent's full
+    count (``last``, cursors, ``offset``, ``totalCount``), fall back to the
+    queryset, which the connection slices with a LIMIT.
+    """
+
+    def __init__(self, type_, *args, loader=None, **kwargs):
+        self.loader = loader
+        super().__init__(type_, *args, **kwargs)
+
+    def resolve_from_loader(self, root, info, **args):
+        attname = to_snake_case(info.field_name)
+        if any(args.get(name) is not None for name in self.filtering_args):
+            return getattr(root, attname).all()
+        if hasattr(root, page_attname(attname)):
+            return getattr(root, page_attname(attname))
+        if attname in getattr(root, '_prefetched_objects_cache', {}):
+            return list(getattr(root, attname).all())
+        if needs_full_count(info, args):
+            return getattr(root, attname).all()
+        first = args.get('first')
+        if first is None:
+            first = self.max_limit
+        # One extra row tells the connection whether there is a next page
+        limit = None if first is None else first + 1
+        return get_loaders(info).limited(self.loader, limit).load(root.pk)
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, **kwargs):
+        # Loader results are already scoped to the parent and unfiltered
+        if isinstance(iterable, list):
+            return iterable
+        return super().resolve_queryset(connection, iterable, info, args, **kwargs)
+
+    @classmethod
+    def connection_resolver(cls, resolver, connection, default_manager,
+                            queryset_resolver, max_limit, enforce_first_or_last,
+                            root, info, **args):
+        result = super().connection_resolver(
+            resolver, connection, default_manager, queryset_resolver,
+            max_limit, enforce_first_or_last, root, info, **args
+        )
+        if hasattr(result, 'edges'):
+            get_loaders(info).queue(edge.node for edge in result.edges)
+        return result
+
+    def wrap_resolve(self, parent_resolver):
+        if self.loader and self.resolver is None:
+            parent_resolver = self.resolve_from_loader
+        return super().wrap_resolve(parent_resolver)
+
+
+class OptimizedConnectionField(BatchedConnectionField):
+    """
+    Batched connection field that also shapes its queryset to the query.
+
+    After filtering, the selection set under ``edges { node { ... } }`` is
+    applied as ``only()``/``select_related()``/``prefetch_related()`` so
+    pagination slices a queryset that reads just the requested data.
+    """
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, **kwargs):
+        queryset = super().resolve_queryset(connection, iterable, info, args, **kwargs)
+        if isinstance(queryset, list):
+            return queryset
+        return optimize_connection_queryset(queryset, info, connection._meta.node)
+
+
+class KeysetConnectionField(OptimizedConnectionField):
+    """
+    Optimized connection field paginated by keyset cursors.
+
+    The queryset's ordering (the model's Meta ordering unless a filter
+    reorders it) is completed with the primary key and each cursor carries
+    that row's ordering values, so ``after``/``before`` become index seeks
+    and no COUNT runs unless ``totalCount`` is selected. Orderings that
+    can't be seeked on (e.g. ranked search), ``offset`` and offset cursors
+    fall back to offset pagination.
+
+    With ``cache=True`` whole pages are kept in the result cache, keyed by
+    the arguments and selection and invalidated by any CRM write.
+    """
+
+    def __init__(self, type_, *args, cache=False, **kwargs):
+        self.cache = cache
+        super().__init__(type_, *args, **kwargs)
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, **kwargs):
+        queryset = super().resolve_queryset(connection, iterable, info, args, **kwargs)
+        if not isinstance(queryset, QuerySet):
+            return queryset
+        ordering = keyset_ordering(queryset)
+        if ordering is None:
+            return queryset
+        queryset = queryset.order_by(*order_by(ordering))
+        # Cursors are built from the ordering columns, so keep them loaded
+        names, defer = queryset.query.deferred_loading
+        if names and not defer:
+            queryset = queryset.only(*names, *(field.name for field, _ in ordering))
+        return queryset
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        ordering = keyset_ordering(iterable) if isinstance(iterable, QuerySet) else None
+        if ordering is None or args.get('offset'):
+            return super().resolve_connection(connection, args, iterable, max_limit=max_limit)
+
+        cursors = {}
+        for name in ('after', 'before'):
+            if args.get(name):
+                cursors[name] = decode_cursor(args[name], ordering)
+                if cursors[name] is None:
+                    return super().resolve_connection(connection, args, iterable, max_limit=max_limit)
+
+        first, last = args.get('first'), args.get('last')
+        if first is None and last is None:
+            first = max_limit
+        nodes, has_previous, has_next = keyset_page(
+            iterable, ordering, first=first, last=last, **cursors
+        )
+
+        edges = [(node, encode_cursor(node, ordering)) for node in nodes]
+        return build_connection(
+            connection, edges,
+            start_cursor=edges[0][1] if edges else None,
+            end_cursor=edges[-1][1] if edges else None,
+            has_previous_page=has_previous,
+            has_next_page=has_next,
+            iterable=iterable,
+        )
+
+    def wrap_resolve(self, parent_resolver):
+        resolve = super().wrap_resolve(parent_resolver)
+        if not self.cache or not result_cache.enabled():
+            return resolve
+        connection_type = self.connection_type
+
+        def resolve_cached(root, info, **args):
+            key = result_cache.make_key(
+                'connection', CACHED_CONNECTION_MODELS,
+                info.parent_type.name, info.field_name, getattr(root, 'pk', None),
+                result_cache.normalize_arguments(args), result_cache.selection_fingerprint(info),
+            )
+
+            def page():
+                result = resolve(root, info, **args)
+                counted = 'totalCount' in QueryOptimizer(info).collect_fields(info.field_nodes)
+                page_info = result.page_info
+                return {
+                    'edges': [(edge.node, edge.cursor) for edge in result.edges],
+                    'start_cursor': page_info.start_cursor,
+                    'end_cursor': page_info.end_cursor,
+                    'has_previous_page': page_info.has_previous_page,
+                    'has_next_page': page_info.has_next_page,
+                    'length': result.resolve_total_count(info) if counted else None,
+                }
+
+            result = build_connection(connection_type, **result_cache.get_or_set(key, page))
+            get_loaders(info).queue(edge.node for edge in result.edges)
+            return result
+
+        return resolve_cached
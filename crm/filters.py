@@ -1,17 +1,42 @@
 import django_filters
 from django.db import models
 from .models import Customer, Product, Order
+from .search import get_search_backend
+
+
+class SearchContainsFilter(django_filters.CharFilter):
+    """Case-insensitive substring match served by the configured search backend"""
+
+    def filter(self, qs, value):
+        if value in django_filters.constants.EMPTY_VALUES:
+            return qs
+        return get_search_backend().contains(qs, self.field_name, value)
+
+
+class RankedSearchFilter(django_filters.CharFilter):
+    """Matches ``value`` against the searchable fields and orders results by rank"""
+
+    def __init__(self, *args, relation=None, **kwargs):
+        self.relation = relation
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if value in django_filters.constants.EMPTY_VALUES:
+            return qs
+        return get_search_backend().search(qs, value, relation=self.relation)
+
 
 class CustomerFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(lookup_expr='icontains')
+    name = SearchContainsFilter(field_name='name')
     email = django_filters.CharFilter(lookup_expr='icontains')
     created_at__gte = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='gte')
     created_at__lte = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='lte')
     phone_pattern = django_filters.CharFilter(method='filter_phone_pattern')
+    search = RankedSearchFilter()
 
     class Meta:
         model = Customer
-        fields = ['name', 'email', 'created_at__gte', 'created_at__lte', 'phone_pattern']
+        fields = ['name', 'email', 'created_at__gte', 'created_at__lte', 'phone_pattern', 'search']
 
     def filter_phone_pattern(self, queryset, name, value):
         """Custom filter for phone numbers starting with specific pattern"""
@@ -20,17 +45,18 @@ class CustomerFilter(django_filters.FilterSet):
         return queryset
 
 class ProductFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(lookup_expr='icontains')
+    name = SearchContainsFilter(field_name='name')
     price__gte = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
     price__lte = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
     stock__gte = django_filters.NumberFilter(field_name='stock', lookup_expr='gte')
     stock__lte = django_filters.NumberFilter(field_name='stock', lookup_expr='lte')
     stock = django_filters.NumberFilter(field_name='stock', lookup_expr='exact')
     low_stock = django_filters.BooleanFilter(method='filter_low_stock')
+    search = RankedSearchFilter()
 
     class Meta:
         model = Product
-        fields = ['name', 'price__gte', 'price__lte', 'stock__gte', 'stock__lte', 'stock', 'low_stock']
+        fields = ['name', 'price__gte', 'price__lte', 'stock__gte', 'stock__lte', 'stock', 'low_stock', 'search']
 
     def filter_low_stock(self, queryset, name, value):
         """Filter products with low stock (less than 10)"""
@@ -43,14 +69,16 @@ class OrderFilter(django_filters.FilterSet):
     total_amount__lte = django_filters.NumberFilter(field_name='total_amount', lookup_expr='lte')
     order_date__gte = django_filters.DateTimeFilter(field_name='order_date', lookup_expr='gte')
     order_date__lte = django_filters.DateTimeFilter(field_name='order_date', lookup_expr='lte')
-    customer_name = django_filters.CharFilter(field_name='customer__name', lookup_expr='icontains')
-    product_name = django_filters.CharFilter(field_name='products__name', lookup_expr='icontains')
+    customer_name = SearchContainsFilter(field_name='customer__name')
+    product_name = SearchContainsFilter(field_name='products__name')
     product_id = django_filters.NumberFilter(method='filter_by_product_id')
+    # Ranked by how well the order's customer matches
+    search = RankedSearchFilter(relation='customer')
 
     class Meta:
         model = Order
         fields = ['total_amount__gte', 'total_amount__lte', 'order_date__gte', 'order_date__lte', 
-                 'customer_name', 'product_name', 'product_id']
+                 'customer_name', 'product_name', 'product_id', 'search']
 
     def filter_by_product_id(self, queryset, name, value):
         """Filter orders that include a specific product ID"""
@@ -0,0 +1,174 @@
+"""
+Background jobs for heavy mutations, backed by the Job table.
+
+Mutations called with ``background: true`` enqueue a Job and return it at
+once; ``manage.py run_jobs`` runs a pool of worker threads that claim
+queued jobs and run the task registered for their kind. No broker is
+involved. A worker claims a job with a conditional UPDATE (queued ->
+running), so any number of workers and processes can share the table.
+
+Tasks are functions registered with ``@task(kind)``. They receive a
+JobProgress and the job's payload as keyword arguments, report progress
+through it, and return a JSON-serializable result. Progress is written at
+most every PROGRESS_INTERVAL seconds and doubles as the worker's
+heartbeat. A running job whose heartbeat is older than JOB_STALE_AFTER is
+marked failed, since its worker died and its work is partly committed.
+
+Workers run outside the web processes, so the events they publish and the
+cache entries they invalidate only reach those processes through a shared
+event broker and cache; run_jobs refuses to start without them unless told
+otherwise (see crm.checks).
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Seconds an idle worker waits before looking for jobs again
+JOB_POLL_INTERVAL = getattr(settings, 'CRM_JOB_POLL_INTERVAL', 1.0)
+# Seconds without a heartbeat after which a running job is failed
+JOB_STALE_AFTER = getattr(settings, 'CRM_JOB_STALE_AFTER', 600)
+# Seconds between progress writes
+PROGRESS_INTERVAL = 0.5
+
+_tasks = {}
+
+
+def task(kind):
+    """Register the decorated function as the task run for jobs of ``kind``"""
+    def register(function):
+        _tasks[kind] = function
+        return function
+    return register
+
+
+def enqueue(kind, total=None, **payload):
+    if kind not in _tasks:
+        raise ValueError(f"No task registered for {kind!r}")
+    return Job.objects.create(kind=kind, payload=payload, total=total)
+
+
+class JobProgress:
+    """Handed to tasks to report how far they are"""
+
+    def __init__(self, job):
+        self.job = job
+        self.processed = job.processed
+        self.total = job.total
+        self._written = 0.0
+
+    def start(self, total):
+        self.total = total
+        self.flush()
+
+    def advance(self, count=1):
+        self.processed += count
+        if time.monotonic() - self._written >= PROGRESS_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self._written = time.monotonic()
+        Job.objects.filter(pk=self.job.pk).update(
+            processed=self.processed, total=self.total, heartbeat_at=timezone.now(),
+        )
+
+
+def claim(worker):
+    """Mark the oldest queued job as running for ``worker`` and return it, or None"""
+    candidates = (
+        Job.objects.filter(status=Job.QUEUED).order_by('created_at').values_list('pk', flat=True)[:10]
+    )
+    for job_id in candidates:
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, worker=worker, started_at=now, heartbeat_at=now,
+        )
+        if claimed:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def run(job):
+    """Run a claimed job and record its outcome"""
+    progress = JobProgress(job)
+    try:
+        function = _tasks.get(job.kind)
+        if function is None:
+            raise LookupError(f"No task registered for {job.kind!r}")
+        result = function(progress, **job.payload)
+    except Exception as e:
+        logger.exception("Job %s (%s) failed", job.pk, job.kind)
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.FAILED, error=str(e) or type(e).__name__, processed=progress.processed,
+            finished_at=timezone.now(),
+        )
+    else:
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.SUCCEEDED, result=result, processed=progress.processed, total=progress.total,
+            finished_at=timezone.now(),
+        )
+
+
+def fail_stale():
+    """Fail running jobs whose worker stopped sending heartbeats; returns how many"""
+    cutoff = timezone.now() - timedelta(seconds=JOB_STALE_AFTER)
+    return Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=cutoff).update(
+        status=Job.FAILED, error="Worker stopped responding", finished_at=timezone.now(),
+    )
+
+
+def run_next(worker='inline'):
+    """Claim and run one job; returns it, or None when the queue is empty"""
+    job = claim(worker)
+    if job is not None:
+        run(job)
+    return job
+
+
+class WorkerPool:
+    """Threads that claim and run jobs until stopped, or until the queue is empty with ``once``"""
+
+    def __init__(self, workers=4, poll_interval=JOB_POLL_INTERVAL, once=False):
+        self.poll_interval = poll_interval
+        self.once = once
+        self.stopping = threading.Event()
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self.threads = [
+            threading.Thread(target=self.work, args=(f"{prefix}:{index}",), name=f"crm-job-worker-{index}")
+            for index in range(workers)
+        ]
+
+    def start(self):
+        fail_stale()
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stopping.set()
+
+    def join(self, timeout=None):
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def work(self, worker):
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                if run_next(worker) is not None:
+                    continue
+                if self.once:
+                    return
+                fail_stale()
+                self.stopping.wait(self.poll_interval)
+        finally:
+            connection.close()
@@ -0,0 +1,258 @@
+"""
+Per-request batch loaders for the CRM GraphQL schema.
+
+Resolvers for relations (``Order.customer``, ``Order.products`` and the
+reverse ``orders`` relations) go through these loaders instead of touching
+the ORM directly. Keys are queued as soon as a page of parent objects is
+known, so the first ``load()`` fetches every queued key in one query and
+the rest of the page is served from the cache.
+
+Loaders for the reverse ``orders`` connections can be limited to the first
+rows of each parent (``Loaders.limited``), so a nested ``orders(first: 10)``
+reads at most 11 rows per parent instead of every order.
+"""
+import asyncio
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .async_execution import is_async
+
+from .models import Customer, Product, Order, OrderItem
+
+
+class BatchLoader:
+    """Caches values by key and loads all pending keys in a single batch"""
+    # Instances of this model supply keys to the loader through ``queue``
+    source_model = None
+    # Whether each key maps to a list of objects rather than a single object
+    many = False
+
+    def __init__(self, registry, limit=None):
+        self.registry = registry
+        # Most values kept per key for ``many`` loaders; None keeps them all
+        self.limit = limit
+        self._cache = {}
+        self._pending = set()
+        self._inflight = None
+
+    def source_key(self, instance):
+        return instance.pk
+
+    def batch_load(self, keys):
+        """Return a mapping of key -> value for the given keys"""
+        raise NotImplementedError
+
+    def queue(self, keys):
+        self._pending.update(
+            key for key in keys if key is not None and key not in self._cache
+        )
+
+    def load(self, key):
+        if key not in self._cache:
+            self._pending.add(key)
+            self._dispatch()
+        return self._cache[key]
+
+    async def aload(self, key):
+        """load() for the event loop; concurrent callers share one batch"""
+        while key not in self._cache:
+            fetch = self._inflight
+            if fetch is None:
+                self._pending.add(key)
+                fetch = self._inflight = asyncio.ensure_future(sync_to_async(self._dispatch)())
+            try:
+                await fetch
+            finally:
+                if self._inflight is fetch:
+                    self._inflight = None
+        return self._cache[key]
+
+    def resolve(self, info, key):
+        """The value for a resolver: aload() under the async view, else load()"""
+        if is_async(info):
+            return self.aload(key)
+        return self.load(key)
+
+    def _dispatch(self):
+        keys = list(self._pending)
+        self._pending.clear()
+        results = self.batch_load(keys)
+
+        loaded = []
+        for key in keys:
+            value = results.get(key, [] if self.many else None)
+            self._cache[key] = value
+            if self.many:
+                loaded.extend(value)
+            elif value is not None:
+                loaded.append(value)
+
+        # Objects we just fetched are the parents of the next level down
+        self.registry.queue(loaded)
+
+
+def first_per_key(queryset, key, ordering, limit):
+    """
+    ``queryset`` ordered by ``ordering``, keeping the first ``limit`` rows
+    for each value of ``key`` (a ROW_NUMBER() window per key).
+    """
+    queryset = queryset.order_by(*ordering)
+    if limit is None:
+        return queryset
+    return queryset.annotate(
+        row_number=Window(RowNumber(), partition_by=F(key), order_by=ordering)
+    ).filter(row_number__lte=limit)
+
+
+class CustomerLoader(BatchLoader):
+    """Order.customer_id -> Customer"""
+    source_model = Order
+
+    def source_key(self, order):
+        # Reading a deferred customer_id would cost a query per order
+        return order.__dict__.get('customer_id')
+
+    def batch_load(self, keys):
+        return Customer.objects.in_bulk(keys)
+
+
+class ProductLoader(BatchLoader):
+    """OrderItem.product_id -> Product"""
+    source_model = OrderItem
+
+    def source_key(self, item):
+        return item.__dict__.get('product_id')
+
+    def batch_load(self, keys):
+        return Product.objects.in_bulk(keys)
+
+
+class OrderItemsLoader(BatchLoader):
+    """Order.id -> [OrderItem]"""
+    source_model = Order
+    many = True
+
+    def batch_load(self, order_ids):
+        results = defaultdict(list)
+        items = OrderItem.objects.filter(order_id__in=order_ids).order_by('order_id', 'pk')
+        for item in items:
+            results[item.order_id].append(item)
+        return results
+
+
+class OrderProductsLoader(BatchLoader):
+    """Order.id -> [Product] through the order lines"""
+    source_model = Order
+    many = True
+
+    def batch_load(self, order_ids):
+        results = defaultdict(list)
+        rows = (
+            OrderItem.objects
+            .filter(order_id__in=order_ids)
+            .select_related('product')
+            .order_by('product__name', 'product_id')
+        )
+        for row in rows:
+            results[row.order_id].append(row.product)
+        return results
+
+
+class CustomerOrdersLoader(BatchLoader):
+    """Customer.id -> [Order]"""
+    source_model = Customer
+    many = True
+
+    def batch_load(self, customer_ids):
+        results = defaultdict(list)
+        orders = first_per_key(
+            Order.objects.filter(customer_id__in=customer_ids),
+            'customer_id', ('-order_date', '-id'), self.limit,
+        )
+        for order in orders:
+            results[order.customer_id].append(order)
+        return results
+
+
+class ProductOrdersLoader(BatchLoader):
+    """Product.id -> [Order] through the order lines"""
+    source_model = Product
+    many = True
+
+    def batch_load(self, product_ids):
+        results = defaultdict(list)
+        rows = first_per_key(
+            OrderItem.objects.filter(product_id__in=product_ids).select_related('order'),
+            'product_id', ('-order__order_date', 'order_id'), self.limit,
+        )
+        for row in rows:
+            results[row.product_id].append(row.order)
+        return results
+
+
+class Loaders:
+    """The set of loaders shared by every resolver within one request"""
+    loader_classes = {
+        'customer': CustomerLoader,
+        'product': ProductLoader,
+        'order_items': OrderItemsLoader,
+        'order_products': OrderProductsLoader,
+        'customer_orders': CustomerOrdersLoader,
+        'product_orders': ProductOrdersLoader,
+    }
+
+    def __init__(self):
+        self._loaders = {
+            name: loader_class(self)
+            for name, loader_class in self.loader_classes.items()
+        }
+        self._limited = {}
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['_loaders'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, name):
+        return self._loaders[name]
+
+    def limited(self, name, limit):
+        """
+        The loader ``name`` keeping at most ``limit`` values per key. It
+        starts with every key queued so far, so it still loads in one batch.
+        """
+        if limit is None:
+            return self._loaders[name]
+        loader = self._limited.get((name, limit))
+        if loader is None:
+            base = self._loaders[name]
+            loader = self._limited[name, limit] = type(base)(self, limit)
+            loader.queue({*base._pending, *base._cache})
+        return loader
+
+    def queue(self, instances):
+        """Queue the keys each loader can derive from the given instances"""
+        by_model = defaultdict(list)
+        for instance in instances:
+            by_model[type(instance)].append(instance)
+
+        loaders = [*self._loaders.values(), *self._limited.values()]
+        for model, objs in by_model.items():
+            for loader in loaders:
+                if loader.source_model is model:
+                    loader.queue(loader.source_key(obj) for obj in objs)
+
+
+def get_loaders(info):
+    """Return the loaders bound to the current request, creating them on first use"""
+    context = info.context
+    loaders = getattr(context, 'crm_loaders', None)
+    if loaders is None:
+        loaders = Loaders()
+        if context is not None:
+            context.crm_loaders = loaders
+    return loaders
@@ -0,0 +1,52 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from crm.cleanup import CLEANUP_CHUNK_SIZE, INACTIVE_AFTER, clean_inactive_customers
+
+
+class Command(BaseCommand):
+    help = "Delete customers with no order in the last --days days, in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=INACTIVE_AFTER.days,
+                            help="Customers without an order this recent are inactive")
+        parser.add_argument('--chunk-size', type=int, default=CLEANUP_CHUNK_SIZE,
+                            help="Customers deleted per transaction")
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Seconds to sleep between chunks, to leave the database room")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only count what would be deleted")
+
+    def handle(self, *args, days, chunk_size, pause, dry_run, **options):
+        if days < 0 or chunk_size < 1 or pause < 0:
+            raise CommandError("--days and --pause cannot be negative, --chunk-size must be positive")
+        self.verbosity = options['verbosity']
+        self.started = time.perf_counter()
+
+        counts = clean_inactive_customers(
+            timezone.now() - timedelta(days=days), chunk_size=chunk_size, pause=pause,
+            dry_run=dry_run, progress=self.report_progress,
+        )
+
+        if dry_run:
+            self.stdout.write(
+                f"Would delete {counts['customers']} inactive customers and {counts['orders']} orders"
+            )
+            return
+        elapsed = time.perf_counter() - self.started
+        rows = sum(counts.values())
+        self.stdout.write(
+            f"Successfully deleted {counts['customers']} inactive customers "
+            f"({counts['orders']} orders, {counts['order_items']} order lines) in {elapsed:.1f}s "
+            f"({rows / max(elapsed, 1e-9):,.0f} rows/s)"
+        )
+
+    def report_progress(self, counts):
+        if self.verbosity >= 2:
+            self.stdout.write(
+                f"  {counts['customers']} customers, {sum(counts.values())} rows after "
+                f"{time.perf_counter() - self.started:.1f}s"
+            )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.export import EXPORT_CHUNK_SIZE, EXPORTS, FORMATS, ExportError, export_lines
+
+
+class Command(BaseCommand):
+    help = "Stream every row of an export as NDJSON or CSV, with constant memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(EXPORTS))
+        parser.add_argument('--format', dest='export_format', choices=FORMATS, default='ndjson')
+        parser.add_argument(
+            '--filter', action='append', default=[], metavar='NAME=VALUE',
+            help="Filter argument as accepted by the GraphQL connection, e.g. name=ali",
+        )
+        parser.add_argument('--output', help="File to write to (defaults to stdout)")
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, name, export_format, filter, output, chunk_size, **options):
+        filters = {}
+        for item in filter:
+            key, sep, value = item.partition('=')
+            if not sep:
+                raise CommandError(f"Filters must look like NAME=VALUE, got '{item}'")
+            filters[key] = value
+
+        try:
+            lines = export_lines(name, export_format, filters, chunk_size)
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        if output:
+            with open(output, 'w', newline='') as stream:
+                stream.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
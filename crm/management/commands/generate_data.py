@@ -0,0 +1,63 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import synthetic
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic customers, products and orders for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=10_000)
+        parser.add_argument('--products', type=int, default=1_000)
+        parser.add_argument('--orders', type=int, default=100_000)
+        parser.add_argument('--seed', type=int, default=42, help="Same seed, sizes and --end give the same data")
+        parser.add_argument('--days', type=int, default=730, help="Days of order history")
+        parser.add_argument('--end', type=date.fromisoformat,
+                            help="Day after the last order, YYYY-MM-DD (defaults to today)")
+        parser.add_argument('--product-skew', type=float, default=1.1,
+                            help="Zipf exponent of product popularity")
+        parser.add_argument('--customer-skew', type=float, default=0.6,
+                            help="Zipf exponent of customer activity")
+        parser.add_argument('--batch-size', type=int, default=synthetic.DEFAULT_BATCH_SIZE)
+        parser.add_argument('--flush', action='store_true',
+                            help="Delete every customer, product and order first")
+
+    def handle(self, *args, customers, products, orders, **options):
+        self.verbosity = options['verbosity']
+        if options['flush']:
+            self.log("Deleting existing data...")
+            synthetic.flush()
+        self.started = time.perf_counter()
+        self.reported = {}
+        try:
+            created = synthetic.generate(
+                customers, products, orders, seed=options['seed'], days=options['days'],
+                end=options['end'], product_skew=options['product_skew'],
+                customer_skew=options['customer_skew'], batch_size=options['batch_size'],
+                progress=self.report_progress,
+            )
+        except synthetic.GenerationError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - self.started
+        rows = sum(created.values())
+        self.log(self.style.SUCCESS(
+            f"Created {created['customers']} customers, {created['products']} products, "
+            f"{created['orders']} orders and {created['order_items']} order lines "
+            f"in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)"
+        ))
+
+    def log(self, message):
+        if self.verbosity:
+            self.stdout.write(message)
+
+    def report_progress(self, label, done, total):
+        # Every tenth, or every batch at verbosity 2
+        step = done * 10 // total
+        if self.verbosity < 2 and step == self.reported.get(label) and done < total:
+            return
+        self.reported[label] = step
+        self.log(f"  {label}: {done}/{total} ({done * 100 // total}%) after "
+                 f"{time.perf_counter() - self.started:.1f}s")
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.checks import cross_process_problems
+from crm.jobs import JOB_POLL_INTERVAL, WorkerPool
+
+
+class Command(BaseCommand):
+    help = "Run background jobs (mutations called with background: true) with a pool of worker threads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Worker threads")
+        parser.add_argument('--poll-interval', type=float, default=JOB_POLL_INTERVAL,
+                            help="Seconds an idle worker waits before checking for jobs again")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue is empty instead of waiting for new jobs")
+        parser.add_argument('--allow-process-local', action='store_true',
+                            help="Run although the event broker or result cache isn't shared with the "
+                                 "web processes, which then miss the jobs' events and serve stale results")
+
+    def handle(self, *args, workers, poll_interval, once, allow_process_local, **options):
+        if workers < 1:
+            raise CommandError("--workers must be positive")
+        problems = cross_process_problems()
+        if problems and not allow_process_local:
+            raise CommandError(
+                "Jobs would write outside the web processes, but " + "; ".join(problems.values())
+                + ". Configure a shared CRM_EVENT_BROKER and cache, or pass --allow-process-local."
+            )
+        # Task functions are registered when the schema is imported
+        import crm.schema  # noqa: F401
+
+        pool = WorkerPool(workers, poll_interval, once)
+        pool.start()
+        if options['verbosity']:
+            self.stdout.write(f"Running jobs with {workers} workers")
+        try:
+            # Joining with a timeout keeps Ctrl-C responsive
+            while any(thread.is_alive() for thread in pool.threads):
+                pool.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping after the running jobs finish...")
+            pool.stop()
+            pool.join()
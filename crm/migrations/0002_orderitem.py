@@ -0,0 +1,56 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_order_products(apps, schema_editor):
+    """Turn each existing order/product pair into a single line at the current price"""
+    Order = apps.get_model('crm', 'Order')
+    OrderItem = apps.get_model('crm', 'OrderItem')
+    OrderProducts = Order.products.through
+
+    batch = []
+    rows = OrderProducts.objects.select_related('product').order_by('pk').iterator(chunk_size=2000)
+    for row in rows:
+        batch.append(OrderItem(
+            order_id=row.order_id,
+            product_id=row.product_id,
+            quantity=1,
+            unit_price=row.product.price,
+        ))
+        if len(batch) >= 2000:
+            OrderItem.objects.bulk_create(batch)
+            batch = []
+    OrderItem.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='crm.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='crm.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('order', 'product'), name='unique_order_product')],
+            },
+        ),
+        migrations.RunPython(copy_order_products, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='order',
+            name='products',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='products',
+            field=models.ManyToManyField(related_name='orders', through='crm.OrderItem', to='crm.product'),
+        ),
+    ]
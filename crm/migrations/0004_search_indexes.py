@@ -0,0 +1,74 @@
+from django.db import migrations
+
+# table -> columns indexed for search (mirrors crm.search.SEARCH_FIELDS)
+SEARCH_TABLES = {
+    'crm_customer': ('name', 'email'),
+    'crm_product': ('name',),
+}
+
+
+def sqlite_statements(table, columns):
+    fts = f'{table}_fts'
+    cols = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}', "
+        f"content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); END",
+        # Only searchable columns re-index, so stock/total updates stay cheap
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def postgres_statements(table, columns):
+    return [
+        f"CREATE INDEX IF NOT EXISTS {table}_{column}_trgm_idx "
+        f"ON {table} USING gin ({column} gin_trgm_ops)"
+        for column in columns
+    ]
+
+
+def create_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        # FTS5's trigram tokenizer needs SQLite 3.34; older builds keep using LIKE
+        if connection.Database.sqlite_version_info < (3, 34):
+            return
+        for table, columns in SEARCH_TABLES.items():
+            for statement in sqlite_statements(table, columns):
+                schema_editor.execute(statement)
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for table, columns in SEARCH_TABLES.items():
+            for statement in postgres_statements(table, columns):
+                schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    for table, columns in SEARCH_TABLES.items():
+        if connection.vendor == 'sqlite':
+            for suffix in ('_ai', '_ad', '_au'):
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_fts{suffix}")
+            schema_editor.execute(f"DROP TABLE IF EXISTS {table}_fts")
+        elif connection.vendor == 'postgresql':
+            for column in columns:
+                schema_editor.execute(f"DROP INDEX IF EXISTS {table}_{column}_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -1,4 +1,7 @@
+import uuid
+
 from django.db import models
+from django.db.models import F, Q, Sum
 from django.core.validators import RegexValidator, ValidationError
 from decimal import Decimal
 
@@ -18,6 +21,13 @@ class Customer(models.Model):
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name'], name='crm_customer_name_idx'),
+            models.Index(fields=['created_at'], name='crm_customer_created_idx'),
+            # Pattern opclass lets PostgreSQL use the index for phone__startswith
+            models.Index(fields=['phone'], name='crm_customer_phone_idx',
+                         opclasses=['varchar_pattern_ops']),
+        ]
 
 class Product(models.Model):
     name = models.CharField(max_length=100)
@@ -26,11 +36,29 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Stock as last loaded or saved, so saves only publish real changes; None when unknown
+    _saved_stock = None
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_stock = instance.__dict__.get('stock')
+        return instance
+
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name'], name='crm_product_name_idx'),
+            models.Index(fields=['price'], name='crm_product_price_idx'),
+            models.Index(fields=['stock'], name='crm_product_stock_idx'),
+            # Partial index for ProductFilter.low_stock; skipped on backends
+            # without partial index support
+            models.Index(fields=['stock'], condition=Q(stock__lt=10),
+                         name='crm_product_low_stock_idx'),
+        ]
 
     def clean(self):
         if self.price <= 0:
@@ -38,7 +66,7 @@ class Product(models.Model):
 
 class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='orders')
-    products = models.ManyToManyField(Product, related_name='orders')
+    products = models.ManyToManyField(Product, through='OrderItem', related_name='orders')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
     order_date = models.DateTimeField(auto_now_add=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -49,15 +77,106 @@ class Order(models.Model):
 
     class Meta:
         ordering = ['-order_date']
+        indexes = [
+            # Default ordering, order_date range filters and (order_date, id) seeks
+            models.Index(fields=['-order_date', '-id'], name='crm_order_date_idx'),
+            models.Index(fields=['total_amount'], name='crm_order_total_idx'),
+            models.Index(fields=['customer', '-order_date'], name='crm_order_customer_date_idx'),
+        ]
 
     def calculate_total(self):
-        """Calculate total amount based on associated products"""
-        total = sum(product.price for product in self.products.all())
+        """
+        Calculate total amount from the order's line items.
+        Totals are maintained incrementally as lines change (see crm.signals),
+        so saving an order never recomputes them.
+        """
+        total = self.items.aggregate(
+            total=Sum(F('quantity') * F('unit_price'))
+        )['total'] or Decimal('0.00')
+        total = Decimal(total).quantize(Decimal('0.01'))
         self.total_amount = total
         return total
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        if self.products.exists():
-            self.calculate_total()
-            super().save(update_fields=['total_amount'])
+class OrderItem(models.Model):
+    """A product line on an order, with the unit price captured at order time"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='order_items')
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._saved_line_total = self._current_line_total() if self.pk else Decimal('0.00')
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='unique_order_product'),
+        ]
+
+    @property
+    def line_total(self):
+        return self.quantity * self.unit_price
+
+    def _current_line_total(self):
+        """Line total from loaded values, or None when a field is deferred"""
+        if 'quantity' in self.__dict__ and 'unit_price' in self.__dict__:
+            return self.line_total
+        return None
+
+class JobWatermark(models.Model):
+    """How far an incremental job has got, as an (order_date, id) position"""
+    name = models.CharField(max_length=100, unique=True)
+    last_order_date = models.DateTimeField()
+    last_order_id = models.BigIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at ({self.last_order_date}, {self.last_order_id})"
+
+class OrderReminder(models.Model):
+    """A reminder sent for an order; at most one per order"""
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='reminder')
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Reminder for order {self.order_id}"
+
+class Job(models.Model):
+    """A mutation run in the background by ``manage.py run_jobs`` (see crm.jobs)"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=50)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    # Task arguments, and the JSON result a finished task returned
+    payload = models.JSONField(default=dict)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    processed = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.kind} job {self.pk} ({self.status})"
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest queued job and sweep stale running ones
+            models.Index(fields=['status', 'created_at'], name='crm_job_status_idx'),
+        ]
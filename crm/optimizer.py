@@ -0,0 +1,192 @@
+"""
+Selection-set-aware queryset optimizer.
+
+Walks the GraphQL selection under a connection's ``edges { node { ... } }``
+and turns it into ``only()``, ``select_related()`` and ``prefetch_related()``
+calls, so a page only reads the columns and relations the client asked for.
+Nested connections are prefetched one page per parent (a sliced
+``Prefetch`` into ``page_attname(field)``), or left to resolve on their own
+when the page needs the parent's full count.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene import Dynamic
+from graphene.utils.str_converters import to_snake_case
+from graphql import value_from_ast_untyped
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+PAGINATION_ARGS = {'first', 'last', 'before', 'after', 'offset'}
+# Pages selected with these can't be cut from the start of the rows without a COUNT
+COUNTED_PAGE_ARGS = PAGINATION_ARGS - {'first'}
+
+
+def page_attname(attname):
+    """Where the prefetched page of the nested connection ``attname`` is stored"""
+    return f'_{attname}_page'
+
+
+def unwrap_type(graphene_type):
+    """
+    Strip NonNull/List wrappers and connections down to the node type.
+    Returns ``(node_type, is_connection)``.
+    """
+    while hasattr(graphene_type, 'of_type'):
+        graphene_type = graphene_type.of_type
+    node_type = getattr(getattr(graphene_type, '_meta', None), 'node', None)
+    if node_type is not None:
+        return node_type, True
+    return graphene_type, False
+
+
+class QueryOptimizer:
+    def __init__(self, info):
+        self.info = info
+
+    def collect_fields(self, field_nodes):
+        """Merge the sub-selections of ``field_nodes`` into name -> [FieldNode]"""
+        fields = {}
+        for field_node in field_nodes:
+            if field_node.selection_set:
+                self._collect(field_node.selection_set, fields)
+        return fields
+
+    def _collect(self, selection_set, fields):
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                fields.setdefault(selection.name.value, []).append(selection)
+            elif isinstance(selection, InlineFragmentNode):
+                self._collect(selection.selection_set, fields)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = self.info.fragments.get(selection.name.value)
+                if fragment:
+                    self._collect(fragment.selection_set, fields)
+
+    def argument_values(self, field_node):
+        """The arguments given to ``field_node``, with variables substituted"""
+        return {
+            arg.name.value: value_from_ast_untyped(arg.value, self.info.variable_values)
+            for arg in field_node.arguments
+        }
+
+    def needs_full_count(self, field_nodes):
+        """Whether a page of the connection at ``field_nodes`` depends on its row count"""
+        for field_node in field_nodes:
+            args = self.argument_values(field_node)
+            if any(args.get(name) is not None for name in COUNTED_PAGE_ARGS):
+                return True
+        return 'totalCount' in self.collect_fields(field_nodes)
+
+    def page_size(self, field_nodes, max_limit):
+        """The largest ``first`` asked of the connection at ``field_nodes``, None if unbounded"""
+        sizes = []
+        for field_node in field_nodes:
+            first = self.argument_values(field_node).get('first')
+            sizes.append(max_limit if first is None else first)
+        return None if None in sizes else max(sizes)
+
+    def connection_node_fields(self, field_nodes):
+        """Selections made on ``edges { node { ... } }`` of a connection field"""
+        edges = self.collect_fields(field_nodes).get('edges', [])
+        return self.collect_fields(self.collect_fields(edges).get('node', []))
+
+    def optimize_connection(self, queryset, node_type, field_nodes):
+        selections = self.connection_node_fields(field_nodes)
+        if not selections:
+            return queryset
+        return self.optimize(queryset, node_type, selections)
+
+    def optimize(self, queryset, node_type, selections, required=()):
+        only, select_related, prefetches = self.plan(queryset.model, node_type, selections)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        if only is not None:
+            queryset = queryset.only(*only, *required)
+        return queryset
+
+    def plan(self, model, node_type, selections, prefix=''):
+        """
+        Return ``(only, select_related, prefetches)`` lookups for ``selections``.
+
+        ``only`` is None when a selected field is not backed by a model field
+        (a custom resolver may need any column), which disables pruning.
+        """
+        only = {prefix + model._meta.pk.name}
+        select_related = []
+        prefetches = []
+        graphene_fields = node_type._meta.fields
+
+        for name, field_nodes in selections.items():
+            if name.startswith('__'):
+                continue
+            attname = to_snake_case(name)
+            try:
+                model_field = model._meta.get_field(attname)
+            except FieldDoesNotExist:
+                only = None
+                continue
+
+            if not model_field.is_relation:
+                if only is not None:
+                    only.add(prefix + model_field.name)
+                continue
+
+            graphene_field = graphene_fields[attname]
+            if isinstance(graphene_field, Dynamic):
+                graphene_field = graphene_field.get_type()
+            related_type, is_connection = unwrap_type(graphene_field.type)
+            sub_selections = self.collect_fields(field_nodes)
+
+            if model_field.many_to_one or (model_field.one_to_one and model_field.concrete):
+                lookup = prefix + model_field.name
+                select_related.append(lookup)
+                sub_only, sub_related, sub_prefetches = self.plan(
+                    model_field.related_model, related_type, sub_selections, lookup + '__'
+                )
+                if only is not None:
+                    only.add(lookup)
+                    if sub_only is None:
+                        only = None
+                    else:
+                        only.update(sub_only)
+                select_related.extend(sub_related)
+                prefetches.extend(sub_prefetches)
+                continue
+
+            # Filtered nested connections query on their own
+            if any(arg.name.value not in PAGINATION_ARGS
+                   for field_node in field_nodes for arg in field_node.arguments):
+                continue
+
+            # Counting the rows of each parent is left to the connection itself
+            if is_connection and self.needs_full_count(field_nodes):
+                continue
+
+            related_qs = model_field.related_model._default_manager.all()
+            if is_connection:
+                node_selections = self.connection_node_fields(field_nodes)
+            else:
+                node_selections = sub_selections
+            if node_selections:
+                # Reverse FK prefetches need the FK column to attach rows to parents
+                required = [model_field.field.name] if model_field.one_to_many else []
+                related_qs = self.optimize(related_qs, related_type, node_selections, required)
+            if not is_connection:
+                prefetches.append(Prefetch(prefix + attname, queryset=related_qs))
+                continue
+            first = self.page_size(field_nodes, getattr(graphene_field, 'max_limit', None))
+            if first is not None:
+                # One page per parent, plus a row to tell whether there is a next one
+                related_qs = related_qs[:first + 1]
+            # Sliced prefetches can only be stored in an attribute of their own
+            prefetches.append(
+                Prefetch(prefix + attname, queryset=related_qs, to_attr=page_attname(attname))
+            )
+
+        return only, select_related, prefetches
+
+
+def optimize_connection_queryset(queryset, info, node_type):
+    """Apply the selection set of the connection being resolved to ``queryset``"""
+    return QueryOptimizer(info).optimize_connection(queryset, node_type, info.field_nodes)
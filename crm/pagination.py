@@ -0,0 +1,162 @@
+"""
+Keyset (seek) pagination for relay connections.
+
+Offset cursors make page N cost O(N): the database has to walk past every
+earlier row, and every page also runs a full COUNT. Keyset cursors encode
+the ordering values of the last row instead, e.g. ``(order_date, id)``, and
+the next page is fetched with a ``WHERE (order_date, id) < (...)`` seek that
+an index on the same columns answers in O(page).
+"""
+import json
+
+import graphene
+from django.db.models import Q, QuerySet
+from graphql import GraphQLError
+from graphql_relay.utils import base64, unbase64
+
+CURSOR_PREFIX = 'keyset:'
+
+
+class CountableConnection(graphene.relay.Connection):
+    """Relay connection with an opt-in ``totalCount``; the COUNT only runs when selected"""
+
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int(required=True)
+
+    def resolve_total_count(self, info):
+        if getattr(self, 'length', None) is not None:
+            return self.length
+        if isinstance(self.iterable, QuerySet):
+            return self.iterable.count()
+        return len(self.iterable)
+
+
+def build_connection(connection_type, edges, start_cursor=None, end_cursor=None,
+                     has_previous_page=False, has_next_page=False, iterable=None, length=None):
+    """Instantiate ``connection_type`` from ``(node, cursor)`` pairs"""
+    edges = [connection_type.Edge(node=node, cursor=cursor) for node, cursor in edges]
+    connection = connection_type(
+        edges=edges,
+        page_info=graphene.relay.PageInfo(
+            start_cursor=start_cursor,
+            end_cursor=end_cursor,
+            has_previous_page=has_previous_page,
+            has_next_page=has_next_page,
+        ),
+    )
+    connection.iterable = iterable
+    connection.length = length
+    return connection
+
+
+def keyset_ordering(queryset):
+    """
+    The queryset's ordering as ``[(field, descending)]`` ending in the primary
+    key, or None if it can't be used as a keyset (expressions, annotations,
+    lookups through relations or nullable columns).
+    """
+    ordering = queryset.query.order_by or queryset.model._meta.ordering
+    if not ordering:
+        return None
+
+    opts = queryset.model._meta
+    fields = []
+    for item in ordering:
+        if not isinstance(item, str) or '__' in item or item == '?':
+            return None
+        descending = item.startswith('-')
+        name = item.lstrip('-')
+        field = opts.pk if name == 'pk' else next(
+            (field for field in opts.concrete_fields if name in (field.name, field.attname)), None
+        )
+        if field is None or field.null:
+            return None
+        fields.append((field, descending))
+        if field.primary_key:
+            break
+    else:
+        # Ties on the ordering columns are broken by the primary key
+        fields.append((opts.pk, fields[-1][1]))
+    return fields
+
+
+def encode_cursor(instance, ordering):
+    values = [field.value_to_string(instance) for field, _ in ordering]
+    return base64(CURSOR_PREFIX + json.dumps(values))
+
+
+def decode_cursor(cursor, ordering):
+    """Ordering values stored in a keyset cursor, or None for an offset cursor"""
+    decoded = unbase64(cursor)
+    if not decoded.startswith(CURSOR_PREFIX):
+        return None
+    try:
+        values = json.loads(decoded[len(CURSOR_PREFIX):])
+        if len(values) != len(ordering):
+            raise ValueError
+        return [field.to_python(value) for (field, _), value in zip(ordering, values)]
+    except Exception:
+        raise GraphQLError(f"Invalid cursor: {cursor}")
+
+
+def seek(ordering, values, forward=True):
+    """
+    Rows strictly after (``forward``) or before the row with ``values``.
+
+    Expands the row comparison into nested ORs, led by a non-strict bound on
+    the first column so the database can range-scan the index on it.
+    """
+    def lookup(field, descending, inclusive=False):
+        operator = 'lt' if descending == forward else 'gt'
+        return f'{field.attname}__{operator}{"e" if inclusive else ""}'
+
+    condition = None
+    for (field, descending), value in reversed(list(zip(ordering, values))):
+        step = Q(**{lookup(field, descending): value})
+        if condition is not None:
+            step |= Q(**{field.attname: value}) & condition
+        condition = step
+    first_field, first_descending = ordering[0]
+    return Q(**{lookup(first_field, first_descending, inclusive=True): values[0]}) & condition
+
+
+def reverse_ordering(ordering):
+    return [(field, not descending) for field, descending in ordering]
+
+
+def order_by(ordering):
+    return [f'{"-" if descending else ""}{field.attname}' for field, descending in ordering]
+
+
+def keyset_page(queryset, ordering, first=None, last=None, after=None, before=None):
+    """
+    Slice one page out of ``queryset`` ordered by ``ordering``.
+
+    Returns ``(nodes, has_previous_page, has_next_page)``. One row past the
+    page is fetched to tell whether another page follows; the opposite
+    direction is reported from the presence of the cursor, without a query.
+    """
+    queryset = queryset.order_by(*order_by(ordering))
+    if after is not None:
+        queryset = queryset.filter(seek(ordering, after))
+    if before is not None:
+        queryset = queryset.filter(seek(ordering, before, forward=False))
+
+    if last is not None and first is None:
+        reverse = queryset.order_by(*order_by(reverse_ordering(ordering)))
+        nodes = list(reverse[:last + 1])
+        has_previous = len(nodes) > last
+        nodes = nodes[:last][::-1]
+        return nodes, has_previous, before is not None
+
+    if first is None:
+        return list(queryset), after is not None, False
+    nodes = list(queryset[:first + 1])
+    has_next = len(nodes) > first
+    nodes = nodes[:first]
+    if last is not None and len(nodes) > last:
+        nodes = nodes[-last:]
+        return nodes, True, has_next
+    return nodes, after is not None, has_next
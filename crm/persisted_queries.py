@@ -0,0 +1,161 @@
+"""
+Automatic persisted queries and a cache of parsed, validated documents.
+
+Clients following the Apollo APQ protocol send
+``extensions.persistedQuery.sha256Hash`` instead of the query text. The
+first time a hash is unknown the server answers ``PersistedQueryNotFound``
+and the client retries with the text, which is stored in the Django cache
+under its hash so every worker can serve it afterwards.
+
+Independently of APQ, each worker keeps an LRU of parsed and validated
+documents keyed by the query hash, so hot queries skip both ``parse`` and
+``validate`` whether they arrive as text or as a hash.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from graphql import GraphQLError, parse, validate
+
+# Parsed documents kept per worker
+DOCUMENT_CACHE_SIZE = getattr(settings, 'CRM_DOCUMENT_CACHE_SIZE', 500)
+# Cache alias and timeout (None keeps entries until evicted) for APQ texts
+PERSISTED_QUERY_CACHE = getattr(settings, 'CRM_PERSISTED_QUERY_CACHE', 'default')
+PERSISTED_QUERY_TIMEOUT = getattr(settings, 'CRM_PERSISTED_QUERY_TIMEOUT', None)
+
+PERSISTED_QUERY_NOT_FOUND = 'PERSISTED_QUERY_NOT_FOUND'
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+class DocumentCache:
+    """Thread-safe LRU of ``(hash, rules) -> (document, validation errors, analysis)``"""
+
+    def __init__(self, maxsize=DOCUMENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class PersistedQueryStore:
+    """APQ hash -> query text, shared between workers through the Django cache"""
+
+    key_prefix = 'crm:apq:'
+
+    def __init__(self, alias=PERSISTED_QUERY_CACHE, timeout=PERSISTED_QUERY_TIMEOUT):
+        self.alias = alias
+        self.timeout = timeout
+        self.hits = self.misses = self.registrations = 0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, sha256):
+        query = self.cache.get(self.key_prefix + sha256)
+        if query is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return query
+
+    def register(self, sha256, query):
+        self.cache.set(self.key_prefix + sha256, query, self.timeout)
+        self.registrations += 1
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'registrations': self.registrations}
+
+
+document_cache = DocumentCache()
+persisted_queries = PersistedQueryStore()
+
+
+def persisted_query_hash(extensions):
+    """The APQ hash requested in ``extensions``, or None"""
+    persisted = (extensions or {}).get('persistedQuery') or {}
+    if persisted.get('version', 1) != 1:
+        raise GraphQLError("Unsupported persisted query version")
+    return persisted.get('sha256Hash')
+
+
+def load_document(schema, query, extensions=None, rules=None, max_errors=None, analyze=None):
+    """
+    Return ``(document, validation_errors, analysis)`` for a request's query
+    text and/or APQ ``extensions``, parsing and validating only on a cache
+    miss. ``analysis`` is ``analyze(schema, document)`` for valid documents,
+    cached along with them.
+
+    Raises GraphQLError for an unknown or mismatched hash and for syntax
+    errors.
+    """
+    sha256 = persisted_query_hash(extensions)
+    if sha256 is None:
+        if not query:
+            raise GraphQLError("Must provide query string.")
+        sha256 = query_hash(query)
+    elif query is not None:
+        if query_hash(query) != sha256:
+            raise GraphQLError("provided sha does not match query")
+        persisted_queries.register(sha256, query)
+
+    # Validation depends on the rule set, so views with different rules don't share entries
+    key = (sha256, tuple(rules) if rules is not None else None, analyze)
+    entry = document_cache.get(key)
+    if entry is not None:
+        return entry
+
+    if query is None:
+        query = persisted_queries.get(sha256)
+        if query is None:
+            raise GraphQLError(
+                "PersistedQueryNotFound", extensions={'code': PERSISTED_QUERY_NOT_FOUND}
+            )
+    document = parse(query)
+    errors = validate(schema, document, rules, max_errors)
+    analysis = analyze(schema, document) if analyze and not errors else None
+    entry = (document, errors, analysis)
+    document_cache.set(key, entry)
+    return entry
+
+
+def stats():
+    return {'documents': document_cache.stats(), 'persisted_queries': persisted_queries.stats()}
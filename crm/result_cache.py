@@ -0,0 +1,217 @@
+"""
+Resolver result cache.
+
+Single-object lookups and connection pages are stored in a Django cache
+(locmem unless ``CACHES`` points somewhere else, e.g. Redis) under keys that
+embed a generation token per model. Writes replace the token of the models
+they touch, which orphans every dependent entry at once; the orphans age out
+through the TTL. Signals cover ORM saves and deletes, and the services that
+write with ``update()``/``bulk_create()`` invalidate explicitly.
+
+``aget_instance`` and the other ``a``-prefixed functions are the async
+counterparts, going through Django's async ORM and cache API.
+
+Settings: ``CRM_RESULT_CACHE`` (cache alias, default ``'default'``) and
+``CRM_RESULT_CACHE_TIMEOUT`` (seconds, default 60; 0 disables caching).
+"""
+import hashlib
+import json
+import threading
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from graphene.utils.str_converters import to_snake_case
+from graphql import print_ast
+
+RESULT_CACHE = getattr(settings, 'CRM_RESULT_CACHE', 'default')
+RESULT_CACHE_TIMEOUT = getattr(settings, 'CRM_RESULT_CACHE_TIMEOUT', 60)
+
+KEY_PREFIX = 'crm:result:'
+
+_MISSING = object()
+
+
+class ResultCacheMetrics:
+    """Per-process counters; ``invalidations`` counts generation bumps per model"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.hits = self.misses = self.stores = 0
+        self.invalidations = Counter()
+
+    def record(self, name, label=None):
+        with self._lock:
+            if label is None:
+                setattr(self, name, getattr(self, name) + 1)
+            else:
+                self.invalidations[label] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'invalidations': dict(self.invalidations),
+            }
+
+
+metrics = ResultCacheMetrics()
+
+
+def get_cache():
+    return caches[RESULT_CACHE]
+
+
+def enabled():
+    return bool(RESULT_CACHE_TIMEOUT)
+
+
+def is_process_local():
+    """Whether invalidating here leaves other processes' cached results in place"""
+    return enabled() and isinstance(get_cache(), LocMemCache)
+
+
+def _generation_key(label):
+    return f'{KEY_PREFIX}gen:{label}'
+
+
+def generations(models):
+    """Current generation token of each model, creating missing ones"""
+    cache = get_cache()
+    keys = {_generation_key(model._meta.label_lower): model for model in models}
+    found = cache.get_many(list(keys))
+    for key in keys:
+        if key not in found:
+            # add() so concurrent first readers agree on a token
+            cache.add(key, uuid.uuid4().hex, None)
+            found[key] = cache.get(key)
+    return [found[key] for key in sorted(keys)]
+
+
+async def agenerations(models):
+    cache = get_cache()
+    keys = {_generation_key(model._meta.label_lower): model for model in models}
+    found = await cache.aget_many(list(keys))
+    for key in keys:
+        if key not in found:
+            await cache.aadd(key, uuid.uuid4().hex, None)
+            found[key] = await cache.aget(key)
+    return [found[key] for key in sorted(keys)]
+
+
+def _bump(labels):
+    cache = get_cache()
+    cache.set_many({_generation_key(label): uuid.uuid4().hex for label in labels}, None)
+    for label in labels:
+        metrics.record('invalidations', label)
+
+
+def invalidate(*models):
+    """
+    Orphan every cached result depending on ``models``.
+
+    Bumps immediately, so the writing transaction reads its own writes, and
+    again on commit, so entries cached by concurrent readers from the
+    pre-commit state don't outlive it.
+    """
+    labels = sorted({model._meta.label_lower for model in models})
+    if not labels:
+        return
+    _bump(labels)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(labels))
+
+
+def _key(kind, tokens, parts):
+    digest = hashlib.sha256(
+        json.dumps([tokens, *parts], sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return f'{KEY_PREFIX}{kind}:{digest}'
+
+
+def make_key(kind, models, *parts):
+    return _key(kind, generations(models), parts)
+
+
+async def amake_key(kind, models, *parts):
+    return _key(kind, await agenerations(models), parts)
+
+
+def get_or_set(key, compute):
+    cache = get_cache()
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        metrics.record('hits')
+        return value
+    metrics.record('misses')
+    value = compute()
+    cache.set(key, value, RESULT_CACHE_TIMEOUT)
+    metrics.record('stores')
+    return value
+
+
+async def aget_or_set(key, compute):
+    """get_or_set() awaiting ``compute()``"""
+    cache = get_cache()
+    value = await cache.aget(key, _MISSING)
+    if value is not _MISSING:
+        metrics.record('hits')
+        return value
+    metrics.record('misses')
+    value = await compute()
+    await cache.aset(key, value, RESULT_CACHE_TIMEOUT)
+    metrics.record('stores')
+    return value
+
+
+def get_instance(model, pk):
+    """``model.objects.get(pk=pk)`` through the cache; None if it doesn't exist"""
+    def fetch():
+        try:
+            return model._default_manager.get(pk=pk)
+        except model.DoesNotExist:
+            return None
+
+    if not enabled():
+        return fetch()
+    return get_or_set(make_key('object', [model], model._meta.label_lower, str(pk)), fetch)
+
+
+async def aget_instance(model, pk):
+    """get_instance() through the async ORM"""
+    async def fetch():
+        try:
+            return await model._default_manager.aget(pk=pk)
+        except model.DoesNotExist:
+            return None
+
+    if not enabled():
+        return await fetch()
+    key = await amake_key('object', [model], model._meta.label_lower, str(pk))
+    return await aget_or_set(key, fetch)
+
+
+def normalize_arguments(args):
+    """Argument names in snake_case with unset values dropped, as a sorted list"""
+    return sorted((to_snake_case(name), value) for name, value in args.items() if value is not None)
+
+
+def selection_fingerprint(info):
+    """
+    What shapes a field's result besides its arguments: the sub-selection,
+    the fragments it may spread and the variables nested arguments may use
+    """
+    fragments = sorted(info.fragments.values(), key=lambda fragment: fragment.name.value)
+    return [
+        [print_ast(node.selection_set) for node in info.field_nodes if node.selection_set],
+        [print_ast(fragment) for fragment in fragments],
+        sorted(info.variable_values.items()),
+    ]
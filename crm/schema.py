@@ -1,37 +1,82 @@
 import graphene
-from graphene_django import DjangoObjectType, DjangoFilterConnectionField
-from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django import DjangoObjectType
 from django.db import transaction
+from django.utils import timezone
 from django.core.exceptions import ValidationError
 from decimal import Decimal
 import re
-from .models import Customer, Product, Order
+from collections import Counter
+from .models import Customer, Job, Product, Order, OrderItem
 from .filters import CustomerFilter, ProductFilter, OrderFilter
+from .fields import KeysetConnectionField, OptimizedConnectionField
+from . import events, jobs, result_cache
+from .async_execution import async_resolver, is_async
+from .loaders import get_loaders
+from .pagination import CountableConnection
+from .services import (
+    LOW_STOCK_THRESHOLD, RESTOCK_INCREMENT, InsufficientStock,
+    add_order_lines, reserve_stock, restock_low_stock_products,
+)
+
+PHONE_REGEX = re.compile(r'^\+?1?\d{9,15}$|^\d{3}-\d{3}-\d{4}$')
+
+# Rows per email lookup / INSERT in BulkCreateCustomers and BulkCreateOrders;
+# keeps each statement under SQLite's bound-parameter limit
+BULK_CREATE_BATCH_SIZE = 500
+
+# Largest allCustomers page; full dumps go through the streaming export
+CUSTOMER_PAGE_MAX = 100
 
 # GraphQL Types
 class CustomerType(DjangoObjectType):
+    orders = OptimizedConnectionField(lambda: OrderType, loader='customer_orders', required=True)
+
     class Meta:
         model = Customer
-        fields = ("id", "name", "email", "phone")
+        fields = ("id", "name", "email", "phone", "orders")
         filter_fields = {
             'name': ['exact', 'icontains'],
             'email': ['exact', 'icontains'],
             'created_at': ['exact', 'gte', 'lte'],
         }
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
 
 class ProductType(DjangoObjectType):
+    orders = OptimizedConnectionField(lambda: OrderType, loader='product_orders', required=True)
+
     class Meta:
         model = Product
-        fields = "__all__"
+        fields = ("id", "name", "price", "stock", "created_at", "updated_at", "orders")
         filter_fields = {
             'name': ['exact', 'icontains'],
             'price': ['exact', 'gte', 'lte'],
             'stock': ['exact', 'gte', 'lte'],
         }
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
+
+class OrderItemType(DjangoObjectType):
+    line_total = graphene.Decimal(required=True)
+
+    class Meta:
+        model = OrderItem
+        fields = ("id", "product", "quantity", "unit_price")
+
+    @async_resolver
+    def resolve_product(self, info):
+        if OrderItem.product.is_cached(self):
+            return self.product
+        return get_loaders(info).product.resolve(info, self.product_id)
+
+    @async_resolver
+    def resolve_line_total(self, info):
+        return self.line_total
 
 class OrderType(DjangoObjectType):
+    products = OptimizedConnectionField(ProductType, loader='order_products', required=True)
+    items = graphene.List(graphene.NonNull(OrderItemType), required=True)
+
     class Meta:
         model = Order
         fields = "__all__"
@@ -41,6 +86,19 @@ class OrderType(DjangoObjectType):
             'customer__name': ['icontains'],
         }
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
+
+    @async_resolver
+    def resolve_customer(self, info):
+        if Order.customer.is_cached(self):
+            return self.customer
+        return get_loaders(info).customer.resolve(info, self.customer_id)
+
+    @async_resolver
+    def resolve_items(self, info):
+        if 'items' in getattr(self, '_prefetched_objects_cache', {}):
+            return self.items.all()
+        return get_loaders(info).order_items.resolve(info, self.pk)
 
 # Input Types
 class CustomerInput(graphene.InputObjectType):
@@ -53,9 +111,15 @@ class ProductInput(graphene.InputObjectType):
     price = graphene.Decimal(required=True)
     stock = graphene.Int()
 
+class OrderItemInput(graphene.InputObjectType):
+    product_id = graphene.ID(required=True)
+    quantity = graphene.Int(default_value=1)
+
 class OrderInput(graphene.InputObjectType):
     customer_id = graphene.ID(required=True)
-    product_ids = graphene.List(graphene.ID, required=True)
+    # Repeating an ID orders that product more than once
+    product_ids = graphene.List(graphene.ID)
+    items = graphene.List(OrderItemInput)
     order_date = graphene.DateTime()
 
 # Mutation Response Types
@@ -69,6 +133,7 @@ class BulkCustomerMutationResponse(graphene.ObjectType):
     customers = graphene.List(CustomerType)
     errors = graphene.List(graphene.String)
     success = graphene.Boolean()
+    job = graphene.Field(lambda: JobType, description="Set when run with background: true")
 
 class ProductMutationResponse(graphene.ObjectType):
     product = graphene.Field(ProductType)
@@ -82,11 +147,70 @@ class OrderMutationResponse(graphene.ObjectType):
     success = graphene.Boolean()
     errors = graphene.List(graphene.String)
 
+class BulkOrderMutationResponse(graphene.ObjectType):
+    orders = graphene.List(OrderType)
+    errors = graphene.List(graphene.String)
+    success = graphene.Boolean()
+
 class UpdateLowStockProductsResponse(graphene.ObjectType):
     updated_products = graphene.List(ProductType)
     message = graphene.String()
     success = graphene.Boolean()
     errors = graphene.List(graphene.String)
+    job = graphene.Field(lambda: JobType, description="Set when run with background: true")
+
+# Background Job Types
+JobStatus = graphene.Enum('JobStatus', [(value.upper(), value) for value, _ in Job.STATUS_CHOICES])
+
+class JobResult(graphene.Union):
+    """The response a background mutation would have returned"""
+    class Meta:
+        types = (BulkCustomerMutationResponse, UpdateLowStockProductsResponse)
+
+class JobType(DjangoObjectType):
+    status = JobStatus(required=True)
+    progress = graphene.Float(description="Fraction of the work done, when the total is known")
+    throughput = graphene.Float(description="Items processed per second since the job started")
+    result = graphene.Field(JobResult, description="Set once the job has succeeded")
+
+    class Meta:
+        model = Job
+        fields = (
+            'id', 'kind', 'status', 'error', 'processed', 'total', 'created_at', 'started_at',
+            'finished_at',
+        )
+
+    def resolve_progress(self, info):
+        if not self.total:
+            return 1.0 if self.status == Job.SUCCEEDED else None
+        return self.processed / self.total
+
+    def resolve_throughput(self, info):
+        if self.started_at is None:
+            return None
+        elapsed = ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+        return self.processed / elapsed if elapsed > 0 else None
+
+    def resolve_result(self, info):
+        if self.status != Job.SUCCEEDED:
+            return None
+        return JOB_RESULTS[self.kind](self.result)
+
+def in_order(model, ids):
+    objects = model.objects.in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
+
+# Job kind -> response built from the task's JSON result
+JOB_RESULTS = {
+    'bulk_create_customers': lambda result: BulkCustomerMutationResponse(
+        customers=in_order(Customer, result['customers']), errors=result['errors'],
+        success=result['success'],
+    ),
+    'update_low_stock_products': lambda result: UpdateLowStockProductsResponse(
+        updated_products=in_order(Product, result['updated_products']), message=result['message'],
+        success=result['success'], errors=result['errors'],
+    ),
+}
 
 # Mutations
 class CreateCustomer(graphene.Mutation):
@@ -106,8 +230,7 @@ class CreateCustomer(graphene.Mutation):
 
             # Validate phone format if provided
             if input.phone:
-                phone_pattern = r'^\+?1?\d{9,15}$|^\d{3}-\d{3}-\d{4}$'
-                if not re.match(phone_pattern, input.phone):
+                if not PHONE_REGEX.match(input.phone):
                     return CustomerMutationResponse(
                         success=False,
                         errors=["Invalid phone format. Use +1234567890 or 123-456-7890"]
@@ -134,44 +257,20 @@ class CreateCustomer(graphene.Mutation):
 class BulkCreateCustomers(graphene.Mutation):
     class Arguments:
         input = graphene.List(CustomerInput, required=True)
+        background = graphene.Boolean(
+            default_value=False, description="Return a queued job instead of waiting for the result",
+        )
 
     Output = BulkCustomerMutationResponse
 
-    def mutate(self, info, input):
-        created_customers = []
-        errors = []
-        
+    def mutate(self, info, input, background=False):
+        if background:
+            job = jobs.enqueue('bulk_create_customers', total=len(input), input=input)
+            return BulkCustomerMutationResponse(customers=[], errors=[], success=True, job=job)
+
         try:
             with transaction.atomic():
-                for i, customer_data in enumerate(input):
-                    try:
-                        # Validate email uniqueness
-                        if Customer.objects.filter(email=customer_data.email).exists():
-                            errors.append(f"Customer {i+1}: Email already exists")
-                            continue
-
-                        # Validate phone format if provided
-                        if customer_data.phone:
-                            phone_pattern = r'^\+?1?\d{9,15}$|^\d{3}-\d{3}-\d{4}$'
-                            if not re.match(phone_pattern, customer_data.phone):
-                                errors.append(f"Customer {i+1}: Invalid phone format")
-                                continue
-
-                        customer = Customer.objects.create(
-                            name=customer_data.name,
-                            email=customer_data.email,
-                            phone=customer_data.phone
-                        )
-                        created_customers.append(customer)
-
-                    except Exception as e:
-                        errors.append(f"Customer {i+1}: {str(e)}")
-
-                return BulkCustomerMutationResponse(
-                    customers=created_customers,
-                    errors=errors,
-                    success=len(created_customers) > 0
-                )
+                return BulkCreateCustomers.create(input)
 
         except Exception as e:
             return BulkCustomerMutationResponse(
@@ -180,6 +279,63 @@ class BulkCreateCustomers(graphene.Mutation):
                 success=False
             )
 
+    @staticmethod
+    def create(rows, progress=None):
+        """
+        Create customers from ``rows`` a batch at a time. Outside a transaction
+        (in a background job) each batch commits on its own.
+        """
+        created_customers = []
+        errors = []
+        for start in range(0, len(rows), BULK_CREATE_BATCH_SIZE):
+            batch = rows[start:start + BULK_CREATE_BATCH_SIZE]
+            with transaction.atomic():
+                customers = BulkCreateCustomers.validate_batch(batch, start, errors)
+                created_customers.extend(
+                    Customer.objects.bulk_create(customers, batch_size=BULK_CREATE_BATCH_SIZE)
+                )
+                # bulk_create sends no post_save
+                result_cache.invalidate(Customer)
+            if progress:
+                progress.advance(len(batch))
+
+        return BulkCustomerMutationResponse(
+            customers=created_customers,
+            errors=errors,
+            success=len(created_customers) > 0
+        )
+
+    @staticmethod
+    def validate_batch(batch, offset, errors):
+        """
+        Validate a slice of the input and return unsaved Customers for the valid rows.
+        Emails already in the database are found with one query per batch.
+        """
+        existing_emails = set(
+            Customer.objects.filter(email__in=[row.email for row in batch])
+            .values_list('email', flat=True)
+        )
+
+        customers = []
+        for i, customer_data in enumerate(batch, start=offset):
+            # Validate email uniqueness, including earlier rows of this request
+            if customer_data.email in existing_emails:
+                errors.append(f"Customer {i+1}: Email already exists")
+                continue
+
+            # Validate phone format if provided
+            if customer_data.phone and not PHONE_REGEX.match(customer_data.phone):
+                errors.append(f"Customer {i+1}: Invalid phone format")
+                continue
+
+            existing_emails.add(customer_data.email)
+            customers.append(Customer(
+                name=customer_data.name,
+                email=customer_data.email,
+                phone=customer_data.phone
+            ))
+        return customers
+
 class CreateProduct(graphene.Mutation):
     class Arguments:
         input = ProductInput(required=True)
@@ -221,6 +377,23 @@ class CreateProduct(graphene.Mutation):
                 errors=[str(e)]
             )
 
+def order_quantities(order_input):
+    """Product pk -> quantity for an OrderInput; invalid lines raise ValueError with the error message"""
+    quantities = Counter()
+    try:
+        for product_id in order_input.product_ids or []:
+            quantities[int(product_id)] += 1
+        for item in order_input.items or []:
+            quantities[int(item.product_id)] += item.quantity
+    except (TypeError, ValueError):
+        raise ValueError("One or more invalid product IDs") from None
+
+    if not quantities:
+        raise ValueError("At least one product must be selected")
+    if any(quantity <= 0 for quantity in quantities.values()):
+        raise ValueError("Quantity must be positive")
+    return quantities
+
 class CreateOrder(graphene.Mutation):
     class Arguments:
         input = OrderInput(required=True)
@@ -239,30 +412,39 @@ class CreateOrder(graphene.Mutation):
                 )
 
             # Validate products exist
-            if not input.product_ids:
+            try:
+                quantities = order_quantities(input)
+            except ValueError as e:
                 return OrderMutationResponse(
                     success=False,
-                    errors=["At least one product must be selected"]
+                    errors=[str(e)]
                 )
 
-            products = Product.objects.filter(id__in=input.product_ids)
-            if len(products) != len(input.product_ids):
-                return OrderMutationResponse(
-                    success=False,
-                    errors=["One or more invalid product IDs"]
+            with transaction.atomic():
+                # Lock the product rows (in pk order) for the stock check
+                products = (
+                    Product.objects.select_for_update().order_by('pk')
+                    .in_bulk(list(quantities))
                 )
+                if len(products) != len(quantities):
+                    return OrderMutationResponse(
+                        success=False,
+                        errors=["One or more invalid product IDs"]
+                    )
 
-            # Create order
-            order = Order.objects.create(
-                customer=customer,
-                order_date=input.order_date
-            )
+                reserve_stock(products, quantities)
 
-            # Add products and calculate total
-            order.products.set(products)
-            total_amount = sum(product.price for product in products)
-            order.total_amount = total_amount
-            order.save()
+                # Create order
+                order = Order.objects.create(
+                    customer=customer,
+                    order_date=input.order_date
+                )
+
+                # Add lines at current prices; this also stores the total
+                add_order_lines(order, [
+                    (products[product_id], quantity)
+                    for product_id, quantity in quantities.items()
+                ])
 
             return OrderMutationResponse(
                 order=order,
@@ -270,41 +452,162 @@ class CreateOrder(graphene.Mutation):
                 success=True
             )
 
+        except InsufficientStock as e:
+            return OrderMutationResponse(
+                success=False,
+                errors=[str(e)]
+            )
+
         except Exception as e:
             return OrderMutationResponse(
                 success=False,
                 errors=[str(e)]
             )
 
+class BulkCreateOrders(graphene.Mutation):
+    """
+    Create many orders in one request (e.g. a point-of-sale sync). Customers
+    and products are looked up once for the whole batch, totals are computed
+    from the fetched prices, and orders and lines are inserted with
+    bulk_create. Invalid orders are reported in ``errors`` and skipped.
+    """
+    class Arguments:
+        input = graphene.List(OrderInput, required=True)
+
+    Output = BulkOrderMutationResponse
+
+    def mutate(self, info, input):
+        try:
+            with transaction.atomic():
+                return BulkCreateOrders.create(input)
+
+        except Exception as e:
+            return BulkOrderMutationResponse(
+                orders=[],
+                errors=[str(e)],
+                success=False
+            )
+
+    @staticmethod
+    def create(rows):
+        # (position, message), reported in input order
+        errors = []
+        parsed = []
+        for i, order_data in enumerate(rows, start=1):
+            try:
+                customer_id = int(order_data.customer_id)
+            except ValueError:
+                errors.append((i, "Invalid customer ID"))
+                continue
+            try:
+                quantities = order_quantities(order_data)
+            except ValueError as e:
+                errors.append((i, str(e)))
+                continue
+            parsed.append((i, order_data, customer_id, quantities))
+
+        customer_ids = set(
+            Customer.objects.only('pk').in_bulk({customer_id for _, _, customer_id, _ in parsed})
+        )
+        # Lock the product rows (in pk order) for the stock check
+        products = Product.objects.select_for_update().order_by('pk').in_bulk(
+            {product_id for *_, quantities in parsed for product_id in quantities}
+        )
+
+        # Units taken by earlier orders of this batch
+        reserved = Counter()
+        orders = []
+        items = []
+        for i, order_data, customer_id, quantities in parsed:
+            if customer_id not in customer_ids:
+                errors.append((i, "Invalid customer ID"))
+                continue
+            if any(product_id not in products for product_id in quantities):
+                errors.append((i, "One or more invalid product IDs"))
+                continue
+            short = [
+                products[product_id] for product_id, quantity in quantities.items()
+                if products[product_id].stock - reserved[product_id] < quantity
+            ]
+            if short:
+                errors.append((i, str(InsufficientStock(short))))
+                continue
+
+            reserved.update(quantities)
+            order = Order(
+                customer_id=customer_id,
+                order_date=order_data.order_date,
+                total_amount=sum(
+                    (products[product_id].price * quantity for product_id, quantity in quantities.items()),
+                    Decimal('0.00'),
+                ),
+            )
+            orders.append(order)
+            items.extend(
+                OrderItem(order=order, product_id=product_id, quantity=quantity,
+                          unit_price=products[product_id].price)
+                for product_id, quantity in quantities.items()
+            )
+
+        if orders:
+            reserve_stock(products, reserved)
+            Order.objects.bulk_create(orders, batch_size=BULK_CREATE_BATCH_SIZE)
+            OrderItem.objects.bulk_create(items, batch_size=BULK_CREATE_BATCH_SIZE)
+            # bulk_create sends no post_save
+            result_cache.invalidate(Order, OrderItem)
+            for order in orders:
+                events.publish(events.ORDER_CREATED, {'order_id': order.pk})
+
+        return BulkOrderMutationResponse(
+            orders=orders,
+            errors=[f"Order {i}: {message}" for i, message in sorted(errors)],
+            success=len(orders) > 0
+        )
+
 class UpdateLowStockProducts(graphene.Mutation):
     """
-    Mutation to update low-stock products (stock < 10) by incrementing their stock by 10.
+    Mutation to update low-stock products (stock < threshold, default 10) by
+    incrementing their stock (default 10) in a single UPDATE statement.
     Returns a list of updated products and a success message.
     """
+    class Arguments:
+        threshold = graphene.Int(default_value=LOW_STOCK_THRESHOLD)
+        increment = graphene.Int(default_value=RESTOCK_INCREMENT)
+        background = graphene.Boolean(
+            default_value=False, description="Return a queued job instead of waiting for the result",
+        )
+
     Output = UpdateLowStockProductsResponse
 
-    def mutate(self, info):
+    def mutate(self, info, threshold=LOW_STOCK_THRESHOLD, increment=RESTOCK_INCREMENT, background=False):
+        if background:
+            job = jobs.enqueue('update_low_stock_products', threshold=threshold, increment=increment)
+            return UpdateLowStockProductsResponse(
+                updated_products=[], message="Queued", success=True, errors=[], job=job,
+            )
+        return UpdateLowStockProducts.restock(threshold, increment)
+
+    @staticmethod
+    def restock(threshold, increment):
         try:
-            # Query products with stock < 10
-            low_stock_products = Product.objects.filter(stock__lt=10)
-            
-            if not low_stock_products.exists():
+            if threshold < 0 or increment <= 0:
+                return UpdateLowStockProductsResponse(
+                    updated_products=[],
+                    message="Failed to update low stock products",
+                    success=False,
+                    errors=["Threshold cannot be negative and increment must be positive"]
+                )
+
+            updated_products = restock_low_stock_products(threshold, increment)
+
+            if not updated_products:
                 return UpdateLowStockProductsResponse(
                     updated_products=[],
                     message="No products with low stock found",
                     success=True,
                     errors=[]
                 )
-            
-            updated_products = []
-            
-            # Update each low stock product by incrementing stock by 10
-            with transaction.atomic():
-                for product in low_stock_products:
-                    product.stock += 10
-                    product.save()
-                    updated_products.append(product)
-            
+
             return UpdateLowStockProductsResponse(
                 updated_products=updated_products,
                 message=f"Successfully updated {len(updated_products)} products with low stock",
@@ -320,42 +623,74 @@ class UpdateLowStockProducts(graphene.Mutation):
                 errors=[str(e)]
             )
 
+# Background tasks (crm.jobs)
+@jobs.task('bulk_create_customers')
+def bulk_create_customers_job(progress, input):
+    rows = [CustomerInput._meta.container(row) for row in input]
+    progress.start(len(rows))
+    response = BulkCreateCustomers.create(rows, progress)
+    return {
+        'customers': [customer.pk for customer in response.customers],
+        'errors': response.errors,
+        'success': response.success,
+    }
+
+@jobs.task('update_low_stock_products')
+def update_low_stock_products_job(progress, threshold, increment):
+    response = UpdateLowStockProducts.restock(threshold, increment)
+    progress.start(len(response.updated_products))
+    progress.advance(len(response.updated_products))
+    return {
+        'updated_products': [product.pk for product in response.updated_products],
+        'message': response.message,
+        'success': response.success,
+        'errors': response.errors,
+    }
+
+def get_instance(info, model, id):
+    """A cached object by id, as an awaitable when executing asynchronously"""
+    if is_async(info):
+        return result_cache.aget_instance(model, id)
+    return result_cache.get_instance(model, id)
+
 # Query Class
 class Query(graphene.ObjectType):
     hello = graphene.String()
     
     # Basic queries
-    all_customers = graphene.List(CustomerType)
-    all_products = DjangoFilterConnectionField(ProductType, filterset_class=ProductFilter)
-    all_orders = DjangoFilterConnectionField(OrderType, filterset_class=OrderFilter)
+    all_customers = KeysetConnectionField(
+        CustomerType, filterset_class=CustomerFilter, max_limit=CUSTOMER_PAGE_MAX
+    )
+    all_products = KeysetConnectionField(ProductType, filterset_class=ProductFilter, cache=True)
+    all_orders = KeysetConnectionField(OrderType, filterset_class=OrderFilter)
     
     # Single object queries
     customer = graphene.Field(CustomerType, id=graphene.ID())
     product = graphene.Field(ProductType, id=graphene.ID())
     order = graphene.Field(OrderType, id=graphene.ID())
+    job = graphene.Field(JobType, id=graphene.ID(required=True))
 
+    @async_resolver
     def resolve_hello(self, info):
         return "Hello, GraphQL!"
 
-    def resolve_all_customers(self, info):
-        return Customer.objects.all()
-
+    @async_resolver
     def resolve_customer(self, info, id):
-        try:
-            return Customer.objects.get(pk=id)
-        except Customer.DoesNotExist:
-            return None
+        return get_instance(info, Customer, id)
 
+    @async_resolver
     def resolve_product(self, info, id):
-        try:
-            return Product.objects.get(pk=id)
-        except Product.DoesNotExist:
-            return None
+        return get_instance(info, Product, id)
 
+    @async_resolver
     def resolve_order(self, info, id):
+        return get_instance(info, Order, id)
+
+    def resolve_job(self, info, id):
+        # Progress changes under the cache, so jobs are always read afresh
         try:
-            return Order.objects.get(pk=id)
-        except Order.DoesNotExist:
+            return Job.objects.filter(pk=id).first()
+        except ValidationError:
             return None
 
 # Mutation Class
@@ -364,7 +699,40 @@ class Mutation(graphene.ObjectType):
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
     create_order = CreateOrder.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
     update_low_stock_products = UpdateLowStockProducts.Field()
 
+# Subscription Class
+class Subscription(graphene.ObjectType):
+    """Pushed over WebSocket by crm.subscriptions as crm.events are published"""
+    order_created = graphene.Field(OrderType, required=True)
+    stock_changed = graphene.Field(ProductType, product_id=graphene.ID(required=True), required=True)
+    low_stock = graphene.Field(
+        ProductType, threshold=graphene.Int(default_value=LOW_STOCK_THRESHOLD), required=True,
+        description="Products whose stock drops below the threshold",
+    )
+
+    async def subscribe_order_created(root, info):
+        async for message in events.listen(info, events.ORDER_CREATED):
+            order = await result_cache.aget_instance(Order, message['order_id'])
+            if order is not None:
+                yield order
+
+    async def subscribe_stock_changed(root, info, product_id):
+        async for message in events.listen(info, events.STOCK_CHANGED):
+            if str(message['product_id']) != str(product_id):
+                continue
+            product = await result_cache.aget_instance(Product, message['product_id'])
+            if product is not None:
+                yield product
+
+    async def subscribe_low_stock(root, info, threshold):
+        async for message in events.listen(info, events.STOCK_CHANGED):
+            if not events.crossed_below(message, threshold):
+                continue
+            product = await result_cache.aget_instance(Product, message['product_id'])
+            if product is not None:
+                yield product
+
 # Schema
-schema = graphene.Schema(query=Query, mutation=Mutation)
+schema = graphene.Schema(query=Query, mutation=Mutation, subscription=Subscription)
@@ -0,0 +1,182 @@
+"""
+Pluggable text search for the CRM filters.
+
+``contains`` replaces ``icontains`` lookups (same substring semantics) and
+``search`` returns rows ranked by relevance under a ``search_rank``
+annotation, higher is better. The backend is picked from the database
+engine, or from the ``CRM_SEARCH_BACKEND`` setting (a dotted path):
+
+* SQLite: FTS5 trigram tables kept in sync by triggers (migration 0004)
+* PostgreSQL: ``pg_trgm`` word similarity, with GIN trigram indexes
+  serving ``icontains``
+* anything else: plain ``icontains``
+"""
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, FloatField, Func, OuterRef, Q, Subquery, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Customer, Product
+
+# Columns indexed for search, per model
+SEARCH_FIELDS = {
+    Customer: ('name', 'email'),
+    Product: ('name',),
+}
+
+
+def split_lookup(model, lookup):
+    """'customer__name' -> ('customer', Customer, 'name', many) for a lookup on ``model``"""
+    if '__' not in lookup:
+        return None, model, lookup, False
+    relation, field_name = lookup.rsplit('__', 1)
+    many = False
+    for part in relation.split('__'):
+        field = model._meta.get_field(part)
+        many = many or field.many_to_many or field.one_to_many
+        model = field.related_model
+    return relation, model, field_name, many
+
+
+class SearchBackend:
+    """Fallback backend built on ``icontains``"""
+
+    def matching(self, model, fields, value):
+        """Rows of ``model`` where any of ``fields`` contains ``value``"""
+        lookups = [Q(**{f'{field}__icontains': value}) for field in fields]
+        return model._default_manager.filter(reduce(or_, lookups))
+
+    def rank_expression(self, model, fields, query):
+        """Relevance of a ``model`` row for ``query``; higher is better"""
+        whens = [When(**{f'{field}__iexact': query}, then=Value(3.0)) for field in fields]
+        whens += [When(**{f'{field}__istartswith': query}, then=Value(2.0)) for field in fields]
+        return Case(*whens, default=Value(1.0), output_field=FloatField())
+
+    def contains(self, queryset, lookup, value):
+        """Equivalent of ``queryset.filter(**{lookup + '__icontains': value})``"""
+        relation, model, field_name, many = split_lookup(queryset.model, lookup)
+        matches = self.matching(model, [field_name], value).values('pk')
+        if relation is None:
+            return queryset.filter(pk__in=matches)
+        if many:
+            # Go through a subquery so multi-valued joins don't duplicate rows
+            owners = queryset.model._default_manager.filter(**{f'{relation}__in': matches})
+            return queryset.filter(pk__in=owners.values('pk'))
+        return queryset.filter(**{f'{relation}__in': matches})
+
+    def search(self, queryset, query, relation=None):
+        """
+        Filter ``queryset`` to rows matching ``query`` and order them by rank.
+        With ``relation`` (e.g. 'customer') rows are matched and ranked by
+        the related row instead.
+        """
+        if relation is None:
+            model = queryset.model
+            fields = SEARCH_FIELDS[model]
+            queryset = queryset.filter(
+                pk__in=self.matching(model, fields, query).values('pk')
+            ).annotate(search_rank=self.rank_expression(model, fields, query))
+        else:
+            model = queryset.model._meta.get_field(relation).related_model
+            fields = SEARCH_FIELDS[model]
+            ranked = self.matching(model, fields, query).annotate(
+                search_rank=self.rank_expression(model, fields, query)
+            )
+            queryset = queryset.filter(**{f'{relation}__in': ranked.values('pk')}).annotate(
+                search_rank=Subquery(
+                    ranked.filter(pk=OuterRef(relation)).values('search_rank')[:1],
+                    output_field=FloatField(),
+                )
+            )
+        return queryset.order_by('-search_rank', 'pk')
+
+
+class FTSRank(Func):
+    """bm25 rank of the row's FTS entry, negated so higher is better"""
+    output_field = FloatField()
+
+    def __init__(self, table, match, expression='pk'):
+        self.table = table
+        self.match = match
+        super().__init__(expression)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # Compiling the pk keeps the correlation valid when Django re-aliases
+        # the outer table inside a subquery
+        pk_sql, pk_params = compiler.compile(self.source_expressions[0])
+        sql = f'(SELECT -rank FROM "{self.table}" WHERE "{self.table}" MATCH %s AND rowid = {pk_sql})'
+        return sql, (self.match, *pk_params)
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """FTS5 tables with the trigram tokenizer, which matches arbitrary substrings"""
+    # Trigrams can't match queries shorter than three characters
+    MIN_QUERY_LENGTH = 3
+
+    @staticmethod
+    def fts_table(model):
+        return f'{model._meta.db_table}_fts'
+
+    @staticmethod
+    def match_expression(fields, value):
+        phrase = '"' + value.replace('"', '""') + '"'
+        return '{' + ' '.join(fields) + '} : ' + phrase
+
+    def indexed(self, model, fields, value):
+        return (
+            len(value) >= self.MIN_QUERY_LENGTH
+            and set(fields) <= set(SEARCH_FIELDS.get(model, ()))
+        )
+
+    def matching(self, model, fields, value):
+        if not self.indexed(model, fields, value):
+            return super().matching(model, fields, value)
+        table = self.fts_table(model)
+        return model._default_manager.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM "{table}" WHERE "{table}" MATCH %s',
+            [self.match_expression(fields, value)],
+        ))
+
+    def rank_expression(self, model, fields, query):
+        if not self.indexed(model, fields, query):
+            return super().rank_expression(model, fields, query)
+        return FTSRank(self.fts_table(model), self.match_expression(fields, query))
+
+
+class PostgresTrigramBackend(SearchBackend):
+    """``icontains`` uses the GIN trigram indexes; ranking uses word similarity"""
+
+    def rank_expression(self, model, fields, query):
+        from django.contrib.postgres.search import TrigramWordSimilarity
+        from django.db.models.functions import Greatest
+
+        similarities = [TrigramWordSimilarity(query, field) for field in fields]
+        return similarities[0] if len(similarities) == 1 else Greatest(*similarities)
+
+
+_backend = None
+
+
+def sqlite_fts_available():
+    tables = connection.introspection.table_names()
+    return all(SQLiteFTSBackend.fts_table(model) in tables for model in SEARCH_FIELDS)
+
+
+def get_search_backend():
+    """Return the configured search backend, chosen once per process"""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'CRM_SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor == 'postgresql':
+            _backend = PostgresTrigramBackend()
+        elif connection.vendor == 'sqlite' and sqlite_fts_available():
+            _backend = SQLiteFTSBackend()
+        else:
+            _backend = SearchBackend()
+    return _backend
@@ -0,0 +1,193 @@
+"""
+Set-based write operations shared by the GraphQL mutations and scheduled jobs.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import (
+    Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import events, result_cache
+from .models import Product, Order, OrderItem
+
+LOW_STOCK_THRESHOLD = 10
+RESTOCK_INCREMENT = 10
+
+
+class InsufficientStock(Exception):
+    """Raised by reserve_stock when a product can't cover the requested quantity"""
+
+    def __init__(self, products):
+        self.products = products
+        names = ", ".join(sorted(product.name for product in products))
+        super().__init__(f"Insufficient stock for: {names}")
+
+
+def supports_update_returning():
+    """Whether the default database accepts ``UPDATE ... RETURNING``"""
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return False
+
+
+def restock_low_stock_products(threshold=LOW_STOCK_THRESHOLD, increment=RESTOCK_INCREMENT):
+    """
+    Add ``increment`` to the stock of every product with stock below ``threshold``.
+
+    Runs a single ``UPDATE ... SET stock = stock + increment`` and returns the
+    updated products, ordered by name. Uses ``RETURNING`` where the backend
+    supports it, otherwise locks and reads the affected rows once first.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        if supports_update_returning():
+            products = _restock_returning(threshold, increment, now)
+        else:
+            products = list(
+                Product.objects.select_for_update().filter(stock__lt=threshold)
+            )
+            Product.objects.filter(pk__in=[p.pk for p in products]).update(
+                stock=F('stock') + increment, updated_at=now
+            )
+            for product in products:
+                product.stock += increment
+                product.updated_at = now
+        if products:
+            result_cache.invalidate(Product)
+            events.publish_stock(products, {product.pk: product.stock - increment for product in products})
+
+    products.sort(key=lambda product: (product.name, product.pk))
+    return products
+
+
+def _restock_returning(threshold, increment, now):
+    fields = Product._meta.concrete_fields
+    qn = connection.ops.quote_name
+    stock = qn(Product._meta.get_field('stock').column)
+    updated_at = qn(Product._meta.get_field('updated_at').column)
+    sql = (
+        f"UPDATE {qn(Product._meta.db_table)} "
+        f"SET {stock} = {stock} + %s, {updated_at} = %s "
+        f"WHERE {stock} < %s "
+        f"RETURNING {', '.join(qn(field.column) for field in fields)}"
+    )
+    updated_at_value = Product._meta.get_field('updated_at').get_db_prep_value(
+        now, connection
+    )
+    field_names = [field.attname for field in fields]
+    columns = [field.get_col(Product._meta.db_table) for field in fields]
+    converters = [
+        connection.ops.get_db_converters(col) + col.field.get_db_converters(connection)
+        for col in columns
+    ]
+
+    products = []
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [increment, updated_at_value, threshold])
+        for row in cursor.fetchall():
+            values = list(row)
+            for index, col in enumerate(columns):
+                for converter in converters[index]:
+                    values[index] = converter(values[index], col, connection)
+            products.append(Product.from_db(connection.alias, field_names, values))
+    return products
+
+
+def reserve_stock(products, quantities):
+    """
+    Take ``quantities[pk]`` units from each of ``products`` (a pk -> Product map).
+
+    All products are decremented by one conditional
+    ``UPDATE ... SET stock = stock - qty WHERE stock >= qty``; if any row
+    doesn't match, InsufficientStock is raised so the caller's transaction
+    rolls back. Callers should lock ``products`` with select_for_update()
+    where the backend supports it, which also lets shortages be reported
+    before any write.
+    """
+    short = [products[pk] for pk, quantity in quantities.items() if products[pk].stock < quantity]
+    if short:
+        raise InsufficientStock(short)
+
+    requested = Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+    updated = Product.objects.filter(pk__in=list(quantities), stock__gte=requested).update(
+        stock=F('stock') - requested, updated_at=timezone.now()
+    )
+    if updated != len(quantities):
+        # Stock moved underneath us on a backend without row locks
+        raise InsufficientStock([
+            products[pk] for pk in
+            Product.objects.filter(pk__in=list(quantities), stock__lt=requested)
+            .values_list('pk', flat=True)
+        ])
+
+    result_cache.invalidate(Product)
+    previous = {pk: products[pk].stock for pk in quantities}
+    for pk, quantity in quantities.items():
+        products[pk].stock -= quantity
+    events.publish_stock([products[pk] for pk in quantities], previous)
+
+
+def add_order_lines(order, lines):
+    """
+    Add ``(product, quantity)`` lines to a saved order.
+
+    Unit prices are captured from the products as given, rows are inserted
+    with one ``bulk_create`` and the order total is bumped by the sum of the
+    new lines in one UPDATE, without re-reading existing lines or products.
+    """
+    items = [
+        OrderItem(order=order, product=product, quantity=quantity, unit_price=product.price)
+        for product, quantity in lines
+    ]
+    OrderItem.objects.bulk_create(items)
+    result_cache.invalidate(OrderItem)
+    adjust_order_total(order, sum((item.line_total for item in items), Decimal('0.00')))
+    return items
+
+
+def adjust_order_total(order, delta):
+    """Apply an incremental change to an order's stored total"""
+    if not delta:
+        return
+    Order.objects.filter(pk=order.pk).update(
+        total_amount=F('total_amount') + delta, updated_at=timezone.now()
+    )
+    result_cache.invalidate(Order)
+    if 'total_amount' in order.__dict__:
+        order.total_amount += delta
+
+
+def update_order_total(order):
+    """Recompute ``order.total_amount`` from its lines and store it with one UPDATE"""
+    order.calculate_total()
+    order.updated_at = timezone.now()
+    Order.objects.filter(pk=order.pk).update(
+        total_amount=order.total_amount, updated_at=order.updated_at
+    )
+    result_cache.invalidate(Order)
+    return order.total_amount
+
+
+def update_order_totals(order_ids):
+    """Recompute the totals of many orders in a single UPDATE ... SET = (SELECT SUM ...)"""
+    totals = (
+        OrderItem.objects
+        .filter(order_id=OuterRef('pk'))
+        .values('order_id')
+        .annotate(total=Sum(F('quantity') * F('unit_price')))
+        .values('total')
+    )
+    updated = Order.objects.filter(pk__in=order_ids).update(
+        total_amount=Coalesce(Subquery(totals), Value(Decimal('0.00'))),
+        updated_at=timezone.now(),
+    )
+    result_cache.invalidate(Order)
+    return updated
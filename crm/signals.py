@@ -0,0 +1,86 @@
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import events, result_cache
+from .models import Customer, Order, OrderItem, Product
+from .services import adjust_order_total, update_order_total, update_order_totals
+
+
+@receiver(post_save, sender=OrderItem)
+def order_item_saved(sender, instance, raw=False, **kwargs):
+    """Shift the order total by the change in this line's total"""
+    if raw:
+        return
+    previous = instance._saved_line_total
+    current = instance._current_line_total()
+    if previous is None or current is None:
+        update_order_totals([instance.order_id])
+    else:
+        adjust_order_total(Order(pk=instance.order_id), current - previous)
+    instance._saved_line_total = current
+
+
+@receiver(post_delete, sender=OrderItem)
+def order_item_deleted(sender, instance, origin=None, **kwargs):
+    # Lines cascading from a deleted order or customer take the order with them
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model in (Order, Customer):
+        return
+    previous = instance._saved_line_total
+    if previous is None:
+        update_order_totals([instance.order_id])
+    else:
+        adjust_order_total(Order(pk=instance.order_id), -previous)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def order_products_added(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    ``products.add()``/``set()`` insert lines with bulk_create, which sends no
+    post_save, so recompute the affected totals from their lines. Removals go
+    through OrderItem deletes and are handled above.
+    """
+    if action != 'post_add':
+        return
+    if not reverse:
+        update_order_total(instance)
+    elif pk_set:
+        update_order_totals(pk_set)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=OrderItem)
+def invalidate_cached_results(sender, **kwargs):
+    result_cache.invalidate(sender)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def invalidate_cached_order_products(sender, action, **kwargs):
+    if action.startswith('post_'):
+        result_cache.invalidate(Order, OrderItem)
+
+
+@receiver(post_save, sender=Order)
+def order_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        events.publish(events.ORDER_CREATED, {'order_id': instance.pk})
+
+
+@receiver(post_save, sender=Product)
+def product_stock_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Publish the stock of a saved product if it changed since it was loaded"""
+    # update()-based stock changes are published by crm.services
+    if raw or 'stock' not in instance.__dict__:
+        return
+    if update_fields is not None and 'stock' not in update_fields:
+        return
+    previous = None if created else instance._saved_stock
+    instance._saved_stock = instance.stock
+    events.publish_stock([instance], {instance.pk: previous})
@@ -0,0 +1,234 @@
+"""
+GraphQL over WebSocket for the ASGI application.
+
+Speaks the ``graphql-transport-ws`` protocol (the one implemented by the
+``graphql-ws`` client library, Apollo and GraphiQL): the client sends
+``connection_init`` and gets ``connection_ack``, then runs operations with
+``subscribe`` messages, each answered by ``next`` messages and a final
+``complete`` (or ``error``). Subscriptions stream until either side sends
+``complete``; queries and mutations are also accepted and answer once.
+
+Resolvers run as under the async view (crm.async_execution), with database
+work on a thread of the connection's own.
+"""
+import asyncio
+import json
+from inspect import isawaitable
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from graphene_django.settings import graphene_settings
+from graphql import (
+    ExecutionResult, GraphQLError, OperationType, create_source_event_stream, execute,
+    get_operation_ast,
+)
+
+from .async_execution import SyncResolverMiddleware
+from .complexity import operation_costs
+from .persisted_queries import load_document
+from .views import GraphQLView
+
+PROTOCOL = 'graphql-transport-ws'
+# Path WebSocket connections are accepted on
+SUBSCRIPTION_PATH = graphene_settings.SUBSCRIPTION_PATH or '/graphql'
+# Seconds a client may take to send connection_init
+CONNECTION_INIT_TIMEOUT = getattr(settings, 'CRM_WEBSOCKET_INIT_TIMEOUT', 10)
+
+
+class SubscriptionContext:
+    """``info.context`` of operations run over a WebSocket"""
+    crm_async = True
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.crm_loaders = None
+
+
+class GraphQLWebSocket:
+    """One WebSocket connection"""
+
+    def __init__(self, scope, receive, send):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.acknowledged = False
+        self.operations = {}
+        self.closed = False
+
+    async def send_json(self, message):
+        if not self.closed:
+            await self.send({
+                'type': 'websocket.send', 'text': json.dumps(message, cls=DjangoJSONEncoder),
+            })
+
+    async def close(self, code, reason=''):
+        if not self.closed:
+            self.closed = True
+            await self.send({'type': 'websocket.close', 'code': code, 'reason': reason})
+
+    async def run(self):
+        message = await self.receive()
+        if message['type'] != 'websocket.connect':
+            return
+        if self.scope['path'] != SUBSCRIPTION_PATH:
+            # Closing before accepting answers the handshake with a 403
+            await self.send({'type': 'websocket.close', 'code': 4404})
+            return
+        if PROTOCOL not in self.scope.get('subprotocols', ()):
+            await self.send({'type': 'websocket.close', 'code': 4406})
+            return
+        await self.send({'type': 'websocket.accept', 'subprotocol': PROTOCOL})
+
+        init_timeout = asyncio.ensure_future(self.expire_init())
+        try:
+            while not self.closed:
+                message = await self.receive()
+                if message['type'] == 'websocket.disconnect':
+                    self.closed = True
+                elif message['type'] == 'websocket.receive':
+                    await self.handle(message.get('text') or message.get('bytes'))
+        finally:
+            init_timeout.cancel()
+            for task in list(self.operations.values()):
+                task.cancel()
+            await asyncio.gather(*self.operations.values(), return_exceptions=True)
+
+    async def expire_init(self):
+        await asyncio.sleep(CONNECTION_INIT_TIMEOUT)
+        if not self.acknowledged:
+            await self.close(4408, "Connection initialisation timeout")
+
+    async def handle(self, text):
+        try:
+            message = json.loads(text)
+            message_type = message['type']
+        except (TypeError, ValueError, KeyError):
+            await self.close(4400, "Invalid message received")
+            return
+
+        if message_type == 'connection_init':
+            if self.acknowledged:
+                await self.close(4429, "Too many initialisation requests")
+                return
+            self.acknowledged = True
+            await self.send_json({'type': 'connection_ack'})
+        elif message_type == 'ping':
+            await self.send_json({'type': 'pong'})
+        elif message_type == 'pong':
+            pass
+        elif message_type == 'subscribe':
+            if not self.acknowledged:
+                await self.close(4401, "Unauthorized")
+                return
+            operation_id = message.get('id')
+            payload = message.get('payload')
+            if not isinstance(operation_id, str) or not isinstance(payload, dict):
+                await self.close(4400, "Invalid message received")
+                return
+            if operation_id in self.operations:
+                await self.close(4409, f"Subscriber for {operation_id} already exists")
+                return
+            self.operations[operation_id] = asyncio.ensure_future(
+                self.operation(operation_id, payload)
+            )
+        elif message_type == 'complete':
+            task = self.operations.pop(message.get('id'), None)
+            if task is not None:
+                task.cancel()
+        else:
+            await self.close(4400, f"Unexpected message type {message_type!r}")
+
+    async def operation(self, operation_id, payload):
+        try:
+            result = await self.execute(payload)
+            if isinstance(result, ExecutionResult):
+                if result.data is None and result.errors:
+                    await self.send_error(operation_id, result.errors)
+                    return
+                await self.send_next(operation_id, result)
+            else:
+                try:
+                    async for item in result:
+                        await self.send_next(operation_id, item)
+                finally:
+                    await result.aclose()
+            await self.send_json({'type': 'complete', 'id': operation_id})
+        except Exception as e:
+            await self.send_error(operation_id, [GraphQLError(str(e), original_error=e)])
+        finally:
+            if self.operations.get(operation_id) is asyncio.current_task():
+                del self.operations[operation_id]
+
+    async def send_error(self, operation_id, errors):
+        await self.send_json({
+            'type': 'error', 'id': operation_id, 'payload': [error.formatted for error in errors],
+        })
+
+    async def send_next(self, operation_id, result):
+        payload = {'data': result.data}
+        if result.errors:
+            payload['errors'] = [error.formatted for error in result.errors]
+        await self.send_json({'type': 'next', 'id': operation_id, 'payload': payload})
+
+    async def execute(self, payload):
+        """An ExecutionResult, or an async iterator of them for subscriptions"""
+        schema = graphene_settings.SCHEMA.graphql_schema
+        try:
+            document, errors, _ = load_document(
+                schema, payload.get('query'), payload.get('extensions'),
+                GraphQLView.validation_rules, graphene_settings.MAX_VALIDATION_ERRORS,
+                analyze=operation_costs,
+            )
+        except GraphQLError as e:
+            return ExecutionResult(errors=[e])
+        if errors:
+            return ExecutionResult(errors=errors)
+
+        options = {
+            'context_value': SubscriptionContext(self.scope),
+            'variable_values': payload.get('variables'),
+            'operation_name': payload.get('operationName'),
+            'middleware': [SyncResolverMiddleware()],
+        }
+        operation_ast = get_operation_ast(document, options['operation_name'])
+        if operation_ast is None:
+            return ExecutionResult(errors=[GraphQLError("Unknown operation")])
+
+        if operation_ast.operation != OperationType.SUBSCRIPTION:
+            # Mutation fields still run one after the other, each on the
+            # connection's thread
+            return await resolve(execute(schema, document, **options))
+
+        # graphql.subscribe() takes no middleware, so map the event stream
+        # to responses here
+        source = await resolve(create_source_event_stream(
+            schema, document, context_value=options['context_value'],
+            variable_values=options['variable_values'], operation_name=options['operation_name'],
+        ))
+        if isinstance(source, ExecutionResult):
+            return source
+        return self.responses(source, schema, document, options)
+
+    @staticmethod
+    async def responses(source, schema, document, options):
+        try:
+            async for event in source:
+                yield await resolve(execute(schema, document, root_value=event, **options))
+        finally:
+            await source.aclose()
+
+
+async def resolve(value):
+    return await value if isawaitable(value) else value
+
+
+async def websocket_application(scope, receive, send):
+    # Database work of the connection runs on one thread, whose connection
+    # is closed when the socket is
+    async with ThreadSensitiveContext():
+        try:
+            await GraphQLWebSocket(scope, receive, send).run()
+        finally:
+            await sync_to_async(connections.close_all)()
@@ -0,0 +1,292 @@
+"""
+Synthetic customers, products and orders for load-test databases.
+
+Rows are built in memory and written with ``bulk_create`` in batches, order
+lines included, so millions of orders take minutes rather than hours.
+Distributions aim to look like a real shop:
+
+* product popularity is Zipfian (a few best sellers, a long tail), customer
+  activity mildly so (repeat buyers);
+* order dates follow a seasonal curve over the window, with a year-end
+  peak, busier weekends and evenings and a growth trend. Orders are
+  inserted chronologically, so ids increase with ``order_date`` as they do
+  in production.
+
+Output depends only on the seed, the sizes and the window's end date.
+``bulk_create`` skips model signals, so order totals are computed here and
+the result cache is invalidated once at the end.
+"""
+import random
+from bisect import bisect
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import accumulate, islice
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import result_cache
+from .models import Customer, JobWatermark, Order, OrderItem, OrderReminder, Product
+
+# Rows per INSERT batch
+DEFAULT_BATCH_SIZE = 10_000
+
+# auto_now_add fields given generated dates
+DATED_FIELDS = {
+    Customer: ('created_at',),
+    Order: ('order_date', 'created_at'),
+}
+
+FIRST_NAMES = (
+    "Ada", "Ben", "Chloe", "Daniel", "Ella", "Felix", "Grace", "Hugo", "Ivy", "Jack",
+    "Kemi", "Liam", "Maya", "Noah", "Olivia", "Priya", "Quinn", "Rosa", "Sam", "Tara",
+    "Uche", "Vera", "Wale", "Xin", "Yusuf", "Zoe",
+)
+LAST_NAMES = (
+    "Adams", "Brown", "Chen", "Davis", "Evans", "Garcia", "Hughes", "Ibrahim", "Jones",
+    "Khan", "Lopez", "Moore", "Nguyen", "Okafor", "Patel", "Rossi", "Smith", "Taylor",
+    "Usman", "Walker", "Young",
+)
+PRODUCT_ADJECTIVES = (
+    "Compact", "Deluxe", "Ergonomic", "Portable", "Premium", "Rugged", "Smart", "Classic",
+    "Wireless", "Ultra",
+)
+PRODUCT_NOUNS = (
+    "Laptop", "Mouse", "Keyboard", "Monitor", "Headphones", "Webcam", "Desk Chair",
+    "USB Cable", "Speaker", "Charger", "Tablet", "Router", "Microphone", "Lamp",
+)
+
+# Relative order volume by month (January first), weekday (Monday first)
+# and hour of day
+MONTH_WEIGHTS = (0.8, 0.75, 0.85, 0.9, 0.95, 0.95, 0.9, 0.95, 1.0, 1.05, 1.45, 1.7)
+WEEKDAY_WEIGHTS = (0.95, 0.9, 0.9, 0.95, 1.05, 1.2, 1.1)
+HOUR_WEIGHTS = (
+    0.2, 0.1, 0.1, 0.1, 0.1, 0.2, 0.4, 0.7, 0.9, 1.0, 1.1, 1.2,
+    1.3, 1.2, 1.1, 1.1, 1.2, 1.4, 1.7, 1.9, 1.8, 1.4, 0.9, 0.5,
+)
+# Daily volume at the end of the window relative to its start
+TREND_GROWTH = 1.5
+# Random variation of each day's volume
+DAILY_NOISE = 0.15
+
+# Weights of 1, 2, 3... distinct products per order and of each line's quantity
+ITEM_COUNT_WEIGHTS = (45, 30, 15, 7, 3)
+QUANTITY_WEIGHTS = (75, 17, 5, 3)
+
+
+class GenerationError(Exception):
+    """Raised for sizes that can't be generated, or rows that already exist"""
+
+
+class Popularity:
+    """Picks items with Zipfian weights (rank ** -skew) over a shuffled ranking"""
+
+    def __init__(self, items, skew, rng):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.rng = rng
+        self.cum_weights = list(accumulate(rank ** -skew for rank in range(1, len(self.items) + 1)))
+
+    def pick(self):
+        return self.items[bisect(self.cum_weights, self.rng.random() * self.cum_weights[-1])]
+
+    def pick_distinct(self, count):
+        picked = {}
+        while len(picked) < count:
+            picked[self.pick()] = None
+        return list(picked)
+
+
+def day_weight(day, progress):
+    """Relative order volume of ``day``, ``progress`` (0-1) through the window"""
+    trend = 1 + (TREND_GROWTH - 1) * progress
+    return MONTH_WEIGHTS[day.month - 1] * WEEKDAY_WEIGHTS[day.weekday()] * trend
+
+
+def daily_counts(orders, days, end, rng):
+    """``(day, count)`` over the ``days`` days before ``end``; counts sum to ``orders``"""
+    start = end - timedelta(days=days)
+    calendar = [start + timedelta(days=offset) for offset in range(days)]
+    weights = [
+        day_weight(day, offset / max(days - 1, 1)) * rng.uniform(1 - DAILY_NOISE, 1 + DAILY_NOISE)
+        for offset, day in enumerate(calendar)
+    ]
+    total = sum(weights)
+    allocated = 0
+    for day, cumulative in zip(calendar, accumulate(weights)):
+        # Rounding the running total keeps the sum exact
+        upto = round(orders * cumulative / total)
+        yield day, upto - allocated
+        allocated = upto
+
+
+def times_of_day(day, count, rng):
+    """``count`` sorted datetimes on ``day``, following HOUR_WEIGHTS"""
+    midnight = datetime.combine(day, time.min, tzinfo=timezone.get_current_timezone())
+    hours = rng.choices(range(24), weights=HOUR_WEIGHTS, k=count)
+    seconds = sorted(hour * 3600 + rng.randrange(3600) for hour in hours)
+    return [midnight + timedelta(seconds=second) for second in seconds]
+
+
+def bulk_create_dated(model, rows):
+    """
+    ``bulk_create`` rows whose ``auto_now_add`` fields hold generated dates.
+
+    Inserting stamps those fields with the current time, so the generated
+    values are written back with one executemany UPDATE by primary key.
+    """
+    fields = [model._meta.get_field(name) for name in DATED_FIELDS[model]]
+    dates = [[getattr(row, field.attname) for field in fields] for row in rows]
+    model.objects.bulk_create(rows)
+
+    qn = connection.ops.quote_name
+    assignments = ", ".join(f"{qn(field.column)} = %s" for field in fields)
+    sql = f"UPDATE {qn(model._meta.db_table)} SET {assignments} WHERE {qn(model._meta.pk.column)} = %s"
+    params = []
+    for row, values in zip(rows, dates):
+        for field, value in zip(fields, values):
+            setattr(row, field.attname, value)
+        params.append([
+            *(field.get_db_prep_value(value, connection) for field, value in zip(fields, values)),
+            row.pk,
+        ])
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Generator:
+    def __init__(self, seed=42, days=730, end=None, product_skew=1.1, customer_skew=0.6,
+                 batch_size=DEFAULT_BATCH_SIZE, progress=None):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.days = days
+        self.end = end or timezone.localdate()
+        self.product_skew = product_skew
+        self.customer_skew = customer_skew
+        self.batch_size = batch_size
+        # progress(label, done, total) after every batch
+        self.progress = progress or (lambda label, done, total: None)
+
+    def run(self, customers, products, orders):
+        if min(customers, products, orders) < 0:
+            raise GenerationError("Sizes cannot be negative")
+        if self.days < 1:
+            raise GenerationError("The order window must span at least one day")
+        if orders and not (customers and products):
+            raise GenerationError("Orders need at least one customer and one product")
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise GenerationError(f"{connection.vendor} doesn't return ids from bulk inserts")
+        if customers and Customer.objects.filter(email__endswith=f".{self.seed}.0@example.com").exists():
+            raise GenerationError(
+                f"Data for seed {self.seed} already exists; flush it first or pick another seed"
+            )
+
+        customer_ids = self.insert('customers', Customer, self.customers(customers), customers)
+        product_rows = self.insert('products', Product, self.products(products), products)
+        items = self.orders(orders, customer_ids, product_rows) if orders else 0
+
+        result_cache.invalidate(Customer, Product, Order, OrderItem)
+        return {'customers': customers, 'products': products, 'orders': orders, 'order_items': items}
+
+    def insert(self, label, model, rows, total):
+        """Bulk insert ``rows``; ids of customers, ``(id, price)`` of products"""
+        inserted = []
+        for batch in batched(rows, self.batch_size):
+            with transaction.atomic():
+                if model in DATED_FIELDS:
+                    bulk_create_dated(model, batch)
+                else:
+                    model.objects.bulk_create(batch)
+            inserted.extend((row.pk, row.price) if model is Product else row.pk for row in batch)
+            self.progress(label, len(inserted), total)
+        return inserted
+
+    def email(self, index, first, last):
+        # Unique per seed, so separate runs can share a database
+        return f"{first}.{last}.{self.seed}.{index}@example.com".lower()
+
+    def customers(self, count):
+        rng = self.rng
+        window = timedelta(days=self.days).total_seconds()
+        end = datetime.combine(self.end, time.min, tzinfo=timezone.get_current_timezone())
+        start = end - timedelta(days=self.days)
+        for index in range(count):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            style = rng.random()
+            if style < 0.1:
+                phone = None
+            elif style < 0.4:
+                phone = f"{rng.randrange(200, 1000)}-{rng.randrange(1000):03d}-{rng.randrange(10_000):04d}"
+            else:
+                phone = f"+1{rng.randrange(10**9, 10**10)}"
+            yield Customer(
+                name=f"{first} {last}", email=self.email(index, first, last), phone=phone,
+                created_at=start + timedelta(seconds=rng.uniform(0, window)),
+            )
+
+    def products(self, count):
+        rng = self.rng
+        for index in range(count):
+            # Log-normal prices: mostly tens of dollars, some in the thousands
+            price = min(max(rng.lognormvariate(3.5, 1.1), 0.5), 99_999)
+            yield Product(
+                name=f"{rng.choice(PRODUCT_ADJECTIVES)} {rng.choice(PRODUCT_NOUNS)} {index:06d}",
+                price=Decimal(round(price * 100)) / 100,
+                stock=rng.randrange(0, 200) if rng.random() > 0.05 else rng.randrange(0, 10),
+            )
+
+    def orders(self, count, customer_ids, product_rows):
+        rng = self.rng
+        buyers = Popularity(customer_ids, self.customer_skew, rng)
+        catalogue = Popularity(product_rows, self.product_skew, rng)
+        max_items = min(len(ITEM_COUNT_WEIGHTS), len(product_rows))
+
+        def generate():
+            for day, day_count in daily_counts(count, self.days, self.end, rng):
+                for placed in times_of_day(day, day_count, rng):
+                    size = rng.choices(range(1, max_items + 1), ITEM_COUNT_WEIGHTS[:max_items])[0]
+                    lines = [
+                        (product_id, price, rng.choices(range(1, len(QUANTITY_WEIGHTS) + 1),
+                                                        QUANTITY_WEIGHTS)[0])
+                        for product_id, price in catalogue.pick_distinct(size)
+                    ]
+                    total = sum(price * quantity for _, price, quantity in lines)
+                    yield Order(
+                        customer_id=buyers.pick(), total_amount=total, order_date=placed,
+                        created_at=placed,
+                    ), lines
+
+        done = items = 0
+        for batch in batched(generate(), self.batch_size):
+            with transaction.atomic():
+                bulk_create_dated(Order, [order for order, _ in batch])
+                order_items = [
+                    OrderItem(order_id=order.pk, product_id=product_id, quantity=quantity, unit_price=price)
+                    for order, lines in batch
+                    for product_id, price, quantity in lines
+                ]
+                OrderItem.objects.bulk_create(order_items, batch_size=self.batch_size)
+            done += len(batch)
+            items += len(order_items)
+            self.progress('orders', done, count)
+        return items
+
+
+def generate(customers, products, orders, **options):
+    """Insert synthetic rows; returns the number created of each kind"""
+    return Generator(**options).run(customers, products, orders)
+
+
+def flush():
+    """Delete every customer, product and order with plain DELETEs, skipping signals"""
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Reminders reference orders, and watermarks point at deleted positions
+        for model in (OrderReminder, JobWatermark, OrderItem, Order, Product, Customer):
+            cursor.execute(f"DELETE FROM {connection.ops.quote_name(model._meta.db_table)}")
+    result_cache.invalidate(Customer, Product, Order, OrderItem)
@@ -1,3 +1,1568 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import os
+from io import StringIO
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from functools import partial
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Count, F, Sum
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from graphql import validate
+from graphql_relay import from_global_id
+
+from .models import Customer, Job, JobWatermark, Product, Order, OrderItem, OrderReminder
+from . import checks, cron, events, jobs, reminders, result_cache, tracing
+from .export import aiter_lines
+from .metrics import Histogram
+from .persisted_queries import DocumentCache, document_cache
+from .services import add_order_lines
+
+
+def graphql(client, query, variables=None, path='/graphql'):
+    response = client.post(
+        path,
+        data=json.dumps({'query': query, 'variables': variables or {}}),
+        content_type='application/json',
+    )
+    return response.json()
+
+
+class OrderBatchingTests(TestCase):
+    ORDERS_QUERY = """
+        query Orders($first: Int) {
+            allOrders(first: $first) {
+                edges {
+                    node {
+                        id
+                        totalAmount
+                        items { quantity lineTotal product { name } }
+                        customer {
+                            name
+                            orders(first: 10) { edges { node { id } } }
+                        }
+                        products(first: 10) {
+                            edges {
+                                node {
+                                    name
+                                    orders(first: 10) { edges { node { id } } }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        products = [
+            Product.objects.create(name=f"Product {i}", price=Decimal('10.00'), stock=100)
+            for i in range(5)
+        ]
+        for i in range(50):
+            customer = Customer.objects.create(name=f"Customer {i}", email=f"customer{i}@example.com")
+            order = Order.objects.create(customer=customer)
+            add_order_lines(order, [(product, 1) for product in products[:(i % 3) + 1]])
+
+    def count_queries(self, first):
+        with CaptureQueriesContext(connection) as ctx:
+            result = graphql(self.client, self.ORDERS_QUERY, {'first': first})
+        self.assertNotIn('errors', result)
+        self.assertEqual(len(result['data']['allOrders']['edges']), first)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_flat_as_page_size_grows(self):
+        self.assertEqual(self.count_queries(5), self.count_queries(50))
+
+    def test_nested_relations_resolve_from_loaders(self):
+        result = graphql(self.client, self.ORDERS_QUERY, {'first': 50})
+        for edge in result['data']['allOrders']['edges']:
+            node = edge['node']
+            self.assertTrue(node['customer']['name'].startswith('Customer'))
+            self.assertEqual(len(node['customer']['orders']['edges']), 1)
+            self.assertIn(len(node['products']['edges']), (1, 2, 3))
+
+    def test_filtered_nested_connection_falls_back_to_queryset(self):
+        result = graphql(self.client, """
+            {
+                allOrders(first: 50) {
+                    edges { node { products(name: "Product 0") { edges { node { name } } } } }
+                }
+            }
+        """)
+        for edge in result['data']['allOrders']['edges']:
+            names = [p['node']['name'] for p in edge['node']['products']['edges']]
+            self.assertEqual(names, ['Product 0'])
+
+
+class ConnectionOptimizerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        product = Product.objects.create(name="Mouse", price=Decimal('29.99'), stock=50)
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        for _ in range(3):
+            add_order_lines(Order.objects.create(customer=customer), [(product, 1)])
+
+    def page_sql(self, query):
+        with CaptureQueriesContext(connection) as ctx:
+            result = graphql(self.client, query)
+        self.assertNotIn('errors', result)
+        # Keyset pages skip the COUNT, so the first query fetches the page
+        return ctx.captured_queries[0]['sql'], len(ctx.captured_queries)
+
+    def test_scalar_selection_prunes_columns(self):
+        sql, _ = self.page_sql("{ allOrders(first: 3) { edges { node { id totalAmount } } } }")
+        self.assertIn('"total_amount"', sql)
+        self.assertNotIn('"created_at"', sql)
+        self.assertNotIn('"updated_at"', sql)
+        self.assertNotIn('JOIN', sql)
+
+    def test_relations_are_joined_and_prefetched(self):
+        sql, count = self.page_sql("""
+            {
+                allOrders(first: 3) {
+                    edges { node { customer { name } products { edges { node { name } } } } }
+                }
+            }
+        """)
+        self.assertIn('JOIN "crm_customer"', sql)
+        self.assertNotIn('"crm_customer"."email"', sql)
+        self.assertEqual(count, 2)
+
+    def test_products_connection_prunes_columns(self):
+        sql, _ = self.page_sql("{ allProducts(first: 1) { edges { node { name stock } } } }")
+        self.assertIn('"stock"', sql)
+        self.assertNotIn('"price"', sql)
+
+
+class NestedConnectionLimitTests(TestCase):
+    PAGE = "orders(first: 2) { pageInfo { hasNextPage } edges { node { id } } }"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name="Mouse", price=Decimal('29.99'), stock=500)
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        cls.orders = [Order.objects.create(customer=customer) for _ in range(30)]
+        for order in cls.orders:
+            add_order_lines(order, [(cls.product, 1)])
+
+    def assert_pages_are_bounded(self, query, variables, pages):
+        with CaptureQueriesContext(connection) as ctx:
+            result = graphql(self.client, query, variables)
+        self.assertNotIn('errors', result)
+        for orders in pages(result['data']):
+            self.assertEqual(len(orders['edges']), 2)
+            self.assertTrue(orders['pageInfo']['hasNextPage'])
+        return [query['sql'] for query in ctx.captured_queries]
+
+    def test_loaders_fetch_one_page_per_parent(self):
+        statements = self.assert_pages_are_bounded(
+            "query O($id: ID) { order(id: $id) { customer { %s } products { edges { node { %s } } } } }"
+            % (self.PAGE, self.PAGE),
+            {'id': self.orders[0].pk},
+            lambda data: (
+                data['order']['customer']['orders'],
+                data['order']['products']['edges'][0]['node']['orders'],
+            ),
+        )
+        windowed = [sql for sql in statements if 'ROW_NUMBER()' in sql]
+        self.assertEqual(len(windowed), 2)
+        for sql in windowed:
+            self.assertIn('"row_number" <= 3', sql)
+
+    def test_prefetches_fetch_one_page_per_parent(self):
+        cache.clear()
+        statements = self.assert_pages_are_bounded(
+            "{ allProducts { edges { node { %s } } } allOrders(first: 1) { edges { node { customer { %s } } } } }"
+            % (self.PAGE, self.PAGE),
+            None,
+            lambda data: (
+                data['allProducts']['edges'][0]['node']['orders'],
+                data['allOrders']['edges'][0]['node']['customer']['orders'],
+            ),
+        )
+        windowed = [sql for sql in statements if 'ROW_NUMBER()' in sql]
+        self.assertEqual(len(windowed), 2)
+        for sql in windowed:
+            self.assertIn('<= 3', sql)
+
+    def test_total_count_pages_are_counted_per_parent(self):
+        cache.clear()
+        result = graphql(self.client, """
+            { allProducts { edges { node { orders(first: 2) { totalCount edges { node { id } } } } } } }
+        """)
+        orders = result['data']['allProducts']['edges'][0]['node']['orders']
+        self.assertEqual(orders['totalCount'], 30)
+        self.assertEqual(len(orders['edges']), 2)
+
+
+class KeysetPaginationTests(TestCase):
+    PAGE_QUERY = """
+        query Page($first: Int, $after: String, $last: Int, $before: String) {
+            allOrders(first: $first, after: $after, last: $last, before: $before) {
+                edges { node { id } }
+                pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        cls.orders = [Order.objects.create(customer=customer) for _ in range(7)]
+        # Ties on order_date must be broken by id
+        Order.objects.filter(pk__in=[o.pk for o in cls.orders[2:5]]).update(
+            order_date=cls.orders[2].order_date
+        )
+        cls.expected = list(
+            Order.objects.order_by('-order_date', '-id').values_list('pk', flat=True)
+        )
+
+    def page(self, **variables):
+        result = graphql(self.client, self.PAGE_QUERY, variables)
+        self.assertNotIn('errors', result)
+        connection = result['data']['allOrders']
+        ids = [int(from_global_id(edge['node']['id'])[1]) for edge in connection['edges']]
+        return ids, connection['pageInfo']
+
+    def test_pages_forward_and_backward_without_offset(self):
+        seen, after = [], None
+        with CaptureQueriesContext(connection) as ctx:
+            while True:
+                ids, page_info = self.page(first=3, after=after)
+                seen.extend(ids)
+                if not page_info['hasNextPage']:
+                    break
+                after = page_info['endCursor']
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(ctx.captured_queries), 3)
+        for query in ctx.captured_queries:
+            self.assertNotIn('COUNT', query['sql'])
+            self.assertNotIn('OFFSET', query['sql'])
+
+        ids, page_info = self.page(last=3, before=after)
+        # ``after`` is the end cursor of the second page, i.e. the sixth row
+        self.assertEqual(ids, self.expected[2:5])
+        self.assertTrue(page_info['hasPreviousPage'])
+        self.assertTrue(page_info['hasNextPage'])
+
+    def test_total_count_is_opt_in(self):
+        with CaptureQueriesContext(connection) as ctx:
+            result = graphql(self.client, "{ allOrders(first: 2) { totalCount edges { node { id } } } }")
+        self.assertEqual(result['data']['allOrders']['totalCount'], 7)
+        self.assertEqual(sum('COUNT' in query['sql'] for query in ctx.captured_queries), 1)
+
+    def test_offset_still_supported(self):
+        result = graphql(self.client, "{ allOrders(first: 2, offset: 5) { edges { node { id } } } }")
+        ids = [int(from_global_id(edge['node']['id'])[1]) for edge in result['data']['allOrders']['edges']]
+        self.assertEqual(ids, self.expected[5:7])
+
+    def test_invalid_cursor_is_reported(self):
+        result = graphql(self.client, self.PAGE_QUERY, {'first': 1, 'after': 'a2V5c2V0Olsi'})
+        self.assertIn('Invalid cursor', result['errors'][0]['message'])
+
+
+class AllCustomersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Customer.objects.bulk_create([
+            Customer(name=f"Customer {i:03d}", email=f"c{i}@example.com", phone=f"+1555{i:07d}")
+            for i in range(120)
+        ])
+        Customer.objects.create(name="Zed", email="zed@example.com", phone="+4420000000")
+
+    def test_pages_are_bounded(self):
+        result = graphql(self.client, "{ allCustomers { edges { node { name } } pageInfo { hasNextPage } } }")
+        self.assertEqual(len(result['data']['allCustomers']['edges']), 100)
+        self.assertTrue(result['data']['allCustomers']['pageInfo']['hasNextPage'])
+
+        result = graphql(self.client, "{ allCustomers(first: 500) { edges { node { name } } } }")
+        self.assertIn('exceeds the `first` limit of 100', result['errors'][0]['message'])
+
+    def test_customer_filter_is_wired(self):
+        result = graphql(self.client, """
+            { allCustomers(phonePattern: "+44", first: 5) { totalCount edges { node { email } } } }
+        """)
+        self.assertEqual(result['data']['allCustomers']['totalCount'], 1)
+        self.assertEqual(result['data']['allCustomers']['edges'][0]['node']['email'], "zed@example.com")
+
+    def test_export_streams_all_rows(self):
+        out = StringIO()
+        call_command('export', 'customers', '--filter', 'phone_pattern=+1555', '--chunk-size', '7', stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(rows), 120)
+        self.assertEqual(rows[0]['email'], "c0@example.com")
+
+        out = StringIO()
+        call_command('export', 'customers', '--format', 'csv', '--filter', 'name=zed', stdout=out)
+        self.assertEqual(out.getvalue().splitlines()[0], "id,name,email,phone,created_at")
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+
+class ExportViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        laptop = Product.objects.create(name="Laptop", price=Decimal('999.99'), stock=10)
+        mouse = Product.objects.create(name="Mouse", price=Decimal('29.99'), stock=3)
+        cls.laptop_order = Order.objects.create(customer=alice)
+        add_order_lines(cls.laptop_order, [(laptop, 1), (mouse, 2)])
+        add_order_lines(Order.objects.create(customer=alice), [(mouse, 1)])
+
+    def stream(self, url):
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_orders_ndjson_uses_order_filter(self):
+        body = self.stream('/export/orders?productName=lapt')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.laptop_order.pk])
+        self.assertEqual(rows[0]['total_amount'], '1059.97')
+
+    def test_products_csv(self):
+        response = self.client.get('/export/products?format=csv&lowStock=true')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "id,name,price,stock,created_at,updated_at")
+        self.assertEqual([line.split(',')[1] for line in lines[1:]], ["Mouse"])
+
+    async def test_asgi_streams_asynchronously(self):
+        with mock.patch('crm.views.aiter_lines', partial(aiter_lines, chunk_size=1)):
+            response = await self.async_client.get('/export/orders')
+        # A sync iterator would be read into a list before the first byte is sent
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(json.loads(chunks[0])['id'], self.laptop_order.pk)
+
+    def test_errors_are_reported_before_streaming(self):
+        self.assertEqual(self.client.get('/export/invoices').status_code, 400)
+        self.assertEqual(self.client.get('/export/orders?format=xml').status_code, 400)
+        response = self.client.get('/export/orders?totalAmount_Gte=lots')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('total_amount__gte', response.json()['error'])
+
+
+class PersistedQueryTests(TestCase):
+    QUERY = "{ hello }"
+
+    def setUp(self):
+        cache.clear()
+        document_cache.clear()
+        self.sha256 = hashlib.sha256(self.QUERY.encode()).hexdigest()
+
+    def post(self, **body):
+        response = self.client.post('/graphql', data=json.dumps(body), content_type='application/json')
+        return response.json()
+
+    def persisted(self, sha256=None):
+        return {'persistedQuery': {'version': 1, 'sha256Hash': sha256 or self.sha256}}
+
+    def test_apq_round_trip(self):
+        result = self.post(extensions=self.persisted())
+        self.assertEqual(result['errors'][0]['message'], 'PersistedQueryNotFound')
+        self.assertEqual(result['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_FOUND')
+
+        result = self.post(query=self.QUERY, extensions=self.persisted())
+        self.assertEqual(result['data'], {'hello': 'Hello, GraphQL!'})
+
+        # Later requests, including GETs, only carry the hash
+        document_cache.clear()
+        result = self.post(extensions=self.persisted())
+        self.assertEqual(result['data'], {'hello': 'Hello, GraphQL!'})
+        response = self.client.get('/graphql', {'extensions': json.dumps(self.persisted())},
+                                   HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json()['data'], {'hello': 'Hello, GraphQL!'})
+
+    def test_hash_must_match_query(self):
+        result = self.post(query=self.QUERY, extensions=self.persisted('0' * 64))
+        self.assertEqual(result['errors'][0]['message'], 'provided sha does not match query')
+
+    def test_documents_are_parsed_and_validated_once(self):
+        with mock.patch('crm.persisted_queries.validate', wraps=validate) as validated:
+            for _ in range(3):
+                self.assertEqual(self.post(query=self.QUERY)['data'], {'hello': 'Hello, GraphQL!'})
+        self.assertEqual(validated.call_count, 1)
+        self.assertEqual(document_cache.stats()['hits'], 2)
+        self.assertEqual(document_cache.stats()['misses'], 1)
+
+        # Invalid documents are cached with their errors too
+        for _ in range(2):
+            result = self.post(query="{ nope }")
+            self.assertIn("Cannot query field 'nope'", result['errors'][0]['message'])
+        self.assertEqual(document_cache.stats()['hits'], 3)
+
+    def test_lru_evicts_oldest(self):
+        lru = DocumentCache(maxsize=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a'), 1)
+        self.assertEqual(lru.stats()['evictions'], 1)
+
+
+class QueryCostTests(TestCase):
+    def test_cost_is_reported(self):
+        result = graphql(self.client, """
+            { allOrders(first: 5) { edges { node { customer { name } items { quantity } } } } }
+        """)
+        # 5 orders, each with a customer and up to 10 items
+        self.assertEqual(result['extensions']['cost'], {'requested': 5 * (1 + 1 + 10), 'depth': 2, 'limit': 50000})
+
+    def test_nested_connections_are_rejected_before_execution(self):
+        query = """
+            query Nested {
+                allOrders {
+                    edges { node { products { edges { node { orders { edges { node {
+                        customer { orders { edges { node { id } } } }
+                    } } } } } } } }
+                }
+            }
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            result = graphql(self.client, query)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertNotIn('data', result)
+        self.assertEqual(result['errors'][0]['extensions']['code'], 'QUERY_TOO_COSTLY')
+
+    def test_depth_limit(self):
+        nested = "id"
+        for _ in range(6):
+            nested = f"customer {{ orders(first: 1) {{ edges {{ node {{ {nested} }} }} }} }}"
+        result = graphql(self.client, f"{{ order(id: 1) {{ {nested} }} }}")
+        codes = [error['extensions']['code'] for error in result['errors']]
+        self.assertEqual(codes, ['QUERY_TOO_DEEP'])
+
+
+class AsyncGraphQLTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name="Ada", email="ada@example.com")
+        cls.product = Product.objects.create(name="Lamp", price=Decimal('12.50'), stock=5)
+        cls.order = Order.objects.create(customer=cls.customer, total_amount=Decimal('25.00'))
+        OrderItem.objects.create(order=cls.order, product=cls.product, quantity=2,
+                                 unit_price=cls.product.price)
+        cls.order.products.add(cls.product)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_results_match_sync_view(self):
+        query = f"""{{
+            hello
+            customer(id: {self.customer.pk}) {{
+                name
+                orders(first: 5) {{ edges {{ node {{ totalAmount products(first: 5) {{ edges {{ node {{ name }} }} }} }} }} }}
+            }}
+            product(id: {self.product.pk}) {{ name stock }}
+            order(id: 0) {{ id }}
+            allOrders(first: 5) {{
+                totalCount
+                edges {{ node {{ customer {{ name }} items {{ quantity lineTotal product {{ name }} }} }} }}
+            }}
+        }}"""
+        with CaptureQueriesContext(connection) as sync_queries:
+            expected = graphql(self.client, query)
+        self.assertNotIn('errors', expected)
+        cache.clear()
+        with CaptureQueriesContext(connection) as async_queries:
+            result = graphql(self.client, query, path='/graphql/async')
+        self.assertEqual(result['data'], expected['data'])
+        # Loaders batch the same way on the event loop
+        self.assertEqual(len(async_queries), len(sync_queries))
+        self.assertEqual(result['extensions'], expected['extensions'])
+
+    def test_root_fields_resolve_concurrently(self):
+        started = []
+        everyone = asyncio.Event()
+
+        async def aget_instance(model, pk):
+            started.append(model)
+            if len(started) == 3:
+                everyone.set()
+            # Deadlocks (and times out) unless all three lookups are in flight at once
+            await asyncio.wait_for(everyone.wait(), timeout=5)
+            return await model.objects.aget(pk=pk)
+
+        query = f"""{{
+            customer(id: {self.customer.pk}) {{ name }}
+            product(id: {self.product.pk}) {{ name }}
+            order(id: {self.order.pk}) {{ totalAmount }}
+        }}"""
+        with mock.patch.object(result_cache, 'aget_instance', aget_instance):
+            result = graphql(self.client, query, path='/graphql/async')
+        self.assertNotIn('errors', result)
+        self.assertEqual(result['data']['product'], {'name': "Lamp"})
+        self.assertEqual(len(started), 3)
+
+    def test_mutations_and_errors(self):
+        result = graphql(self.client, """
+            mutation { createCustomer(input: {name: "Bo", email: "bo@example.com"}) { success } }
+        """, path='/graphql/async')
+        self.assertEqual(result['data']['createCustomer'], {'success': True})
+        self.assertTrue(Customer.objects.filter(email="bo@example.com").exists())
+
+        response = self.client.post('/graphql/async', data=json.dumps({'query': '{ nope }'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/graphql/async', {'query': 'mutation { __typename }'})
+        self.assertEqual(response.status_code, 405)
+
+
+class TracingTests(TestCase):
+    QUERY = """
+        { allOrders(first: 10) { edges { node { totalAmount customer { name } } } } }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(3):
+            customer = Customer.objects.create(name=f"Customer {i}", email=f"c{i}@example.com")
+            Order.objects.create(customer=customer, total_amount=Decimal('10.00'))
+
+    def post(self, query, **headers):
+        response = self.client.post('/graphql', data=json.dumps({'query': query}),
+                                    content_type='application/json', headers=headers)
+        return response.json()
+
+    @override_settings(DEBUG=True)
+    def test_trace_is_returned_with_the_header(self):
+        self.assertNotIn('tracing', self.post(self.QUERY)['extensions'])
+
+        with CaptureQueriesContext(connection) as ctx:
+            trace = self.post(self.QUERY, **{'X-CRM-Trace': '1'})['extensions']['tracing']
+        self.assertEqual(trace['sql']['count'], len(ctx.captured_queries))
+        self.assertEqual(trace['sql']['duplicates'], [])
+        self.assertEqual(trace['fields']['OrderType.customer']['count'], 3)
+        self.assertEqual(trace['fields']['Query.allOrders']['count'], 1)
+        resolver = next(r for r in trace['execution']['resolvers'] if r['fieldName'] == 'allOrders')
+        self.assertEqual(resolver['path'], ['allOrders'])
+        self.assertGreater(resolver['duration'], 0)
+
+    @override_settings(DEBUG=True)
+    def test_async_view_is_traced(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/graphql/async', data=json.dumps({'query': self.QUERY}),
+                                        content_type='application/json', headers={'X-CRM-Trace': '1'})
+        trace = response.json()['extensions']['tracing']
+        # Statements run on the request's thread are attributed to the request too
+        self.assertEqual(trace['sql']['count'], len(ctx.captured_queries))
+        self.assertEqual(trace['fields']['OrderType.customer']['count'], 3)
+
+    @override_settings(DEBUG=True)
+    def test_duplicate_queries_are_reported(self):
+        customer = Customer.objects.first()
+        query = f"{{ a: customer(id: {customer.pk}) {{ name }} b: customer(id: {customer.pk}) {{ email }} }}"
+        with mock.patch.object(result_cache, 'RESULT_CACHE_TIMEOUT', 0):
+            trace = self.post(query, **{'X-CRM-Trace': '1'})['extensions']['tracing']
+        self.assertEqual(trace['sql']['count'], 2)
+        self.assertEqual(len(trace['sql']['duplicates']), 1)
+        self.assertEqual(trace['sql']['duplicates'][0]['count'], 2)
+
+    def test_header_needs_debug_or_token(self):
+        self.assertNotIn('tracing', self.post(self.QUERY, **{'X-CRM-Trace': '1'})['extensions'])
+        with mock.patch.object(tracing, 'TRACING_TOKEN', 'secret'):
+            self.assertNotIn('tracing', self.post(self.QUERY, **{'X-CRM-Trace': '1'})['extensions'])
+            self.assertIn('tracing', self.post(self.QUERY, **{'X-CRM-Trace': 'secret'})['extensions'])
+
+    def test_metrics_endpoint(self):
+        self.post(self.QUERY)
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('# TYPE crm_graphql_request_duration_seconds histogram', body)
+        self.assertIn('crm_graphql_resolver_duration_seconds_count{field="OrderType.customer"}', body)
+        self.assertIn('# TYPE crm_result_cache_hits counter', body)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('test_seconds', "Test", labelnames=('field',), buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value, field='Query.hello')
+        self.assertEqual(histogram.render().splitlines()[2:], [
+            'test_seconds_bucket{field="Query.hello",le="0.1"} 2',
+            'test_seconds_bucket{field="Query.hello",le="1"} 3',
+            'test_seconds_bucket{field="Query.hello",le="+Inf"} 4',
+            'test_seconds_sum{field="Query.hello"} 3.65',
+            'test_seconds_count{field="Query.hello"} 4',
+        ])
+
+
+class SearchFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = Customer.objects.create(name="Alice Smith", email="alice@example.com")
+        cls.bob = Customer.objects.create(name="Bob Alison", email="bob@example.com")
+        Customer.objects.create(name="Carol", email="carol@example.com")
+        keyboard = Product.objects.create(name="Wireless Keyboard", price=Decimal('49.99'), stock=5)
+        Product.objects.create(name="Keyboard", price=Decimal('19.99'), stock=5)
+        Product.objects.create(name="Mouse", price=Decimal('9.99'), stock=5)
+        add_order_lines(Order.objects.create(customer=cls.bob), [(keyboard, 1)])
+
+    def names(self, field, args):
+        result = graphql(self.client, f"{{ {field}({args}) {{ edges {{ node {{ name }} }} }} }}")
+        self.assertNotIn('errors', result)
+        return [edge['node']['name'] for edge in result['data'][field]['edges']]
+
+    def test_backend_matches_database(self):
+        from .search import SQLiteFTSBackend, get_search_backend
+        if connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 34):
+            self.assertIsInstance(get_search_backend(), SQLiteFTSBackend)
+
+    def test_name_filter_matches_substrings(self):
+        self.assertEqual(
+            sorted(self.names('allProducts', 'name: "YBOA"')), ["Keyboard", "Wireless Keyboard"]
+        )
+        # Below the trigram length the filter falls back to icontains
+        self.assertEqual(self.names('allProducts', 'name: "ou"'), ["Mouse"])
+
+    def test_search_is_ranked(self):
+        self.assertEqual(
+            self.names('allProducts', 'search: "keyboard"'), ["Keyboard", "Wireless Keyboard"]
+        )
+
+    def test_orders_filter_by_customer_and_product_name(self):
+        result = graphql(self.client, """
+            {
+                byCustomer: allOrders(customerName: "aliso") { edges { node { id } } }
+                byProduct: allOrders(productName: "wireless") { edges { node { id } } }
+                bySearch: allOrders(search: "bob") { edges { node { id } } }
+            }
+        """)['data']
+        self.assertEqual(len(result['byCustomer']['edges']), 1)
+        self.assertEqual(len(result['byProduct']['edges']), 1)
+        self.assertEqual(len(result['bySearch']['edges']), 1)
+
+    def test_index_follows_updates_and_deletes(self):
+        Customer.objects.filter(pk=self.alice.pk).update(name="Alicia Jones")
+        self.bob.delete()
+        from .filters import CustomerFilter
+        names = lambda value: list(
+            CustomerFilter(data={'name': value}, queryset=Customer.objects.all())
+            .qs.values_list('name', flat=True)
+        )
+        self.assertEqual(names("Smith"), [])
+        self.assertEqual(names("Jones"), ["Alicia Jones"])
+        self.assertEqual(names("Alison"), [])
+
+
+class BulkCreateCustomersTests(TestCase):
+    MUTATION = """
+        mutation Bulk($input: [CustomerInput]!) {
+            bulkCreateCustomers(input: $input) {
+                customers { name email }
+                errors
+                success
+            }
+        }
+    """
+
+    def test_reports_per_row_errors(self):
+        Customer.objects.create(name="Existing", email="existing@example.com")
+        rows = [
+            {'name': 'A', 'email': 'a@example.com', 'phone': '+1234567890'},
+            {'name': 'Existing', 'email': 'existing@example.com'},
+            {'name': 'B', 'email': 'b@example.com', 'phone': 'not-a-phone'},
+            {'name': 'A again', 'email': 'a@example.com'},
+            {'name': 'C', 'email': 'c@example.com', 'phone': '123-456-7890'},
+        ]
+        result = graphql(self.client, self.MUTATION, {'input': rows})['data']['bulkCreateCustomers']
+
+        self.assertTrue(result['success'])
+        self.assertEqual([c['email'] for c in result['customers']], ['a@example.com', 'c@example.com'])
+        self.assertEqual(result['errors'], [
+            "Customer 2: Email already exists",
+            "Customer 3: Invalid phone format",
+            "Customer 4: Email already exists",
+        ])
+        self.assertEqual(Customer.objects.count(), 3)
+
+    def test_query_count_does_not_grow_per_row(self):
+        rows = [{'name': f"C{i}", 'email': f"c{i}@example.com"} for i in range(200)]
+        with CaptureQueriesContext(connection) as ctx:
+            result = graphql(self.client, self.MUTATION, {'input': rows})
+        self.assertEqual(len(result['data']['bulkCreateCustomers']['customers']), 200)
+        self.assertLess(len(ctx.captured_queries), 10)
+
+
+class GenerateDataTests(TestCase):
+    END = date(2025, 1, 1)
+
+    def generate(self, *args, **options):
+        call_command('generate_data', *args, end=self.END, stdout=StringIO(), **options)
+
+    def snapshot(self):
+        return (
+            list(Customer.objects.order_by('pk').values_list('name', 'email', 'phone', 'created_at')),
+            list(Order.objects.order_by('pk').values_list('customer__email', 'total_amount', 'order_date')),
+            list(OrderItem.objects.order_by('pk').values_list('order__order_date', 'product__name',
+                                                              'quantity', 'unit_price')),
+        )
+
+    def test_rows_are_consistent(self):
+        self.generate(customers=50, products=20, orders=400, days=90, batch_size=64)
+
+        self.assertEqual(Customer.objects.count(), 50)
+        self.assertEqual(Product.objects.count(), 20)
+        self.assertEqual(Order.objects.count(), 400)
+        for order in Order.objects.annotate(lines=Sum(F('items__quantity') * F('items__unit_price'))):
+            self.assertEqual(order.total_amount, order.lines)
+        dates = list(Order.objects.order_by('pk').values_list('order_date', flat=True))
+        self.assertEqual(dates, sorted(dates))
+        self.assertGreaterEqual(dates[0].date(), self.END - timedelta(days=90))
+        self.assertLess(dates[-1].date(), self.END)
+
+    def test_same_seed_gives_same_data(self):
+        self.generate(customers=30, products=10, orders=100, seed=7)
+        first = self.snapshot()
+        self.generate(customers=30, products=10, orders=100, seed=7, flush=True)
+        self.assertEqual(self.snapshot(), first)
+
+        with self.assertRaisesMessage(CommandError, "seed 7 already exists"):
+            self.generate(customers=30, products=10, orders=100, seed=7)
+        self.generate(customers=30, products=10, orders=100, seed=8)
+        self.assertEqual(Customer.objects.count(), 60)
+
+    def test_flush_after_reminders(self):
+        self.generate(customers=10, products=5, orders=20, days=5)
+        now = timezone.make_aware(datetime.combine(self.END, datetime.min.time()))
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertEqual(reminders.send_order_reminders(os.path.join(tmp, 'log.txt'), now=now), 20)
+
+        self.generate(customers=10, products=5, orders=20, days=5, flush=True)
+        self.assertEqual(Order.objects.count(), 20)
+        self.assertFalse(OrderReminder.objects.exists())
+        self.assertFalse(JobWatermark.objects.exists())
+
+    def test_distributions(self):
+        self.generate(customers=100, products=50, orders=3000, days=366)
+
+        lines = sorted(Product.objects.annotate(lines=Count('order_items')).values_list('lines', flat=True))
+        self.assertGreater(lines[-1], 10 * lines[len(lines) // 2])
+        months = Counter(Order.objects.values_list('order_date__month', flat=True))
+        self.assertGreater(months[12], 1.4 * months[7])
+
+
+class BackgroundJobTests(TestCase):
+    BULK = """
+        mutation Bulk($input: [CustomerInput]!) {
+            bulkCreateCustomers(input: $input, background: true) {
+                success customers { id } job { id status processed total }
+            }
+        }
+    """
+    JOB = """
+        query Job($id: ID!) {
+            job(id: $id) {
+                kind status processed total progress throughput error
+                result {
+                    __typename
+                    ... on BulkCustomerMutationResponse { success errors customers { email } }
+                    ... on UpdateLowStockProductsResponse { success message updatedProducts { name stock } }
+                }
+            }
+        }
+    """
+
+    def job(self, job_id):
+        return graphql(self.client, self.JOB, {'id': job_id})['data']['job']
+
+    def test_bulk_create_customers_in_the_background(self):
+        rows = [{'name': f"C{i}", 'email': f"c{i}@example.com"} for i in range(5)]
+        rows.append({'name': 'Dup', 'email': 'c0@example.com'})
+        response = graphql(self.client, self.BULK, {'input': rows})['data']['bulkCreateCustomers']
+
+        self.assertTrue(response['success'])
+        self.assertEqual(response['customers'], [])
+        self.assertEqual(response['job']['status'], 'QUEUED')
+        self.assertEqual((response['job']['processed'], response['job']['total']), (0, 6))
+        self.assertFalse(Customer.objects.exists())
+
+        with mock.patch('crm.schema.BULK_CREATE_BATCH_SIZE', 2):
+            jobs.run_next()
+
+        job = self.job(response['job']['id'])
+        self.assertEqual(job['status'], 'SUCCEEDED')
+        self.assertEqual((job['processed'], job['total'], job['progress']), (6, 6, 1.0))
+        self.assertGreater(job['throughput'], 0)
+        self.assertEqual(job['result'], {
+            '__typename': 'BulkCustomerMutationResponse',
+            'success': True,
+            'errors': ["Customer 6: Email already exists"],
+            'customers': [{'email': f"c{i}@example.com"} for i in range(5)],
+        })
+
+    def test_update_low_stock_products_in_the_background(self):
+        Product.objects.create(name="Webcam", price=Decimal('89.99'), stock=3)
+        response = graphql(self.client, """
+            mutation { updateLowStockProducts(background: true) { message job { id kind } } }
+        """)['data']['updateLowStockProducts']
+        self.assertEqual(response['job']['kind'], 'update_low_stock_products')
+        self.assertIsNone(self.job(response['job']['id'])['result'])
+
+        jobs.run_next()
+        result = self.job(response['job']['id'])['result']
+        self.assertEqual(result['updatedProducts'], [{'name': 'Webcam', 'stock': 13}])
+        self.assertEqual(result['message'], "Successfully updated 1 products with low stock")
+
+    def test_failures_and_stale_jobs(self):
+        job = jobs.enqueue('update_low_stock_products', threshold=10, increment=10)
+        with mock.patch('crm.schema.UpdateLowStockProducts.restock', side_effect=RuntimeError("boom")):
+            jobs.run_next()
+        failed = self.job(str(job.pk))
+        self.assertEqual((failed['status'], failed['error'], failed['result']), ('FAILED', 'boom', None))
+
+        stale = jobs.enqueue('update_low_stock_products', threshold=10, increment=10)
+        jobs.claim('gone')
+        Job.objects.filter(pk=stale.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.fail_stale(), 1)
+        self.assertEqual(self.job(str(stale.pk))['error'], "Worker stopped responding")
+
+        self.assertIsNone(self.job('not-a-uuid'))
+        self.assertIsNone(jobs.run_next())
+
+
+class RunJobsCommandTests(TransactionTestCase):
+    def test_workers_share_the_queue(self):
+        queued = [
+            jobs.enqueue('bulk_create_customers', total=1, input=[{'name': f"C{i}", 'email': f"c{i}@example.com"}])
+            for i in range(6)
+        ]
+        with self.assertRaisesMessage(CommandError, "--allow-process-local"):
+            call_command('run_jobs', once=True, verbosity=0)
+        self.assertEqual(Job.objects.filter(status=Job.QUEUED).count(), 6)
+
+        call_command('run_jobs', workers=3, once=True, allow_process_local=True, verbosity=0)
+
+        self.assertEqual(
+            set(Job.objects.filter(pk__in=[job.pk for job in queued]).values_list('status', flat=True)),
+            {Job.SUCCEEDED},
+        )
+        self.assertEqual(Customer.objects.count(), 6)
+
+
+class UpdateLowStockProductsTests(TestCase):
+    MUTATION = """
+        mutation Restock($threshold: Int, $increment: Int) {
+            updateLowStockProducts(threshold: $threshold, increment: $increment) {
+                success
+                message
+                updatedProducts { name stock price }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.create(name="Webcam", price=Decimal('89.99'), stock=3)
+        Product.objects.create(name="Chair", price=Decimal('199.99'), stock=8)
+        Product.objects.create(name="Cable", price=Decimal('12.99'), stock=100)
+
+    def test_restocks_in_one_statement(self):
+        with CaptureQueriesContext(connection) as ctx:
+            result = graphql(self.client, self.MUTATION)['data']['updateLowStockProducts']
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['updatedProducts'], [
+            {'name': 'Chair', 'stock': 18, 'price': '199.99'},
+            {'name': 'Webcam', 'stock': 13, 'price': '89.99'},
+        ])
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Product.objects.get(name="Cable").stock, 100)
+
+    def test_threshold_and_increment_are_configurable(self):
+        result = graphql(self.client, self.MUTATION, {'threshold': 5, 'increment': 2})
+        result = result['data']['updateLowStockProducts']
+        self.assertEqual(result['updatedProducts'], [{'name': 'Webcam', 'stock': 5, 'price': '89.99'}])
+
+    def test_no_low_stock_products(self):
+        result = graphql(self.client, self.MUTATION, {'threshold': 1})['data']['updateLowStockProducts']
+        self.assertTrue(result['success'])
+        self.assertEqual(result['message'], "No products with low stock found")
+        self.assertEqual(result['updatedProducts'], [])
+
+    def test_fallback_without_returning(self):
+        with mock.patch('crm.services.supports_update_returning', return_value=False):
+            result = graphql(self.client, self.MUTATION)['data']['updateLowStockProducts']
+        self.assertEqual([p['stock'] for p in result['updatedProducts']], [18, 13])
+        self.assertEqual(Product.objects.get(name="Webcam").stock, 13)
+
+
+class CronJobTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log = os.path.join(directory.name, 'job.log')
+        # Any attempt at remote execution fails the test
+        for patcher in (
+            mock.patch.object(cron, 'get_session', side_effect=AssertionError("went remote")),
+            mock.patch.object(cron, 'JOB_EXECUTION', 'local'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def read_log(self):
+        with open(self.log) as f:
+            return f.read()
+
+    def test_update_low_stock_runs_in_process(self):
+        Product.objects.create(name="Webcam", price=Decimal('89.99'), stock=3)
+        # As with a shared event broker and cache
+        with mock.patch.object(cron, 'LOW_STOCK_LOG', self.log), \
+                mock.patch('crm.checks.cross_process_problems', return_value={}):
+            cron.update_low_stock()
+
+        log = self.read_log()
+        self.assertRegex(log, r"Low stock update successful \(local, [\d.]+ ms\)")
+        self.assertIn("Updated: Webcam - New stock: 13", log)
+        self.assertEqual(Product.objects.get().stock, 13)
+
+    def test_heartbeat_queries_the_schema(self):
+        with mock.patch.object(cron, 'HEARTBEAT_LOG', self.log):
+            cron.log_crm_heartbeat()
+        self.assertRegex(self.read_log(), r"CRM is alive - GraphQL endpoint responsive \(local, [\d.]+ ms\)")
+
+    def test_local_mutations_need_shared_infrastructure(self):
+        Product.objects.create(name="Webcam", price=Decimal('89.99'), stock=3)
+        with mock.patch.object(cron, 'LOW_STOCK_LOG', self.log):
+            cron.update_low_stock()
+        self.assertIn("Mutations can't run with CRM_JOB_EXECUTION = 'local' because CRM_EVENT_BROKER", self.read_log())
+        self.assertEqual(Product.objects.get().stock, 3)
+
+        messages = checks.check_shared_infrastructure(None)
+        self.assertEqual([message.id for message in messages], ['crm.W001', 'crm.W002'])
+        self.assertIn("local cron jobs", messages[0].msg)
+        with mock.patch.object(cron, 'JOB_EXECUTION', 'remote'):
+            self.assertNotIn("cron", checks.check_shared_infrastructure(None)[0].msg)
+
+    def test_execute(self):
+        with self.assertRaisesMessage(cron.JobError, "Cannot query field 'nope'"):
+            cron.execute("{ nope }")
+        with self.assertRaises(ImproperlyConfigured):
+            cron.execute("{ hello }", mode='carrier pigeon')
+
+
+class OrderReminderTests(TestCase):
+    NOW = timezone.make_aware(datetime(2026, 3, 10, 8, 0))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = Customer.objects.create(name="Alice", email="alice@example.com")
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log = os.path.join(directory.name, 'reminders.log')
+
+    def order(self, days_ago):
+        order = Order.objects.create(customer=self.alice)
+        Order.objects.filter(pk=order.pk).update(order_date=self.NOW - timedelta(days=days_ago))
+        return order
+
+    def run_job(self, **kwargs):
+        kwargs.setdefault('now', self.NOW)
+        return reminders.send_order_reminders(self.log, **kwargs)
+
+    def reminded(self, log):
+        return [
+            int(from_global_id(line.split("Order ID: ")[1].split(",")[0])[1])
+            for line in log.splitlines() if "Order ID:" in line
+        ]
+
+    def read_log(self):
+        with open(self.log) as f:
+            return f.read()
+
+    def test_only_new_orders_are_processed(self):
+        self.order(days_ago=10)
+        first = [self.order(days_ago=days).pk for days in (3, 2, 1)]
+
+        self.assertEqual(self.run_job(batch_size=2), 3)
+        self.assertEqual(self.reminded(self.read_log()), first)
+        self.assertEqual(set(OrderReminder.objects.values_list('order_id', flat=True)), set(first))
+
+        self.assertEqual(self.run_job(now=self.NOW + timedelta(days=1)), 0)
+        self.assertIn("No new orders found", self.read_log())
+
+        later = self.order(days_ago=0)
+        self.assertEqual(self.run_job(now=self.NOW + timedelta(days=1)), 1)
+        self.assertEqual(self.reminded(self.read_log()), first + [later.pk])
+        watermark = JobWatermark.objects.get(name=reminders.WATERMARK)
+        self.assertEqual(watermark.last_order_id, later.pk)
+
+    def test_reads_are_bounded_by_batch_size(self):
+        for _ in range(5):
+            self.order(days_ago=1)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.run_job(batch_size=2), 5)
+        selects = [q['sql'] for q in ctx.captured_queries if 'FROM "crm_order"' in q['sql']]
+        # Three batches and the empty read that ends the run
+        self.assertEqual(len(selects), 4)
+        self.assertTrue(all('LIMIT 2' in sql for sql in selects))
+
+    def test_late_commits_behind_the_watermark_are_caught(self):
+        newest = self.order(days_ago=1)
+        self.run_job()
+        late = Order.objects.create(customer=self.alice)
+        Order.objects.filter(pk=late.pk).update(
+            order_date=self.NOW - timedelta(days=1) - reminders.WATERMARK_OVERLAP / 2
+        )
+
+        self.assertEqual(self.run_job(), 1)
+        self.assertEqual(self.reminded(self.read_log()), [newest.pk, late.pk])
+        self.assertEqual(JobWatermark.objects.get().last_order_id, newest.pk)
+        self.assertEqual(self.run_job(), 0)
+
+
+class CustomerCleanupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        laptop = Product.objects.create(name="Laptop", price=Decimal('999.99'), stock=10)
+        cls.active = Customer.objects.create(name="Active", email="active@example.com")
+        cls.lapsed = Customer.objects.create(name="Lapsed", email="lapsed@example.com")
+        Customer.objects.create(name="Never", email="never@example.com")
+        recent = Order.objects.create(customer=cls.active)
+        add_order_lines(recent, [(laptop, 1)])
+        for customer in (cls.active, cls.lapsed):
+            old = Order.objects.create(customer=customer)
+            add_order_lines(old, [(laptop, 2)])
+            OrderReminder.objects.create(order=old)
+            Order.objects.filter(pk=old.pk).update(order_date=timezone.now() - timedelta(days=400))
+
+    def cleanup(self, *args):
+        out = StringIO()
+        call_command('clean_inactive_customers', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_only_counts(self):
+        self.assertEqual(
+            self.cleanup('--dry-run'), "Would delete 2 inactive customers and 1 orders\n"
+        )
+        self.assertEqual(Customer.objects.count(), 3)
+
+    def test_deletes_inactive_customers_in_chunks(self):
+        with CaptureQueriesContext(connection) as ctx:
+            output = self.cleanup('--chunk-size', '1')
+
+        self.assertRegex(
+            output, r"^Successfully deleted 2 inactive customers \(1 orders, 1 order lines\) .* rows/s\)"
+        )
+        self.assertEqual(list(Customer.objects.all()), [self.active])
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(OrderItem.objects.count(), 2)
+        self.assertEqual(OrderReminder.objects.count(), 1)
+        # Related rows are deleted by query, never loaded
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertFalse([sql for sql in selects if 'FROM "crm_orderitem"' in sql.split('WHERE')[0]])
+
+    def test_days(self):
+        self.assertIn("deleted 1 inactive customers", self.cleanup('--days', '500'))
+        self.assertEqual(Customer.objects.count(), 2)
+
+
+class OrderTotalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        cls.laptop = Product.objects.create(name="Laptop", price=Decimal('999.99'), stock=10)
+        cls.mouse = Product.objects.create(name="Mouse", price=Decimal('29.99'), stock=50)
+
+    def stored_total(self, order):
+        return Order.objects.values_list('total_amount', flat=True).get(pk=order.pk)
+
+    def test_total_follows_line_changes(self):
+        order = Order.objects.create(customer=self.customer)
+        add_order_lines(order, [(self.laptop, 1), (self.mouse, 3)])
+        self.assertEqual(order.total_amount, Decimal('1089.96'))
+        self.assertEqual(self.stored_total(order), Decimal('1089.96'))
+
+        item = OrderItem.objects.get(order=order, product=self.mouse)
+        item.quantity = 1
+        item.save()
+        self.assertEqual(self.stored_total(order), Decimal('1029.98'))
+
+        order.products.remove(self.laptop)
+        self.assertEqual(self.stored_total(order), Decimal('29.99'))
+        order.products.clear()
+        self.assertEqual(self.stored_total(order), Decimal('0.00'))
+
+    def test_totals_use_the_price_snapshot(self):
+        order = Order.objects.create(customer=self.customer)
+        add_order_lines(order, [(self.mouse, 2)])
+        Product.objects.filter(pk=self.mouse.pk).update(price=Decimal('99.00'))
+        order.calculate_total()
+        self.assertEqual(order.total_amount, Decimal('59.98'))
+
+    def test_m2m_add_recomputes_from_lines(self):
+        order = Order.objects.create(customer=self.customer)
+        self.mouse.orders.add(order, through_defaults={'quantity': 2, 'unit_price': self.mouse.price})
+        self.assertEqual(self.stored_total(order), Decimal('59.98'))
+        self.mouse.orders.clear()
+        self.assertEqual(self.stored_total(order), Decimal('0.00'))
+
+    def test_plain_save_is_a_single_query(self):
+        order = Order.objects.create(customer=self.customer)
+        add_order_lines(order, [(self.mouse, 1)])
+        with CaptureQueriesContext(connection) as ctx:
+            order.save()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(self.stored_total(order), Decimal('29.99'))
+
+    def test_create_order_mutation_with_quantities(self):
+        result = graphql(self.client, """
+            mutation Create($input: OrderInput!) {
+                createOrder(input: $input) {
+                    success
+                    order { totalAmount items { quantity unitPrice lineTotal product { name } } }
+                }
+            }
+        """, {'input': {
+            'customerId': self.customer.pk,
+            'productIds': [self.laptop.pk],
+            'items': [{'productId': self.mouse.pk, 'quantity': 3}],
+        }})
+        order = result['data']['createOrder']['order']
+        self.assertEqual(order['totalAmount'], '1089.96')
+        self.assertEqual(sorted((i['product']['name'], i['quantity']) for i in order['items']),
+                         [('Laptop', 1), ('Mouse', 3)])
+
+
+CREATE_ORDER_MUTATION = """
+    mutation Create($input: OrderInput!) {
+        createOrder(input: $input) { success errors order { totalAmount } }
+    }
+"""
+
+
+class StockReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        cls.laptop = Product.objects.create(name="Laptop", price=Decimal('999.99'), stock=2)
+        cls.mouse = Product.objects.create(name="Mouse", price=Decimal('29.99'), stock=5)
+
+    def create_order(self, items):
+        return graphql(self.client, CREATE_ORDER_MUTATION, {'input': {
+            'customerId': self.customer.pk,
+            'items': [{'productId': p.pk, 'quantity': q} for p, q in items],
+        }})['data']['createOrder']
+
+    def test_stock_is_decremented(self):
+        result = self.create_order([(self.laptop, 2), (self.mouse, 1)])
+        self.assertTrue(result['success'])
+        self.assertEqual(Product.objects.get(pk=self.laptop.pk).stock, 0)
+        self.assertEqual(Product.objects.get(pk=self.mouse.pk).stock, 4)
+
+    def test_insufficient_stock_rolls_back(self):
+        result = self.create_order([(self.mouse, 1), (self.laptop, 3)])
+        self.assertFalse(result['success'])
+        self.assertEqual(result['errors'], ["Insufficient stock for: Laptop"])
+        self.assertEqual(Product.objects.get(pk=self.mouse.pk).stock, 5)
+        self.assertFalse(Order.objects.exists())
+
+    def test_conditional_update_guards_against_stale_stock(self):
+        # Simulate another checkout taking the stock after our rows were read
+        products = {self.laptop.pk: Product.objects.get(pk=self.laptop.pk)}
+        Product.objects.filter(pk=self.laptop.pk).update(stock=0)
+        from .services import InsufficientStock, reserve_stock
+        with self.assertRaises(InsufficientStock):
+            reserve_stock(products, {self.laptop.pk: 1})
+        self.assertEqual(Product.objects.get(pk=self.laptop.pk).stock, 0)
+
+
+class BulkCreateOrdersTests(TestCase):
+    MUTATION = """
+        mutation Bulk($input: [OrderInput]!) {
+            bulkCreateOrders(input: $input) {
+                success errors
+                orders { totalAmount customer { email } items { quantity unitPrice product { name } } }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        cls.bob = Customer.objects.create(name="Bob", email="bob@example.com")
+        cls.laptop = Product.objects.create(name="Laptop", price=Decimal('999.99'), stock=2)
+        cls.mouse = Product.objects.create(name="Mouse", price=Decimal('29.99'), stock=5)
+
+    def bulk_create(self, rows):
+        return graphql(self.client, self.MUTATION, {'input': rows})['data']['bulkCreateOrders']
+
+    def test_valid_orders_are_created_and_invalid_ones_reported(self):
+        result = self.bulk_create([
+            {'customerId': self.alice.pk, 'productIds': [self.laptop.pk],
+             'items': [{'productId': self.mouse.pk, 'quantity': 3}]},
+            {'customerId': 999999, 'productIds': [self.mouse.pk]},
+            {'customerId': self.bob.pk, 'productIds': [999999]},
+            {'customerId': self.bob.pk, 'productIds': []},
+            {'customerId': 'abc', 'productIds': [self.mouse.pk]},
+            # Only one laptop is left after the first order
+            {'customerId': self.bob.pk, 'items': [{'productId': self.laptop.pk, 'quantity': 2}]},
+            {'customerId': self.bob.pk, 'items': [{'productId': self.laptop.pk, 'quantity': 1},
+                                                  {'productId': self.mouse.pk, 'quantity': 2}]},
+        ])
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['errors'], [
+            "Order 2: Invalid customer ID",
+            "Order 3: One or more invalid product IDs",
+            "Order 4: At least one product must be selected",
+            "Order 5: Invalid customer ID",
+            "Order 6: Insufficient stock for: Laptop",
+        ])
+        self.assertEqual(
+            [(order['customer']['email'], order['totalAmount']) for order in result['orders']],
+            [('alice@example.com', '1089.96'), ('bob@example.com', '1059.97')],
+        )
+        self.assertEqual(
+            sorted((item['product']['name'], item['quantity']) for item in result['orders'][0]['items']),
+            [('Laptop', 1), ('Mouse', 3)],
+        )
+
+        # Stored totals match what createOrder maintains
+        for order in Order.objects.all():
+            self.assertEqual(order.total_amount, order.calculate_total())
+        self.assertEqual(
+            dict(Product.objects.values_list('name', 'stock')), {'Laptop': 0, 'Mouse': 0},
+        )
+
+    def test_query_count_does_not_grow_with_orders(self):
+        def run(count):
+            rows = [
+                {'customerId': self.alice.pk, 'items': [{'productId': self.mouse.pk, 'quantity': 1}]}
+                for _ in range(count)
+            ]
+            Product.objects.filter(pk=self.mouse.pk).update(stock=100)
+            with CaptureQueriesContext(connection) as ctx:
+                result = graphql(self.client, """
+                    mutation Bulk($input: [OrderInput]!) { bulkCreateOrders(input: $input) { success } }
+                """, {'input': rows})
+            self.assertTrue(result['data']['bulkCreateOrders']['success'])
+            return len(ctx.captured_queries)
+
+        self.assertEqual(run(2), run(40))
+        self.assertEqual(Order.objects.count(), 42)
+
+    def test_nothing_valid(self):
+        result = self.bulk_create([{'customerId': self.alice.pk, 'productIds': [999999]}])
+        self.assertEqual(result, {
+            'success': False, 'orders': [], 'errors': ["Order 1: One or more invalid product IDs"],
+        })
+        self.assertFalse(Order.objects.exists())
+
+
+class ResultCacheTests(TestCase):
+    PRODUCT_QUERY = "query P($id: ID) { product(id: $id) { name stock } }"
+    LOW_STOCK_QUERY = "{ allProducts(lowStock: true) { edges { node { name stock } } } }"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        cls.mouse = Product.objects.create(name="Mouse", price=Decimal('29.99'), stock=5)
+        Product.objects.create(name="Laptop", price=Decimal('999.99'), stock=50)
+
+    def setUp(self):
+        cache.clear()
+        result_cache.metrics.reset()
+
+    def product_stock(self):
+        return graphql(self.client, self.PRODUCT_QUERY, {'id': self.mouse.pk})['data']['product']['stock']
+
+    def low_stock(self):
+        edges = graphql(self.client, self.LOW_STOCK_QUERY)['data']['allProducts']['edges']
+        return [(edge['node']['name'], edge['node']['stock']) for edge in edges]
+
+    def test_repeated_reads_skip_the_database(self):
+        self.assertEqual(self.product_stock(), 5)
+        self.assertEqual(self.low_stock(), [("Mouse", 5)])
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.product_stock(), 5)
+            self.assertEqual(self.low_stock(), [("Mouse", 5)])
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(result_cache.metrics.stats()['hits'], 2)
+
+        # Different arguments are cached separately
+        result = graphql(self.client, "{ allProducts(lowStock: false) { edges { node { name } } } }")
+        self.assertEqual(len(result['data']['allProducts']['edges']), 2)
+
+    def test_saves_invalidate(self):
+        self.product_stock()
+        self.mouse.stock = 2
+        self.mouse.save()
+        self.assertEqual(self.product_stock(), 2)
+        self.assertGreater(result_cache.metrics.stats()['invalidations']['crm.product'], 0)
+
+    def test_bulk_writes_invalidate(self):
+        self.assertEqual(self.low_stock(), [("Mouse", 5)])
+        graphql(self.client, """
+            mutation { updateLowStockProducts(threshold: 10, increment: 1) { success } }
+        """)
+        self.assertEqual(self.low_stock(), [("Mouse", 6)])
+        self.assertEqual(self.product_stock(), 6)
+
+        result = graphql(self.client, CREATE_ORDER_MUTATION, {'input': {
+            'customerId': self.customer.pk, 'productIds': [self.mouse.pk, self.mouse.pk],
+        }})
+        self.assertTrue(result['data']['createOrder']['success'])
+        self.assertEqual(self.low_stock(), [("Mouse", 4)])
+        self.assertEqual(self.product_stock(), 4)
+
+
+class EventBrokerTests(TestCase):
+    async def test_publish_from_another_thread(self):
+        broker = events.InProcessBroker(queue_size=2)
+        messages = broker.subscribe('channel')
+        first = asyncio.ensure_future(anext(messages))
+        while not broker.subscriber_count('channel'):
+            await asyncio.sleep(0.01)
+
+        thread = threading.Thread(target=lambda: [broker.publish('channel', n) for n in range(4)])
+        thread.start()
+        thread.join()
+        # The subscriber kept the newest messages it had room for
+        self.assertEqual([await first, await anext(messages)], [2, 3])
+
+        await messages.aclose()
+        self.assertEqual(broker.subscriber_count('channel'), 0)
+
+    def test_events_wait_for_commit(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        with mock.patch.object(events.get_broker(), 'publish') as publish:
+            with self.captureOnCommitCallbacks() as callbacks:
+                order = Order.objects.create(customer=customer)
+            publish.assert_not_called()
+            for callback in callbacks:
+                callback()
+        publish.assert_called_once_with(events.ORDER_CREATED, {'order_id': order.pk})
+
+    def test_saves_publish_only_stock_changes(self):
+        product = Product.objects.create(name="Lamp", price=Decimal('12.50'), stock=12)
+        product = Product.objects.get(pk=product.pk)
+        with mock.patch.object(events.get_broker(), 'publish') as publish, \
+                self.captureOnCommitCallbacks(execute=True):
+            product.price = Decimal('13.00')
+            product.save()
+            product.stock = 12
+            product.save(update_fields=['stock'])
+
+            product.stock = 9
+            product.save()
+            product.save()
+            Product.objects.only('name').get(pk=product.pk).save()
+        publish.assert_called_once_with(
+            events.STOCK_CHANGED, {'product_id': product.pk, 'stock': 9, 'previous_stock': 12},
+        )
+
+    def test_low_stock_fires_on_the_downward_crossing(self):
+        def message(stock, previous):
+            return {'product_id': 1, 'stock': stock, 'previous_stock': previous}
+
+        self.assertTrue(events.crossed_below(message(9, 10), 10))
+        self.assertTrue(events.crossed_below(message(3, None), 10))
+        self.assertFalse(events.crossed_below(message(8, 9), 10))
+        self.assertFalse(events.crossed_below(message(10, 12), 10))
+        self.assertFalse(events.crossed_below(message(9, 3), 10))
+
+
+class WebSocket:
+    """Drives crm.subscriptions through the ASGI application"""
+
+    def __init__(self, path='/graphql', subprotocols=('graphql-transport-ws',)):
+        from alx_backend_graphql_crm.asgi import application
+
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+        scope = {'type': 'websocket', 'path': path, 'subprotocols': list(subprotocols), 'headers': []}
+        self.task = asyncio.ensure_future(application(scope, self.incoming.get, self.outgoing.put))
+
+    async def connect(self):
+        await self.incoming.put({'type': 'websocket.connect'})
+        return await self.receive_event()
+
+    async def receive_event(self):
+        return await asyncio.wait_for(self.outgoing.get(), timeout=5)
+
+    async def send(self, **message):
+        await self.incoming.put({'type': 'websocket.receive', 'text': json.dumps(message)})
+
+    async def receive(self):
+        return json.loads((await self.receive_event())['text'])
+
+    async def disconnect(self):
+        await self.incoming.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(self.task, timeout=5)
+
+
+class SubscriptionTests(TransactionTestCase):
+    async def wait_for_subscribers(self, channel, count):
+        broker = events.get_broker()
+        while broker.subscriber_count(channel) != count:
+            await asyncio.sleep(0.01)
+
+    async def test_order_and_stock_events(self):
+        customer = await Customer.objects.acreate(name="Alice", email="alice@example.com")
+        lamp = await Product.objects.acreate(name="Lamp", price=Decimal('12.50'), stock=12)
+        mouse = await Product.objects.acreate(name="Mouse", price=Decimal('29.99'), stock=50)
+
+        socket = WebSocket()
+        accept = await socket.connect()
+        self.assertEqual(accept['subprotocol'], 'graphql-transport-ws')
+        await socket.send(type='connection_init')
+        self.assertEqual(await socket.receive(), {'type': 'connection_ack'})
+
+        await socket.send(type='subscribe', id='orders', payload={
+            'query': "subscription { orderCreated { totalAmount customer { name } items { quantity } } }",
+        })
+        await socket.send(type='subscribe', id='low', payload={
+            'query': "subscription { lowStock(threshold: 10) { name stock } }",
+        })
+        await socket.send(type='subscribe', id='lamp', payload={
+            'query': "subscription Lamp($id: ID!) { stockChanged(productId: $id) { stock } }",
+            'variables': {'id': lamp.pk},
+        })
+        await asyncio.wait_for(self.wait_for_subscribers(events.STOCK_CHANGED, 2), timeout=5)
+        await asyncio.wait_for(self.wait_for_subscribers(events.ORDER_CREATED, 1), timeout=5)
+
+        result = await sync_to_async(graphql)(Client(), CREATE_ORDER_MUTATION, {'input': {
+            'customerId': customer.pk,
+            'items': [{'productId': lamp.pk, 'quantity': 3}, {'productId': mouse.pk, 'quantity': 1}],
+        }})
+        self.assertTrue(result['data']['createOrder']['success'])
+
+        # The mouse's stock change is neither low nor the lamp's
+        received = {}
+        for _ in range(3):
+            message = await socket.receive()
+            self.assertEqual(message['type'], 'next')
+            received[message['id']] = message['payload']['data']
+        self.assertEqual(received, {
+            'orders': {'orderCreated': {
+                'totalAmount': '67.49', 'customer': {'name': "Alice"},
+                'items': [{'quantity': 3}, {'quantity': 1}],
+            }},
+            'low': {'lowStock': {'name': "Lamp", 'stock': 9}},
+            'lamp': {'stockChanged': {'stock': 9}},
+        })
+
+        await socket.send(type='complete', id='low')
+        await asyncio.wait_for(self.wait_for_subscribers(events.STOCK_CHANGED, 1), timeout=5)
+        await socket.disconnect()
+        self.assertEqual(events.get_broker().subscriber_count(events.ORDER_CREATED), 0)
+
+    async def test_low_stock_only_on_crossing(self):
+        lamp = await Product.objects.acreate(name="Lamp", price=Decimal('12.50'), stock=12)
+        socket = WebSocket()
+        await socket.connect()
+        await socket.send(type='connection_init')
+        await socket.receive()
+        await socket.send(type='subscribe', id='low', payload={
+            'query': "subscription { lowStock(threshold: 10) { name stock } }",
+        })
+        await asyncio.wait_for(self.wait_for_subscribers(events.STOCK_CHANGED, 1), timeout=5)
+
+        async def next_low_stock():
+            message = await socket.receive()
+            self.assertEqual(message['type'], 'next')
+            return message['payload']['data']['lowStock']['stock']
+
+        lamp = await Product.objects.aget(pk=lamp.pk)
+        lamp.stock = 9
+        await lamp.asave()
+        self.assertEqual(await next_low_stock(), 9)
+
+        # 8 was already low, 15 isn't, and the repeated 8 and price change leave stock alone
+        for stock in (8, 8, 15, 4):
+            lamp.stock = stock
+            await lamp.asave()
+        lamp.price = Decimal('11.00')
+        await lamp.asave()
+        self.assertEqual(await next_low_stock(), 4)
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(socket.outgoing.get(), timeout=0.2)
+        await socket.disconnect()
+
+    async def test_queries_and_protocol_errors(self):
+        socket = WebSocket()
+        await socket.connect()
+        await socket.send(type='connection_init')
+        await socket.receive()
+        await socket.send(type='subscribe', id='1', payload={'query': "{ hello }"})
+        self.assertEqual(await socket.receive(), {
+            'type': 'next', 'id': '1', 'payload': {'data': {'hello': "Hello, GraphQL!"}},
+        })
+        self.assertEqual(await socket.receive(), {'type': 'complete', 'id': '1'})
+        await socket.send(type='subscribe', id='2', payload={'query': "subscription { nope }"})
+        message = await socket.receive()
+        self.assertEqual(message['type'], 'error')
+        self.assertIn("Cannot query field 'nope'", message['payload'][0]['message'])
+        await socket.disconnect()
+
+        socket = WebSocket()
+        await socket.connect()
+        await socket.send(type='subscribe', id='1', payload={'query': "{ hello }"})
+        self.assertEqual((await socket.receive_event())['code'], 4401)
+        await socket.disconnect()
+
+        socket = WebSocket(subprotocols=['graphql-ws'])
+        self.assertEqual((await socket.connect())['code'], 4406)
+        await socket.disconnect()
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    CHECKOUTS = 20
+    STOCK = 7
+
+    def test_concurrent_orders_never_oversell(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        product = Product.objects.create(name="Mouse", price=Decimal('29.99'), stock=self.STOCK)
+        variables = {'input': {'customerId': customer.pk, 'productIds': [product.pk]}}
+        results, latencies = [], []
+        start = threading.Barrier(self.CHECKOUTS)
+
+        def checkout():
+            try:
+                start.wait()
+                began = time.monotonic()
+                result = graphql(Client(), CREATE_ORDER_MUTATION, variables)
+                latencies.append(time.monotonic() - began)
+                results.append(result['data']['createOrder'])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout) for _ in range(self.CHECKOUTS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        successes = sum(1 for result in results if result['success'])
+        product.refresh_from_db()
+        self.assertEqual(len(results), self.CHECKOUTS)
+        self.assertEqual(successes, self.STOCK)
+        self.assertTrue(all(
+            result['errors'] == ["Insufficient stock for: Mouse"]
+            for result in results if not result['success']
+        ))
+        self.assertEqual(product.stock, self.STOCK - successes)
+        self.assertEqual(OrderItem.objects.filter(product=product).count(), successes)
+        self.assertLess(max(latencies), 5)
@@ -0,0 +1,214 @@
+"""
+Per-request resolver and SQL instrumentation.
+
+GraphQLView runs each operation inside ``trace(request)``. While it's
+active, TracingMiddleware (``GRAPHENE['MIDDLEWARE']``) times every resolver
+and ``sql_wrapper`` (installed on each database connection) times every
+statement and spots statements repeated with the same parameters. The
+trace is found through a context variable, which follows the request
+through ``sync_to_async`` hops.
+
+Every trace is aggregated into the crm.metrics histograms served at
+``/metrics``. Requests carrying the ``CRM_TRACING_HEADER`` header also get
+the trace under ``extensions.tracing``, in the Apollo tracing layout plus
+``sql`` and per-field totals. The header is honoured when ``DEBUG`` is on
+or when its value equals ``CRM_TRACING_TOKEN``, since traces contain SQL.
+"""
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from inspect import isawaitable
+
+from django.conf import settings
+
+from . import persisted_queries, result_cache
+from .metrics import COUNT_BUCKETS, registry
+
+TRACING_HEADER = getattr(settings, 'CRM_TRACING_HEADER', 'X-CRM-Trace')
+TRACING_TOKEN = getattr(settings, 'CRM_TRACING_TOKEN', None)
+# Slowest resolver calls listed in a returned trace
+TRACE_RESOLVER_LIMIT = 50
+
+request_duration = registry.histogram(
+    'crm_graphql_request_duration_seconds', "Time to execute a GraphQL operation",
+)
+request_queries = registry.histogram(
+    'crm_graphql_request_sql_queries', "SQL statements executed per GraphQL operation",
+    buckets=COUNT_BUCKETS,
+)
+request_sql_duration = registry.histogram(
+    'crm_graphql_request_sql_duration_seconds', "Time spent in SQL per GraphQL operation",
+)
+duplicate_queries = registry.counter(
+    'crm_graphql_duplicate_sql_queries', "SQL statements repeated with the same parameters within an operation",
+)
+resolver_duration = registry.histogram(
+    'crm_graphql_resolver_duration_seconds', "Time spent resolving a field per GraphQL operation",
+    labelnames=('field',),
+)
+registry.callback(
+    'crm_result_cache_hits', "Resolver result cache hits", lambda: result_cache.metrics.hits, 'counter',
+)
+registry.callback(
+    'crm_result_cache_misses', "Resolver result cache misses", lambda: result_cache.metrics.misses, 'counter',
+)
+registry.callback(
+    'crm_result_cache_invalidations', "Resolver result cache generation bumps",
+    lambda: sum(result_cache.metrics.invalidations.values()), 'counter',
+)
+registry.callback(
+    'crm_document_cache_hits', "Parsed document cache hits",
+    lambda: persisted_queries.document_cache.hits, 'counter',
+)
+registry.callback(
+    'crm_document_cache_misses', "Parsed document cache misses",
+    lambda: persisted_queries.document_cache.misses, 'counter',
+)
+registry.callback(
+    'crm_document_cache_size', "Parsed documents cached",
+    lambda: persisted_queries.document_cache.stats()['size'],
+)
+
+_current = ContextVar('crm_trace', default=None)
+
+
+class RequestTrace:
+    def __init__(self, detailed=False):
+        self.detailed = detailed
+        self.start_time = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        self.duration = None
+        self.sql_count = 0
+        self.sql_duration = 0.0
+        self.statements = Counter()
+        # 'Type.field' -> [calls, seconds]
+        self.fields = {}
+        self.resolvers = []
+        self._lock = threading.Lock()
+
+    def record_resolver(self, info, started, finished):
+        coordinate = f'{info.parent_type.name}.{info.field_name}'
+        with self._lock:
+            totals = self.fields.setdefault(coordinate, [0, 0.0])
+            totals[0] += 1
+            totals[1] += finished - started
+            if self.detailed:
+                self.resolvers.append({
+                    'path': info.path.as_list(),
+                    'parentType': info.parent_type.name,
+                    'fieldName': info.field_name,
+                    'returnType': str(info.return_type),
+                    'startOffset': int((started - self.started) * 1e9),
+                    'duration': int((finished - started) * 1e9),
+                })
+
+    def record_sql(self, sql, params, many, duration):
+        with self._lock:
+            self.sql_count += 1
+            self.sql_duration += duration
+            # executemany() batches are never repeats worth reporting
+            if not many:
+                self.statements[(sql, repr(params))] += 1
+
+    def duplicates(self):
+        return {key: count for key, count in self.statements.items() if count > 1}
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+        request_duration.observe(self.duration)
+        request_queries.observe(self.sql_count)
+        request_sql_duration.observe(self.sql_duration)
+        repeats = sum(count - 1 for count in self.duplicates().values())
+        if repeats:
+            duplicate_queries.inc(repeats)
+        for coordinate, (_, seconds) in self.fields.items():
+            resolver_duration.observe(seconds, field=coordinate)
+
+    def report(self):
+        """The trace for ``extensions.tracing``; durations in nanoseconds as in Apollo tracing"""
+        end_time = self.start_time.timestamp() + self.duration
+        slowest = sorted(self.resolvers, key=lambda resolver: resolver['duration'], reverse=True)
+        return {
+            'version': 1,
+            'startTime': self.start_time.isoformat(),
+            'endTime': datetime.fromtimestamp(end_time, timezone.utc).isoformat(),
+            'duration': int(self.duration * 1e9),
+            'execution': {'resolvers': slowest[:TRACE_RESOLVER_LIMIT]},
+            'fields': {
+                coordinate: {'count': count, 'duration': int(seconds * 1e9)}
+                for coordinate, (count, seconds) in sorted(
+                    self.fields.items(), key=lambda item: item[1][1], reverse=True
+                )
+            },
+            'sql': {
+                'count': self.sql_count,
+                'duration': int(self.sql_duration * 1e9),
+                'duplicates': [
+                    {'sql': sql, 'params': params, 'count': count}
+                    for (sql, params), count in sorted(
+                        self.duplicates().items(), key=lambda item: item[1], reverse=True
+                    )
+                ],
+            },
+        }
+
+
+def wants_trace(request):
+    value = request.headers.get(TRACING_HEADER)
+    if not value:
+        return False
+    return settings.DEBUG or (TRACING_TOKEN is not None and value == TRACING_TOKEN)
+
+
+@contextmanager
+def trace(request):
+    """Trace the operation executed inside the block"""
+    request_trace = RequestTrace(detailed=wants_trace(request))
+    token = _current.set(request_trace)
+    try:
+        yield request_trace
+    finally:
+        _current.reset(token)
+        request_trace.finish()
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    request_trace = _current.get()
+    if request_trace is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        request_trace.record_sql(sql, params, many, time.perf_counter() - started)
+
+
+def install_sql_wrapper(sender, connection, **kwargs):
+    """connection_created receiver"""
+    if sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_wrapper)
+
+
+class TracingMiddleware:
+    """Times resolvers while a trace is active"""
+
+    def resolve(self, next, root, info, **args):
+        request_trace = _current.get()
+        if request_trace is None:
+            return next(root, info, **args)
+        started = time.perf_counter()
+        result = next(root, info, **args)
+        if isawaitable(result):
+            return self._await(result, request_trace, info, started)
+        request_trace.record_resolver(info, started, time.perf_counter())
+        return result
+
+    @staticmethod
+    async def _await(result, request_trace, info, started):
+        try:
+            return await result
+        finally:
+            request_trace.record_resolver(info, started, time.perf_counter())
@@ -1,3 +1,290 @@
-from django.shortcuts import render
+import json
+from inspect import isawaitable
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection, transaction
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView as BaseGraphQLView, HttpError
+from graphql import (
+    ExecutionResult, GraphQLError, MiddlewareManager, OperationType, execute, get_operation_ast,
+    specified_rules, validate_schema,
+)
+
+from . import tracing
+from .async_execution import SyncResolverMiddleware
+from .complexity import MAX_QUERY_COST, QueryCostRule, operation_costs
+from .export import CONTENT_TYPES, ExportError, aiter_lines, export_lines
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, registry
+from .persisted_queries import load_document
+
+
+class GraphQLView(BaseGraphQLView):
+    """
+    GraphQLView serving automatic persisted queries.
+
+    Documents come from crm.persisted_queries, which skips parse and
+    validate for queries it has seen. Validation includes the query cost
+    budget, and the executed operation's estimated cost is reported under
+    ``extensions.cost``.
+    """
+
+    validation_rules = (*specified_rules, QueryCostRule)
+
+    def get_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        self.extensions = self.get_extensions(request, data)
+        self.response_extensions = {}
+
+        with tracing.trace(request) as trace:
+            execution_result = self.execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+        self.add_trace(trace)
+        return self.build_response(request, execution_result, id, show_graphiql)
+
+    async def aget_response(self, request, data):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        self.extensions = self.get_extensions(request, data)
+        self.response_extensions = {}
+
+        with tracing.trace(request) as trace:
+            execution_result = await self.aexecute_graphql_request(
+                request, query, variables, operation_name
+            )
+        self.add_trace(trace)
+        return self.build_response(request, execution_result, id)
+
+    def add_trace(self, trace):
+        if trace.detailed:
+            self.response_extensions['tracing'] = trace.report()
+
+    def build_response(self, request, execution_result, id=None, show_graphiql=False):
+        # As GraphQLView.get_response, plus the response's ``extensions``
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if execution_result:
+            response = {}
+
+            if execution_result.errors:
+                set_rollback()
+                response["errors"] = [
+                    self.format_error(e) for e in execution_result.errors
+                ]
+
+            if execution_result.errors and any(
+                not getattr(e, "path", None) for e in execution_result.errors
+            ):
+                status_code = 400
+            else:
+                response["data"] = execution_result.data
+
+            if self.response_extensions:
+                response["extensions"] = self.response_extensions
+
+            if self.batch:
+                response["id"] = id
+                response["status"] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+        else:
+            result = None
+
+        return result, status_code
+
+    @staticmethod
+    def get_extensions(request, data):
+        extensions = request.GET.get('extensions') or data.get('extensions')
+        if extensions and isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        return extensions
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        prepared = self.prepare_document(request, query, operation_name, show_graphiql)
+        if not isinstance(prepared, tuple):
+            return prepared
+        document, operation_ast = prepared
+        return self.execute_document(request, document, operation_ast, variables, operation_name)
+
+    def prepare_document(self, request, query, operation_name, show_graphiql=False):
+        """
+        Load and validate the request's document. Returns ``(document,
+        operation_ast)`` ready to execute, or the ExecutionResult (None for
+        GraphiQL) to respond with instead.
+        """
+        if not query and not self.extensions:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors)
+
+        try:
+            document, validation_errors, costs = load_document(
+                schema, query, self.extensions, self.validation_rules,
+                graphene_settings.MAX_VALIDATION_ERRORS, analyze=operation_costs,
+            )
+        except GraphQLError as e:
+            return ExecutionResult(errors=[e])
+
+        operation_ast = get_operation_ast(document, operation_name)
+        if costs and operation_ast is not None:
+            cost, depth = costs[operation_ast.name.value if operation_ast.name else None]
+            self.response_extensions['cost'] = {
+                'requested': cost, 'depth': depth, 'limit': MAX_QUERY_COST,
+            }
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        if validation_errors:
+            return ExecutionResult(data=None, errors=validation_errors)
+
+        return document, operation_ast
+
+    def execute_options(self, request, variables, operation_name):
+        options = {
+            "root_value": self.get_root_value(request),
+            "context_value": self.get_context(request),
+            "variable_values": variables,
+            "operation_name": operation_name,
+            "middleware": self.get_middleware(request),
+        }
+        if self.execution_context_class:
+            options["execution_context_class"] = self.execution_context_class
+        return options
+
+    def execute_document(self, request, document, operation_ast, variables, operation_name):
+        schema = self.schema.graphql_schema
+        try:
+            execute_options = self.execute_options(request, variables, operation_name)
+
+            if (
+                operation_ast is not None
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                )
+            ):
+                with transaction.atomic():
+                    result = execute(schema, document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+
+            return execute(schema, document, **execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+    async def aexecute_graphql_request(self, request, query, variables, operation_name):
+        """
+        Queries execute on the event loop (see crm.async_execution);
+        mutations are sequential and transactional, so they run whole on the
+        request's thread.
+        """
+        prepared = self.prepare_document(request, query, operation_name)
+        if not isinstance(prepared, tuple):
+            return prepared
+        document, operation_ast = prepared
+
+        if operation_ast is None or operation_ast.operation != OperationType.QUERY:
+            return await sync_to_async(self.execute_document)(
+                request, document, operation_ast, variables, operation_name
+            )
+
+        request.crm_async = True
+        try:
+            execute_options = self.execute_options(request, variables, operation_name)
+            middleware = execute_options["middleware"] or ()
+            if isinstance(middleware, MiddlewareManager):
+                middleware = middleware.middlewares
+            execute_options["middleware"] = [*middleware, SyncResolverMiddleware()]
+            result = execute(self.schema.graphql_schema, document, **execute_options)
+            if isawaitable(result):
+                result = await result
+            return result
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+
+@csrf_exempt
+async def graphql_async(request):
+    """The GraphQL API for ASGI servers, without GraphiQL or batching"""
+    view = GraphQLView()
+    try:
+        if request.method not in ("GET", "POST"):
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                )
+            )
+        data = view.parse_body(request)
+        result, status_code = await view.aget_response(request, data)
+    except HttpError as e:
+        response = e.response
+        response["Content-Type"] = "application/json"
+        response.content = view.json_encode(request, {"errors": [view.format_error(e)]})
+        return response
+
+    return HttpResponse(status=status_code, content=result, content_type="application/json")
+
+
+@require_GET
+def export(request, name):
+    """
+    Stream an export as NDJSON (default) or CSV.
+
+    ``?format=csv`` picks the encoding; every other query parameter is a
+    filter, named as on the GraphQL connection, e.g.
+    ``/export/orders?orderDate_Gte=2025-01-01T00:00:00``.
+    """
+    filters = request.GET.dict()
+    export_format = filters.pop('format', 'ndjson')
+    try:
+        lines = export_lines(name, export_format, filters)
+    except ExportError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    if isinstance(request, ASGIRequest):
+        lines = aiter_lines(lines)
+    response = StreamingHttpResponse(lines, content_type=CONTENT_TYPES[export_format])
+    extension = 'csv' if export_format == 'csv' else 'ndjson'
+    response['Content-Disposition'] = f'attachment; filename="{name}.{extension}"'
+    return response
+
+
+@require_GET
+def metrics(request):
+    """This worker's metrics in the Prometheus text format"""
+    return HttpResponse(registry.render(), content_type=METRICS_CONTENT_TYPE)
@@ -7,6 +7,7 @@ Run this script to populate the database with sample data
 import os
 import sys
 import django
+from collections import defaultdict
 from decimal import Decimal
 
 # Setup Django environment
@@ -14,7 +15,8 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
 django.setup()
 
-from crm.models import Customer, Product, Order
+from crm.models import Customer, Product, Order, OrderItem
+from crm.services import add_order_lines
 
 def seed_customers():
     """Create sample customers"""
@@ -26,19 +28,15 @@ def seed_customers():
         {"name": "Eve Brown", "email": "eve@example.com", "phone": "+1122334455"},
     ]
     
-    created_customers = []
-    for customer_data in customers_data:
-        customer, created = Customer.objects.get_or_create(
-            email=customer_data["email"],
-            defaults=customer_data
-        )
-        if created:
-            print(f"Created customer: {customer.name}")
-        else:
-            print(f"Customer already exists: {customer.name}")
-        created_customers.append(customer)
-    
-    return created_customers
+    existing = Customer.objects.in_bulk([c["email"] for c in customers_data], field_name="email")
+    for customer in existing.values():
+        print(f"Customer already exists: {customer.name}")
+    missing = [Customer(**c) for c in customers_data if c["email"] not in existing]
+    for customer in Customer.objects.bulk_create(missing):
+        print(f"Created customer: {customer.name}")
+        existing[customer.email] = customer
+    
+    return [existing[c["email"]] for c in customers_data]
 
 def seed_products():
     """Create sample products"""
@@ -53,19 +51,18 @@ def seed_products():
         {"name": "USB Cable", "price": Decimal("12.99"), "stock": 100},
     ]
     
-    created_products = []
-    for product_data in products_data:
-        product, created = Product.objects.get_or_create(
-            name=product_data["name"],
-            defaults=product_data
-        )
-        if created:
-            print(f"Created product: {product.name} - ${product.price}")
-        else:
-            print(f"Product already exists: {product.name}")
-        created_products.append(product)
-    
-    return created_products
+    existing = {
+        product.name: product
+        for product in Product.objects.filter(name__in=[p["name"] for p in products_data])
+    }
+    for product in existing.values():
+        print(f"Product already exists: {product.name}")
+    missing = [Product(**p) for p in products_data if p["name"] not in existing]
+    for product in Product.objects.bulk_create(missing):
+        print(f"Created product: {product.name} - ${product.price}")
+        existing[product.name] = product
+    
+    return [existing[p["name"]] for p in products_data]
 
 def seed_orders(customers, products):
     """Create sample orders"""
@@ -77,30 +74,32 @@ def seed_orders(customers, products):
         {"customer_index": 4, "product_indices": [0, 3, 4]}, # Eve: Laptop, Monitor, Headphones
     ]
     
+    # Product sets of the customers' existing orders, read in one query
+    existing_orders = defaultdict(set)
+    for order_id, customer_id, product_id in OrderItem.objects.filter(
+        order__customer__in=customers
+    ).values_list('order_id', 'order__customer_id', 'product_id'):
+        existing_orders[order_id, customer_id].add(product_id)
+    existing = {
+        (customer_id, frozenset(product_ids))
+        for (_, customer_id), product_ids in existing_orders.items()
+    }
+    
     created_orders = []
     for order_data in orders_data:
         customer = customers[order_data["customer_index"]]
         order_products = [products[i] for i in order_data["product_indices"]]
         
-        # Check if order already exists for this customer with these products
-        existing_order = None
-        for existing in customer.orders.all():
-            if set(existing.products.all()) == set(order_products):
-                existing_order = existing
-                break
-        
-        if not existing_order:
-            order = Order.objects.create(customer=customer)
-            order.products.set(order_products)
-            order.calculate_total()
-            order.save()
-            
-            product_names = ", ".join([p.name for p in order_products])
-            print(f"Created order for {customer.name}: {product_names} (Total: ${order.total_amount})")
-            created_orders.append(order)
-        else:
+        if (customer.pk, frozenset(p.pk for p in order_products)) in existing:
             print(f"Order already exists for {customer.name}")
-            created_orders.append(existing_order)
+            continue
+        
+        order = Order.objects.create(customer=customer)
+        add_order_lines(order, [(product, 1) for product in order_products])
+        
+        product_names = ", ".join([p.name for p in order_products])
+        print(f"Created order for {customer.name}: {product_names} (Total: ${order.total_amount})")
+        created_orders.append(order)
     
     return created_orders
 
@@ -144,7 +143,7 @@ def main():
     
     # Get all customers
     {
-      allCustomers {
+      allCustomers(first: 20) {
         edges {
           node {
             id